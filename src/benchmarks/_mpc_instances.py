@@ -0,0 +1,83 @@
+import os
+import pickle
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import pytz
+import models
+from mpc.params import PhysicalHouseParameters, MPCConfiguration, DynamicConfiguration, DynamicModel
+from local_fleet import PARAMETER_COLUMNS, DYNAMIC_MODEL_COEF, DYNAMIC_MODEL_INTERCEPT, HEATCURVE_OUT_TEMP, HEATCURVE_INFLOW_TEMP, PEAK_HOURS
+
+'''
+Synthetic inputs of the MPC models (mpc/greybox_plan.py, mpc/greybox_execution.py), used by the benchmarks.
+
+mpcInstance() returns the model arguments and the solve() arguments of one subcentral, shaped like the
+output of forecasters/_forecast_flexibility.py: a forecast frame over the horizon, the initial row and the
+differences of the max_lag + horizon steps before and over the horizon. Peak hours are PEAK_HOURS of the
+local fleet, the planning starts at midnight UTC.
+'''
+
+def mpcConfiguration(horizon, timestep, **values):
+
+    parameters = {column: None for column in PARAMETER_COLUMNS}
+    parameters.update(mpc_optimization_horizon = horizon, mpc_timestep = timestep, **values)
+
+    return parameters
+
+def mpcInstance(horizon, timestep = 3600, seed = 0, dispatch = 0.0, **values):
+
+    rng = np.random.default_rng(seed)
+    parameters = mpcConfiguration(horizon, timestep, **values)
+    physical, config, dynamic = PhysicalHouseParameters(parameters), MPCConfiguration(parameters), DynamicConfiguration(parameters)
+    model = DynamicModel({"intercept": DYNAMIC_MODEL_INTERCEPT, "variable_coef": list(DYNAMIC_MODEL_COEF)})
+    max_lag = max(max(dynamic.in_temp_diff_lag), max(dynamic.out_temp_diff_lag), max(dynamic.solar_diff_lag))
+
+    start = datetime(2021, 1, 4, tzinfo = pytz.utc) + timedelta(days = int(rng.integers(0, 60)))
+    index = pd.date_range(start, periods = horizon, freq = f"{timestep}s")
+    hours = index.hour + index.minute / 60
+    peak_hour = np.zeros(horizon)
+
+    for peak_start, peak_end in PEAK_HOURS:
+        peak_hour[(hours >= peak_start) & (hours < peak_end)] = 1
+
+    size = rng.uniform(300, 600) # heating power [kW] at -20 degrees
+    heatcurve = models.HeatCurve(break_point = len(HEATCURVE_OUT_TEMP), out_temp = HEATCURVE_OUT_TEMP, inflow_temp = HEATCURVE_INFLOW_TEMP,
+                                 power = [size * (20 - temperature) / 40 for temperature in HEATCURVE_OUT_TEMP])
+
+    out_temp = 2 - 4 * np.cos(2 * np.pi * (hours - 3) / 24) + rng.normal(0, 0.5, horizon)
+    baseline_power = np.interp(out_temp, HEATCURVE_OUT_TEMP, heatcurve.power)
+
+    forecast_data = pd.DataFrame({"forecast_outside_temp": out_temp,
+                                  "out_temp": out_temp,
+                                  "predict_solar": np.clip(np.sin(np.pi * (hours - 8) / 8), 0, None) * rng.uniform(0, 0.5),
+                                  "baseline_power": baseline_power,
+                                  "peak_hour": peak_hour,
+                                  "subcentral_dispatch": np.where(peak_hour == 1, -dispatch * baseline_power, np.nan)}, index = index)
+
+    initial_data = pd.Series({"average_indoor_temperature": 21 + rng.normal(0, 0.3), "heat_power": baseline_power[0], "inflow_temp": 45.0})
+
+    diff_data = pd.DataFrame({"solar_diff": rng.normal(0, 0.02, max_lag + horizon),
+                              "out_temp_diff": rng.normal(0, 0.3, max_lag + horizon),
+                              "in_temp_diff": rng.normal(0, 0.05, max_lag + horizon)})
+
+    return (physical, config, dynamic, model), (forecast_data, initial_data, diff_data, heatcurve)
+
+# Recorded instances: one pickle of (model arguments, solve() arguments) per file, e.g. inputs captured from a run
+def saveInstances(directory, instances):
+
+    os.makedirs(directory, exist_ok = True)
+
+    for i, instance in enumerate(instances):
+        with open(os.path.join(directory, f"instance_{i:04d}.pkl"), "wb") as file:
+            pickle.dump(instance, file)
+
+def loadInstances(directory):
+
+    instances = []
+
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".pkl"):
+            with open(os.path.join(directory, name), "rb") as file:
+                instances.append(pickle.load(file))
+
+    return instances
@@ -0,0 +1,153 @@
+import re
+import time
+
+'''
+Local stand-in for a cassandra.cluster.Session, used by the benchmarks.
+
+The stand-in tokenizes every CQL string it has to parse, which is the client-visible part of what the
+coordinator does for an unprepared statement, and can optionally spin for parse_cost seconds per parse
+to model the server-side cost. Prepared statements are parsed once and only bound afterwards.
+Every execution can also spin for latency seconds to model the round trip.
+'''
+
+_TOKENS = re.compile(r"'[^']*'|:\w+|\w+|[^\s\w]")
+_MARKERS = re.compile(r":(\w+)")
+
+def _spin(seconds):
+
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+class StandInPrepared:
+
+    def __init__(self, query, markers):
+
+        self.query_string = query
+        self.markers = markers
+
+    def bind(self, parameters):
+
+        return StandInBound(self, [parameters[name] for name in self.markers])
+
+class StandInBound:
+
+    def __init__(self, prepared, values):
+
+        self.prepared = prepared
+        self.values = values
+        self.fetch_size = None
+
+# Paged result set, rows are split in pages of fetch_size and passed through the profile's row factory page by page
+class StandInResult:
+
+    def __init__(self, pages, colnames = (), row_factory = None):
+
+        self._pages = pages
+        self._page = 0
+        self._colnames = colnames
+        self._row_factory = row_factory
+
+    @property
+    def _current_rows(self):
+
+        if self._row_factory is None:
+            return self._pages[self._page]
+
+        return self._row_factory(self._colnames, self._pages[self._page])
+
+    @property
+    def has_more_pages(self):
+        return self._page + 1 < len(self._pages)
+
+    def fetch_next_page(self):
+
+        self._page += 1
+
+    def __len__(self):
+
+        return len(self._current_rows)
+
+    def __iter__(self):
+
+        while True:
+            yield from self._current_rows
+
+            if not self.has_more_pages:
+                break
+
+            self.fetch_next_page()
+
+class StandInSession:
+
+    def __init__(self, parse_cost = 0.0, rows = (), colnames = (), fetch_size = 5000, row_factories = None, latency = 0.0):
+
+        self.parse_cost = parse_cost
+        self.latency = latency
+        self.rows = list(rows)
+        self.colnames = list(colnames)
+        self.fetch_size = fetch_size
+        self.row_factories = row_factories or {}
+        self.parsed = 0
+        self.executed = 0
+
+    def _parse(self, query):
+
+        self.parsed += 1
+        tokens = _TOKENS.findall(query)
+        _spin(self.parse_cost)
+
+        return tokens
+
+    def prepare(self, query):
+
+        self._parse(query)
+
+        return StandInPrepared(query, _MARKERS.findall(query))
+
+    def execute(self, query, parameters = None, timeout = None, execution_profile = None, paging_state = None):
+
+        fetch_size = self.fetch_size
+
+        if isinstance(query, StandInBound):
+            fetch_size = query.fetch_size or fetch_size
+        elif isinstance(query, StandInPrepared):
+            query.bind(parameters)
+        else:
+            self._parse(query)
+
+        self.executed += 1
+        _spin(self.latency)
+
+        pages = [self.rows[i:i + fetch_size] for i in range(0, len(self.rows), fetch_size)] or [[]]
+
+        return StandInResult(pages, self.colnames, self.row_factories.get(execution_profile))
+
+    def execute_async(self, query, parameters = None, timeout = None, execution_profile = None, paging_state = None):
+
+        return StandInFuture(self.execute(query, parameters, execution_profile = execution_profile, paging_state = paging_state))
+
+# Already completed future, enough for cassandra.concurrent and the repositories
+class StandInFuture:
+
+    has_more_pages = False
+    _col_names = None
+    _col_types = None
+    _paging_state = None
+    _continuous_paging_session = None
+
+    def __init__(self, result):
+
+        self._result = result
+
+    def result(self):
+
+        return self._result
+
+    def add_callbacks(self, callback, errback, callback_args = (), errback_args = (), **kwargs):
+
+        callback(self._result, *callback_args)
+
+    def clear_callbacks(self):
+
+        pass
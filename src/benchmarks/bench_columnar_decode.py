@@ -0,0 +1,119 @@
+import argparse
+import time
+import json
+import logging
+from collections import namedtuple
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import pytz
+import models
+from db._cassandra import CassandraHouseRepository
+from db._columnar import COLUMNAR_PROFILE, columnar_factory
+from benchmarks._standin import StandInSession
+
+'''
+Micro-benchmark: decoding flexheat.timeseries rows for get_data_for_subcentral.
+
+    json      : SELECT JSON * and json.loads per row into Python lists (the previous path)
+    columnar  : native typed columns decoded page-wise into NumPy arrays (COLUMNAR_PROFILE)
+
+Only the client side is measured, the server-side JSON serialization saved by the columnar path comes on top.
+
+    python -m benchmarks.bench_columnar_decode --rows 14400
+'''
+
+JsonRow = namedtuple('JsonRow', ['json'])
+
+def synthetic_rows(count, now):
+
+    rng = np.random.default_rng(0)
+    start = now.replace(tzinfo = None) - timedelta(minutes = count)
+    inflow = 45 + rng.normal(0, 2, count)
+    outside = 3 + rng.normal(0, 1, count)
+    outflow = 30 + rng.normal(0, 2, count)
+
+    json_rows = []
+    typed_rows = []
+
+    for i in range(count):
+        tstamp = start + timedelta(minutes = i)
+        heating = {"heating_inflow_temperature": float(inflow[i]),
+                   "outside_temperature": float(outside[i]),
+                   "heating_outflow_temperature": float(outflow[i])}
+
+        json_rows.append(JsonRow(json.dumps({"customer_id": 1, "subcentral_id": 1, "asset_id": 6000,
+                                             "tstamp_record": tstamp.strftime('%Y-%m-%d %H:%M:%S.000Z'),
+                                             "heating_system": heating})))
+        typed_rows.append((tstamp, heating["heating_inflow_temperature"], heating["outside_temperature"],
+                           heating["heating_outflow_temperature"]))
+
+    return json_rows, typed_rows
+
+# The decode loop get_data_for_subcentral used before the columnar path
+def decode_json(rows):
+
+    dictionary = {"tstamp":[],"inflow_temp":[], "measured_outside_temp":[], "return_temp":[]}
+
+    for row in rows:
+        subcentral_data = json.loads(row.json)
+        dictionary["tstamp"].append(subcentral_data["tstamp_record"])
+
+        heating = subcentral_data["heating_system"]
+        dictionary["inflow_temp"].append(heating["heating_inflow_temperature"])
+        dictionary["measured_outside_temp"].append(heating["outside_temperature"])
+        dictionary["return_temp"].append(heating["heating_outflow_temperature"])
+
+    data = pd.DataFrame(dictionary)
+    data.set_index("tstamp", inplace = True)
+    data.index = pd.to_datetime(data.index)
+    data.sort_index(ascending = True, inplace = True)
+
+    return data
+
+def best_of(repeat, run):
+
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, data
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type = int, default = 14400, help = 'rows in the window, 240 h of minute data by default')
+    parser.add_argument('--fetch-size', type = int, default = 5000)
+    parser.add_argument('--repeat', type = int, default = 5)
+    args = parser.parse_args()
+
+    logging.getLogger("__main__").setLevel(logging.ERROR)
+
+    now = datetime(2020, 10, 1, tzinfo = pytz.utc)
+    house = models.House(location = 'Linkoping', customer_id = 1, subcentral_id = 1,
+                         longitude = 15.6, latitude = 58.4, grid_zone = 1)
+    json_rows, typed_rows = synthetic_rows(args.rows, now)
+
+    json_session = StandInSession(rows = json_rows, fetch_size = args.fetch_size)
+    columnar_session = StandInSession(rows = typed_rows, fetch_size = args.fetch_size,
+                                      colnames = list(CassandraHouseRepository._SUBCENTRAL_COLUMNS),
+                                      row_factories = {COLUMNAR_PROFILE: columnar_factory})
+    repository = CassandraHouseRepository(columnar_session)
+
+    json_time, json_data = best_of(args.repeat, lambda: decode_json(json_session.execute(CassandraHouseRepository._SUBCENTRAL_QUERY_TEMPLATE)))
+    columnar_time, columnar_data = best_of(args.repeat, lambda: repository.get_data_for_subcentral(house, (timedelta(hours = 240), timedelta(0)), now))
+
+    assert np.allclose(json_data.to_numpy(), columnar_data.to_numpy())
+    assert (json_data.index == columnar_data.index).all()
+
+    for name, elapsed in (('json', json_time), ('columnar', columnar_time)):
+        print(f"{name:>10}: {args.rows} rows, {elapsed * 1e3:.1f} ms ({elapsed / args.rows * 1e6:.2f} us/row)")
+
+    print(f"{'speedup':>10}: {json_time / columnar_time:.1f}x")
+
+if __name__ == '__main__':
+    main()
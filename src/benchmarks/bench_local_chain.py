@@ -0,0 +1,82 @@
+import argparse
+import os
+import tempfile
+import time
+from datetime import timedelta
+import logging
+from db._local import LocalSession, LocalElasticsearch, LOCAL_PREFIX
+import local_fleet
+
+'''
+Benchmark: the full plan -> dispatch -> execution -> report chain of the lambdas on a synthetic fleet,
+served by the local backend (db/_local.py) instead of Cassandra and Elasticsearch.
+
+    python -m benchmarks.bench_local_chain --customers 10 --subcentrals 10 --grids 2
+
+Prints the wall time and the number of statements of every step. --db keeps the SQLite file for inspection.
+--workers runs the subcentrals of plan and execution in worker processes (HOUSE_WORKERS of deploy_utils.py),
+the statements of the workers are not counted then.
+'''
+
+def step(name, connection, run):
+
+    executed = connection.session.executed
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:>10}: {elapsed:8.2f} s, {connection.session.executed - executed:6d} statements")
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default = None, help = 'SQLite file, a temporary file by default')
+    parser.add_argument('--utilities', type = int, default = 1)
+    parser.add_argument('--customers', type = int, default = 2)
+    parser.add_argument('--subcentrals', type = int, default = 10)
+    parser.add_argument('--grids', type = int, default = 2)
+    parser.add_argument('--cities', type = int, default = 3)
+    parser.add_argument('--days', type = int, default = 2)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--workers', type = int, default = 1)
+    args = parser.parse_args()
+
+    logging.getLogger("__main__").setLevel(logging.ERROR)
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "fleet.sqlite")
+    planning_start = local_fleet.nextPlanningStart()
+
+    session = LocalSession(path)
+    es = LocalElasticsearch(LOCAL_PREFIX + path)
+    start = time.perf_counter()
+    fleet = local_fleet.generateFleet(session, es, args.utilities, args.customers, args.subcentrals, args.grids, args.cities,
+                                      planning_start, args.days, 15, args.seed)
+    print(f"{'fleet':>10}: {time.perf_counter() - start:8.2f} s, {len(fleet)} subcentrals in {path}")
+    es.close()
+    session.shutdown()
+
+    # The lambdas read DB_URL/ES_URL from the environment, they have to be set before they connect
+    os.environ["DB_URL"] = LOCAL_PREFIX + path
+    os.environ["ES_URL"] = LOCAL_PREFIX + path
+    os.environ["HOUSE_WORKERS"] = str(args.workers)
+
+    import deploy_utils
+    import lambda_function_plan, lambda_function_dispatch, lambda_function_execution, lambda_function_report
+
+    for module in (deploy_utils, lambda_function_plan, lambda_function_dispatch, lambda_function_execution, lambda_function_report):
+        module.logger.setLevel(logging.ERROR)
+
+    connection = deploy_utils.connectDB(os.environ["DB_URL"])
+
+    step('plan', connection, lambda_function_plan.lambda_handler)
+    step('accept', connection, lambda: local_fleet.acceptPlans(connection.session, planning_start, args.days))
+    step('dispatch', connection, lambda: lambda_function_dispatch.lambda_handler(planning_start))
+    step('execution', connection, lambda: lambda_function_execution.lambda_handler(planning_start))
+    step('measure', connection, lambda: local_fleet.measurePeriod(connection.session, fleet, planning_start,
+                                                                  planning_start + timedelta(days = 1), 15, args.seed))
+    step('report', connection, lambda: lambda_function_report.lambda_handler(planning_start))
+
+    deploy_utils.closeConnections()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import time
+import logging
+from mpc.greybox_plan import PnPkModel_Plan
+from mpc.greybox_execution import PnPkModel_Execution
+from benchmarks._mpc_instances import mpcInstance
+
+'''
+Benchmark: construction and solve time of the MPC problems against the horizon length.
+
+    python -m benchmarks.bench_mpc_build --horizons 24,48,96,168,336 --timestep 1800
+
+Per model and horizon:
+    build       : to_problem(), the CVXPY expressions and constraints
+    cold solve  : first solve() of a structure, build + canonicalization + solver
+    warm solve  : solve() of another instance of the same structure, the compiled problem is reused
+    constraints : number of constraint objects of the problem
+'''
+
+def timed(run):
+
+    start = time.perf_counter()
+    run()
+
+    return time.perf_counter() - start
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--horizons', default = '24,48,96,168,336')
+    parser.add_argument('--timestep', type = int, default = 1800)
+    parser.add_argument('--repeat', type = int, default = 3)
+    args = parser.parse_args()
+
+    logging.getLogger("__main__").setLevel(logging.ERROR)
+
+    for model_class in (PnPkModel_Plan, PnPkModel_Execution):
+        for horizon in [int(horizon) for horizon in args.horizons.split(',')]:
+            model_class.PROBLEMS.clear()
+            model_args, solve_args = mpcInstance(horizon, args.timestep, seed = 0, dispatch = 0.1)
+            model = model_class(*model_args)
+
+            cold = timed(lambda: model.solve(*solve_args))
+            build = min(timed(model.to_problem) for _ in range(args.repeat))
+            warm = []
+
+            for seed in range(1, args.repeat + 1):
+                model_args, solve_args = mpcInstance(horizon, args.timestep, seed = seed, dispatch = 0.1)
+                warm_model = model_class(*model_args)
+                warm.append(timed(lambda: warm_model.solve(*solve_args)))
+
+            problem = model.to_problem()
+
+            print(f"{model_class.__name__:>20} horizon {horizon:4d}: build {build * 1e3:8.1f} ms, cold solve {cold * 1e3:8.1f} ms, "
+                  f"warm solve {min(warm) * 1e3:8.1f} ms, {len(problem.constraints):5d} constraints, "
+                  f"{problem.size_metrics.num_scalar_variables:6d} variables")
+
+if __name__ == '__main__':
+    main()
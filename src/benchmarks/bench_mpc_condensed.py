@@ -0,0 +1,77 @@
+import argparse
+import time
+import logging
+import numpy as np
+from mpc.greybox_plan import PnPkModel_Plan
+from mpc.greybox_execution import PnPkModel_Execution
+from benchmarks._mpc_instances import mpcInstance
+
+'''
+Benchmark: the full formulation of the MPC problems against the condensed one (mpc/condensed.py).
+
+    python -m benchmarks.bench_mpc_condensed --horizons 24,48,96 --instances 5
+
+Per model and horizon, on the same synthetic instances (benchmarks/_mpc_instances.py):
+    variables, constraints : scalar variables and constraints of the problem
+    build                  : time to build the problem, the compiled problems are dropped before each instance
+    solve                  : median time of solve() with the problem built, as in a repeated run in the same process
+    difference             : max relative objective difference and max power difference [kW] to the full formulation
+The default solver is CVXOPT (interior point), its solve time grows steeply with the horizon: horizon 336 takes
+minutes per instance.
+'''
+
+def run(model_class, instance, formulation):
+
+    model_args, solve_args = instance
+    model_args[1].formulation = formulation
+    model_class.PROBLEMS.clear()
+
+    model = model_class(*model_args)
+    start = time.perf_counter()
+    model.solve(*solve_args)
+    build = time.perf_counter() - start
+
+    model = model_class(*model_args)
+    start = time.perf_counter()
+    model.solve(*solve_args)
+    solve = time.perf_counter() - start
+
+    return model, build, solve
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--horizons', default = '24,48,96')
+    parser.add_argument('--instances', type = int, default = 5)
+    parser.add_argument('--timestep', type = int, default = 1800)
+    args = parser.parse_args()
+
+    logging.getLogger("__main__").setLevel(logging.ERROR)
+
+    for model_class in (PnPkModel_Plan, PnPkModel_Execution):
+        for horizon in map(int, args.horizons.split(',')):
+            results = {"full": [], "condensed": []}
+            objective_difference, power_difference = 0.0, 0.0
+
+            for seed in range(args.instances):
+                instance = mpcInstance(horizon, args.timestep, seed = seed, dispatch = 0.1)
+                models = {}
+
+                for formulation in results:
+                    model, build, solve = run(model_class, instance, formulation)
+                    metrics = model._problem.size_metrics
+                    results[formulation].append((metrics.num_scalar_variables, metrics.num_scalar_eq_constr + metrics.num_scalar_leq_constr, build, solve))
+                    models[formulation] = model
+
+                full, condensed = models["full"], models["condensed"]
+                objective_difference = max(objective_difference, abs(full._problem.value - condensed._problem.value) / max(abs(full._problem.value), 1))
+                power_difference = max(power_difference, np.max(np.abs(full.variables.power.value - condensed.variables.power.value)))
+
+            print(f"{model_class.__name__:>20} h={horizon:>4}: " + ", ".join(
+                f"{formulation} {results[formulation][0][0]:5d} variables {results[formulation][0][1]:5d} constraints "
+                f"build {np.median([build for _, _, build, _ in results[formulation]]) * 1e3:7.1f} ms "
+                f"solve {np.median([solve for _, _, _, solve in results[formulation]]) * 1e3:7.1f} ms" for formulation in results) +
+                f", difference {objective_difference:.1e} / {power_difference:.1e} kW")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import time
+import logging
+import numpy as np
+from mpc.greybox_plan import PnPkModel_Plan
+from mpc.greybox_execution import PnPkModel_Execution
+from benchmarks._mpc_instances import mpcInstance
+
+'''
+Benchmark: solves with a time budget too small for the solver, which end with the fallback schedule (mpc/fallback.py,
+the default, customers opt out with mpc_fallback = false).
+
+    python -m benchmarks.bench_mpc_fallback --solvers CVXOPT,HIGHS --budget 0.001 --instances 10
+
+The instances (benchmarks/_mpc_instances.py) use the condensed formulation, so that every constraint can be
+evaluated at the fallback schedule. Per model and solver:
+    solve     : median and max time of solve() with the budget, the compiled problem is reused after the first instance
+    fallbacks : instances that ended with the fallback schedule
+    violation : max violation of the constraints of the problem by the fallback schedules [kW, degrees]
+    objective : median objective of the fallback schedules relative to the optimum, solved without budget
+'''
+
+def run(model_class, instance, solver, budget):
+
+    model_args, solve_args = instance
+    model_args[1].solver = solver
+    model_args[1].solver_time_limit = budget
+    model_args[1].fallback = True
+    model = model_class(*model_args)
+
+    start = time.perf_counter()
+    model.solve(*solve_args)
+
+    return model, time.perf_counter() - start
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--solvers', default = 'CVXOPT,HIGHS')
+    parser.add_argument('--budget', type = float, default = 0.001, help = 'solver time limit [s]')
+    parser.add_argument('--instances', type = int, default = 10)
+    parser.add_argument('--horizon', type = int, default = 48)
+    parser.add_argument('--timestep', type = int, default = 1800)
+    args = parser.parse_args()
+
+    logging.getLogger("__main__").setLevel(logging.ERROR)
+
+    for model_class in (PnPkModel_Plan, PnPkModel_Execution):
+        for solver in args.solvers.split(','):
+            times, fallbacks, violation, objectives = [], 0, 0.0, []
+
+            for seed in range(args.instances):
+                instance = mpcInstance(args.horizon, args.timestep, seed = seed, dispatch = 0.1, mpc_formulation = "condensed")
+
+                model, elapsed = run(model_class, instance, solver, args.budget)
+                times.append(elapsed)
+
+                if not model.fallback:
+                    continue
+
+                fallbacks += 1
+                problem = model._problem
+                violation = max([violation] + [np.max(constraint.violation()) for constraint in problem.constraints])
+                fallback_objective = problem.objective.value
+
+                optimal, _ = run(model_class, instance, solver, None)
+                objectives.append(fallback_objective / optimal._problem.value if not optimal.fallback else np.nan)
+
+            print(f"{model_class.__name__:>20} {solver:>8}: solve {np.median(times) * 1e3:7.1f} ms (max {max(times) * 1e3:7.1f} ms), "
+                  f"{fallbacks} of {len(times)} fallbacks, violation {violation:.1e}, "
+                  f"objective {np.nanmedian(objectives) if objectives else np.nan:.2f} x optimum")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import time
+import logging
+import numpy as np
+from mpc.greybox_plan import PnPkModel_Plan
+from mpc.solver import SolverStrategy
+from mpc import fleet
+from benchmarks._mpc_instances import mpcInstance
+
+'''
+Benchmark: plans of a grid zone solved house by house against the fleet solve (mpc/fleet.py).
+
+    python -m benchmarks.bench_mpc_fleet --houses 10,50,100 --horizon 24 --solvers HIGHS,CLARABEL
+
+All houses share the structure of the synthetic instances (benchmarks/_mpc_instances.py), so the fleet solve
+stacks them into one block problem (of at most MAX_BLOCK_HOUSES houses). Solvers outside BLOCK_SOLVERS, e.g. CVXOPT,
+are solved house by house in both. Per number of houses and solver:
+    first   : time to plan all houses with the compiled problems dropped before, as in a cold lambda
+    repeat  : time to plan them again with the compiled problems kept, as in a warm lambda
+    power   : max difference of the planned power [kW] between both
+'''
+
+def plan(instances, solver, fleet_solve):
+
+    models = []
+
+    for model_args, _ in instances:
+        model = PnPkModel_Plan(*model_args)
+        model.solver = SolverStrategy(solver)
+        models.append(model)
+
+    start = time.perf_counter()
+
+    if fleet_solve:
+        outputs = fleet.solve_fleet(models, [solve_args for _, solve_args in instances])
+    else:
+        outputs = [model.solve(*solve_args) for model, (_, solve_args) in zip(models, instances)]
+
+    return time.perf_counter() - start, np.concatenate([output.power.values for output in outputs])
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--houses', default = '10,50,100')
+    parser.add_argument('--horizon', type = int, default = 24)
+    parser.add_argument('--timestep', type = int, default = 3600)
+    parser.add_argument('--solvers', default = 'HIGHS,CLARABEL')
+    args = parser.parse_args()
+
+    logging.getLogger("__main__").setLevel(logging.ERROR)
+
+    for houses in map(int, args.houses.split(',')):
+        instances = [mpcInstance(args.horizon, args.timestep, seed = seed, dispatch = 0.1) for seed in range(houses)]
+
+        for solver in args.solvers.split(','):
+            results, powers = {}, {}
+
+            for kind, fleet_solve in (("house by house", False), ("fleet", True)):
+                PnPkModel_Plan.PROBLEMS.clear()
+                fleet.PROBLEMS.clear()
+                first, _ = plan(instances, solver, fleet_solve)
+                repeat, powers[kind] = plan(instances, solver, fleet_solve)
+                results[kind] = (first, repeat)
+
+            print(f"{houses:>4} houses {solver:>8}: " + ", ".join(
+                f"{kind} first {first * 1e3:8.1f} ms repeat {repeat * 1e3:8.1f} ms" for kind, (first, repeat) in results.items()) +
+                f", power difference {np.max(np.abs(powers['fleet'] - powers['house by house'])):.1e} kW")
+
+if __name__ == '__main__':
+    main()
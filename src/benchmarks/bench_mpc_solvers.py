@@ -0,0 +1,95 @@
+import argparse
+import time
+import logging
+import numpy as np
+from mpc.greybox_plan import PnPkModel_Plan
+from mpc.greybox_execution import PnPkModel_Execution
+from mpc.solver import SolverStrategy, SOLVER_OPTIONS, installed_solvers
+from benchmarks._mpc_instances import mpcInstance, saveInstances, loadInstances
+
+'''
+Benchmark: the solvers of mpc/solver.py on the same MPC problem instances.
+
+    python -m benchmarks.bench_mpc_solvers --instances 20 --horizon 48 --record /tmp/mpc_instances
+    python -m benchmarks.bench_mpc_solvers --load /tmp/mpc_instances --solvers CVXOPT,CLARABEL,OSQP,HIGHS
+
+Instances are synthetic (benchmarks/_mpc_instances.py), or loaded from a directory of recorded instances.
+Per model and solver, over all instances:
+    solve       : median and max time of solve(), the compiled problem is reused after the first instance
+    solver time : median time reported by the solver itself
+    iterations  : median iterations
+    failed      : instances without an optimal solution
+    objective   : max relative difference of the objective to the first solver
+'''
+
+def run(model_class, instances, strategy):
+
+    model_class.PROBLEMS.clear()
+    times, solver_times, iterations, objectives, failed = [], [], [], [], 0
+
+    for model_args, solve_args in instances:
+        model = model_class(*model_args)
+        model.solver = strategy
+        start = time.perf_counter()
+
+        try:
+            model.solve(*solve_args)
+
+        except ValueError:
+            failed += 1
+            objectives.append(np.nan)
+            continue
+
+        times.append(time.perf_counter() - start)
+        stats = model._problem.solver_stats
+        solver_times.append(stats.solve_time if stats.solve_time is not None else np.nan)
+        iterations.append(stats.num_iters if stats.num_iters is not None else np.nan)
+        objectives.append(model._problem.value)
+
+    return times, solver_times, iterations, np.array(objectives), failed
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--solvers', default = ','.join(solver for solver in SOLVER_OPTIONS if solver in installed_solvers()))
+    parser.add_argument('--instances', type = int, default = 10)
+    parser.add_argument('--horizon', type = int, default = 48)
+    parser.add_argument('--timestep', type = int, default = 1800)
+    parser.add_argument('--record', help = 'directory to save the synthetic instances to')
+    parser.add_argument('--load', help = 'directory of recorded instances, instead of synthetic ones')
+    parser.add_argument('--warm-start', action = 'store_true')
+    parser.add_argument('--tolerance', type = float)
+    parser.add_argument('--max-iter', type = int)
+    parser.add_argument('--time-limit', type = float)
+    args = parser.parse_args()
+
+    logging.getLogger("__main__").setLevel(logging.ERROR)
+
+    if args.load:
+        instances = loadInstances(args.load)
+    else:
+        instances = [mpcInstance(args.horizon, args.timestep, seed = seed, dispatch = 0.1) for seed in range(args.instances)]
+
+        if args.record:
+            saveInstances(args.record, instances)
+
+    print(f"{len(instances)} instances")
+
+    for model_class in (PnPkModel_Plan, PnPkModel_Execution):
+        reference = None
+
+        for solver in args.solvers.split(','):
+            strategy = SolverStrategy(solver, args.warm_start, args.tolerance, args.max_iter, args.time_limit)
+            times, solver_times, iterations, objectives, failed = run(model_class, instances, strategy)
+
+            if reference is None:
+                reference = objectives
+
+            difference = np.nanmax(np.abs(objectives - reference) / np.maximum(np.abs(reference), 1)) if len(times) else np.nan
+
+            print(f"{model_class.__name__:>20} {strategy.solver:>9}: solve {np.median(times) * 1e3 if times else np.nan:8.1f} ms "
+                  f"(max {max(times, default = np.nan) * 1e3:8.1f} ms), solver time {np.nanmedian(solver_times) * 1e3 if times else np.nan:8.1f} ms, "
+                  f"{np.nanmedian(iterations) if times else np.nan:6.0f} iterations, {failed} failed, objective difference {difference:.1e}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import logging
+import numpy as np
+from mpc.greybox_plan import PnPkModel_Plan
+from mpc.greybox_execution import PnPkModel_Execution
+from mpc.solver import SolverStrategy
+from mpc.warm_start import WarmStart, SEEDED_SOLVERS
+from benchmarks._mpc_instances import mpcInstance
+
+'''
+Benchmark: receding-horizon runs warm started from the previous run against cold runs.
+
+    python -m benchmarks.bench_mpc_warm_start --solvers HIGHS,OSQP --horizon 48 --shift 2 --instances 5
+
+Every instance covers horizon + shift steps: the first run solves steps [0, horizon), the second one steps
+[shift, horizon + shift) from the state of the first run at step shift. The second run is solved cold, on a newly
+compiled problem, and warm. Solvers of SEEDED_SOLVERS (mpc/warm_start.py) are warm started from the first solution,
+passed through its JSON form like between two lambda runs. The others keep the compiled problem of the first run,
+so that warm_start=True starts them from that solve, as in a warm lambda process.
+Per model and solver: median iterations and solver time of the second run, and the largest objective difference.
+'''
+
+def window(instance, start, horizon, max_lag):
+
+    model_args, (forecast_data, initial_data, diff_data, heatcurve) = instance
+
+    return model_args, (forecast_data.iloc[start:start + horizon], initial_data,
+                        diff_data.iloc[start:start + max_lag + horizon], heatcurve)
+
+def run(model_class, instance, solver, warm_start = None):
+
+    model_args, solve_args = instance
+    model = model_class(*model_args)
+    model.solver = SolverStrategy(solver, warm_start = True)
+    model.warm_start = warm_start
+    model.solve(*solve_args)
+
+    return model
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--solvers', default = 'HIGHS,OSQP')
+    parser.add_argument('--instances', type = int, default = 5)
+    parser.add_argument('--horizon', type = int, default = 48)
+    parser.add_argument('--timestep', type = int, default = 1800)
+    parser.add_argument('--shift', type = int, default = 2)
+    args = parser.parse_args()
+
+    logging.getLogger("__main__").setLevel(logging.ERROR)
+
+    for model_class in (PnPkModel_Plan, PnPkModel_Execution):
+        for solver in args.solvers.split(','):
+            results = {"cold": [], "warm": []}
+            difference = 0.0
+
+            for seed in range(args.instances):
+                instance = mpcInstance(args.horizon + args.shift, args.timestep, seed = seed, dispatch = 0.1)
+                instance[0][1].optimization_horizon = args.horizon
+                max_lag = max(max(lags) for lags in (instance[0][2].in_temp_diff_lag, instance[0][2].out_temp_diff_lag, instance[0][2].solar_diff_lag))
+
+                model_class.PROBLEMS.clear()
+                first = run(model_class, window(instance, 0, args.horizon, max_lag), solver)
+                warm_start = WarmStart.from_json(first.warm_start.to_json()) if solver in SEEDED_SOLVERS else None
+
+                # The next run starts from the state of the first one at step shift
+                second = window(instance, args.shift, args.horizon, max_lag)
+                second[1][1]["average_indoor_temperature"] = first.variables.temperature.value[args.shift]
+                second[1][1]["heat_power"] = first.variables.power.value[args.shift - 1]
+                objectives = []
+
+                # The warm run first, it keeps the compiled problem of the first run unless it is seeded
+                for kind in ("warm", "cold"):
+                    if kind == "cold" or warm_start is not None:
+                        model_class.PROBLEMS.clear()
+
+                    model = run(model_class, second, solver, warm_start if kind == "warm" else None)
+                    stats = model._problem.solver_stats
+                    results[kind].append((stats.num_iters, stats.solve_time))
+                    objectives.append(model._problem.value)
+
+                difference = max(difference, abs(objectives[0] - objectives[1]) / max(abs(objectives[1]), 1))
+
+            print(f"{model_class.__name__:>20} {solver:>6}: " + ", ".join(
+                f"{kind} {np.median([iterations for iterations, _ in results[kind]]):6.0f} iterations "
+                f"{np.median([time for _, time in results[kind]]) * 1e3:7.2f} ms" for kind in results) +
+                f", objective difference {difference:.1e}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import time
+import re
+from datetime import datetime, timedelta
+import pytz
+import models
+from db._prepared import PreparedStatementRegistry, bind_timestamp
+from db._cassandra import CassandraHouseRepository
+from db._timecodec import write_time
+from benchmarks._standin import StandInSession
+
+'''
+Micro-benchmark: formatted CQL strings (the previous str.format path) against prepared statements
+executed with bound values, both against the local stand-in session.
+
+    python -m benchmarks.bench_prepared_statements --houses 200 --parse-cost-us 50
+'''
+
+_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:00Z'
+
+# Inline the values into the template the way the str.format templates did
+def format_query(template, parameters):
+
+    def literal(match):
+        value = parameters[match.group(1)]
+        if isinstance(value, datetime):
+            return f"'{value.strftime(_DATETIME_FORMAT)}'"
+        if isinstance(value, str):
+            return f"'{value}'"
+        return str(value)
+
+    return re.sub(r":(\w+)", literal, template)
+
+def workload(houses, horizon):
+
+    now = datetime(2020, 10, 1, tzinfo = pytz.utc)
+
+    for sid in range(houses):
+        house = models.House(location = 'Linkoping', customer_id = 1, subcentral_id = sid,
+                             longitude = 15.6, latitude = 58.4, grid_zone = 1)
+
+        yield CassandraHouseRepository._SUBCENTRAL_QUERY_TEMPLATE, {"customer_id": house.customer_id,
+                                                                     "subcentral_id": house.subcentral_id,
+                                                                     "mintime": bind_timestamp(now - timedelta(hours = 13)),
+                                                                     "maxtime": bind_timestamp(now)}
+
+        for step in range(horizon):
+            ts = now + timedelta(seconds = 1800 * step)
+            plan = models.Plan(customer_id = house.customer_id, subcentral_id = house.subcentral_id, grid_zone = house.grid_zone,
+                               tstamp_record = now.strftime(_DATETIME_FORMAT), ts_start = ts.strftime(_DATETIME_FORMAT),
+                               ts_end = (ts + timedelta(seconds = 1800)).strftime(_DATETIME_FORMAT),
+                               heating_baseline = 250.0, outside_temperature = 4.5, heating_power = 230.0,
+                               power_offset = -20.0, average_indoor_temperature = 21.2)
+
+            yield CassandraHouseRepository._WRITE_PLAN_QUERY_TEMPLATE, {"plan_json": plan.to_json(), "write_time": write_time()}
+
+def run_formatted(session, statements):
+
+    for template, parameters in statements:
+        session.execute(format_query(template, parameters))
+
+def run_prepared(session, statements):
+
+    registry = PreparedStatementRegistry(session)
+
+    for template, parameters in statements:
+        registry.execute(template, parameters)
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--houses', type = int, default = 200)
+    parser.add_argument('--horizon', type = int, default = 48)
+    parser.add_argument('--parse-cost-us', type = float, default = 0.0, help = 'simulated coordinator parse cost per statement')
+    parser.add_argument('--repeat', type = int, default = 3)
+    args = parser.parse_args()
+
+    statements = list(workload(args.houses, args.horizon))
+
+    for name, run in (('formatted', run_formatted), ('prepared', run_prepared)):
+        best = None
+
+        for _ in range(args.repeat):
+            session = StandInSession(parse_cost = args.parse_cost_us * 1e-6)
+            start = time.perf_counter()
+            run(session, statements)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        print(f"{name:>10}: {len(statements)} statements, {session.parsed} parses, {best * 1e3:.1f} ms "
+              f"({best / len(statements) * 1e6:.2f} us/statement)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import pytz
+from db._timecodec import DATETIME_FORMAT, format_timestamp, format_timestamps, record_time, utc_index
+
+'''
+Micro-benchmark: timestamp parsing and formatting of a history, row by row against db/_timecodec.py.
+
+    format, per row : datetime.now() and strftime per row for tstamp_record, ts_start and ts_end (the previous writers)
+    format, codec   : one record_time() per batch, format_timestamps() on the whole index
+    parse, per row  : datetime.strptime per row, then pd.to_datetime on the string index
+    parse, codec    : utc_index() on the whole column with the fixed format
+
+    python -m benchmarks.bench_time_codec --rows 10000
+'''
+
+def format_rows(index, timestep):
+
+    rows = []
+
+    for timestamp in index:
+        rows.append((datetime.now(pytz.timezone('UTC')).strftime(DATETIME_FORMAT),
+                     timestamp.strftime(DATETIME_FORMAT),
+                     (timestamp + timedelta(seconds = timestep)).strftime(DATETIME_FORMAT)))
+
+    return rows
+
+def format_codec(index, timestep):
+
+    tstamp_record = format_timestamp(record_time())
+    ts_starts = format_timestamps(index)
+    ts_ends = format_timestamps(index + timedelta(seconds = timestep))
+
+    return [(tstamp_record, ts_start, ts_end) for ts_start, ts_end in zip(ts_starts, ts_ends)]
+
+def parse_rows(strings):
+
+    parsed = [datetime.strptime(string, '%Y-%m-%dT%H:%M:%SZ') for string in strings]
+
+    return pd.to_datetime(pd.Index([str(timestamp) for timestamp in parsed]), utc = True)
+
+def parse_codec(strings):
+
+    return utc_index(strings)
+
+def best_of(repeat, run):
+
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, data
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type = int, default = 10000)
+    parser.add_argument('--timestep', type = int, default = 1800)
+    parser.add_argument('--repeat', type = int, default = 5)
+    args = parser.parse_args()
+
+    index = pd.date_range(datetime(2020, 10, 1, tzinfo = pytz.utc), periods = args.rows, freq = f"{args.timestep}s")
+
+    format_row_time, row_formatted = best_of(args.repeat, lambda: format_rows(index, args.timestep))
+    format_codec_time, codec_formatted = best_of(args.repeat, lambda: format_codec(index, args.timestep))
+
+    assert [row[1:] for row in row_formatted] == [row[1:] for row in codec_formatted]
+
+    strings = [ts_start for _, ts_start, _ in codec_formatted]
+    parse_row_time, row_parsed = best_of(args.repeat, lambda: parse_rows(strings))
+    parse_codec_time, codec_parsed = best_of(args.repeat, lambda: parse_codec(strings))
+
+    assert (row_parsed == codec_parsed).all() and (codec_parsed == index).all()
+
+    for name, row_time, codec_time in (('format', format_row_time, format_codec_time), ('parse', parse_row_time, parse_codec_time)):
+        print(f"{name:>10}: {args.rows} rows, per row {row_time * 1e3:.1f} ms, codec {codec_time * 1e3:.1f} ms ({row_time / codec_time:.1f}x)")
+
+if __name__ == '__main__':
+    main()
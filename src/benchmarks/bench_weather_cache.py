@@ -0,0 +1,76 @@
+import argparse
+import time
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+import pytz
+import models
+from db._cassandra import CassandraWeatherRepository
+from db._columnar import COLUMNAR_PROFILE, columnar_factory
+from benchmarks._standin import StandInSession
+
+'''
+Benchmark: weather forecast reads for a synthetic fleet with many houses per city,
+with the location-keyed WindowCache against one query per house (cache invalidated before every read).
+
+    python -m benchmarks.bench_weather_cache --cities 10 --houses-per-city 30 --latency-ms 2
+'''
+
+def synthetic_fleet(cities, houses_per_city):
+
+    rng = np.random.default_rng(0)
+    fleet = []
+
+    for city in range(cities):
+        for house in range(houses_per_city):
+            fleet.append(models.House(location = f"city_{city}", customer_id = 1, subcentral_id = city * houses_per_city + house,
+                                      longitude = 15 + rng.random(), latitude = 58 + rng.random(), grid_zone = 1))
+
+    return fleet
+
+def synthetic_forecast(now, hours):
+
+    start = now.replace(tzinfo = None) - timedelta(hours = hours)
+
+    return [(start + timedelta(hours = i), 5.0 + np.sin(i / 4), 0.5) for i in range(2 * hours + 1)]
+
+def run(repository, fleet, time_range, now, cached):
+
+    for house in fleet:
+        if not cached:
+            repository.weather_cache.invalidate()
+
+        repository.get_weather_by_location(house, time_range, now)
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cities', type = int, default = 10)
+    parser.add_argument('--houses-per-city', type = int, default = 30)
+    parser.add_argument('--hours', type = int, default = 48, help = 'forecast hours on each side of now')
+    parser.add_argument('--latency-ms', type = float, default = 2.0, help = 'simulated round trip per query')
+    args = parser.parse_args()
+
+    logging.getLogger("__main__").setLevel(logging.ERROR)
+
+    now = datetime(2020, 10, 1, tzinfo = pytz.utc)
+    time_range = (timedelta(hours = 12), timedelta(hours = 24))
+    fleet = synthetic_fleet(args.cities, args.houses_per_city)
+
+    for name, cached in (('uncached', False), ('cached', True)):
+        session = StandInSession(rows = synthetic_forecast(now, args.hours), latency = args.latency_ms * 1e-3,
+                                 colnames = list(CassandraWeatherRepository._WEATHER_COLUMNS),
+                                 row_factories = {COLUMNAR_PROFILE: columnar_factory})
+        repository = CassandraWeatherRepository(session)
+
+        start = time.perf_counter()
+        run(repository, fleet, time_range, now, cached)
+        elapsed = time.perf_counter() - start
+
+        print(f"{name:>10}: {len(fleet)} houses, {session.executed} queries, {elapsed * 1e3:.1f} ms")
+
+        if cached:
+            print(f"{'cache':>10}: {repository.weather_cache.stats.to_dict()}")
+
+if __name__ == '__main__':
+    main()
@@ -1,2 +1,4 @@
 from ._cassandra import DBConnection, CassandraHouseRepository, CassandraWeatherRepository, CassandraRepository, CassandraAggregateRepository
-from ._models import RESTHouseModelRepository, HouseModelRepository, FlexibilityModelRepository
\ No newline at end of file
+from ._models import RESTHouseModelRepository, HouseModelRepository, FlexibilityModelRepository
+from ._bucketed import BucketedHouseRepository, BucketedWeatherRepository, BucketedRepository, BucketedAggregateRepository
+from ._local import LocalSession, LocalDBConnection, LocalElasticsearch
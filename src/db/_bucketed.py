@@ -0,0 +1,423 @@
+'''
+Repositories on the time-bucketed companion schema (create_flexheatV4_bucketed_tables.cql).
+
+The *_by_day tables are partitioned by (entity, day) and clustered by time, so the range reads of the
+Cassandra*Repository classes become single-partition slices per day instead of ALLOW FILTERING scans.
+The Bucketed* repositories only swap the CQL templates: :days is derived from :mintime and :maxtime when a
+statement is executed, and day is added to every JSON row written.
+
+The lambdas pick the schema with DAY_BUCKETS (see repository_for and deploy_utils.cassandraRepository):
+    off   : legacy tables only
+    write : the legacy and the day-bucketed tables are written, the legacy tables are read
+    read  : both are written, the day-bucketed tables are read
+Tables of EXTERNAL_TABLES are written by other services, their day-bucketed companions are only filled by
+migrate_bucketed_tables.py, so they are always read from the legacy tables.
+'''
+
+from dataclasses import dataclass
+from datetime import timedelta
+import json
+import re
+import pytz
+from db._cassandra import CassandraHouseRepository, CassandraWeatherRepository, CassandraRepository, CassandraAggregateRepository
+from db._metrics import label_templates
+
+DAY_BUCKET_MODES = ("off", "write", "read")
+
+EXTERNAL_TABLES = {"timeseries", "average_measurement", "darksky_forecast", "peak_hours", "aggregate_flexibility_dispatch"}
+
+# UTC dates covered by [mintime, maxtime]
+def days_between(mintime, maxtime):
+
+    if mintime.tzinfo is not None:
+        mintime = mintime.astimezone(pytz.utc)
+        maxtime = maxtime.astimezone(pytz.utc)
+
+    first = mintime.date()
+
+    return [first + timedelta(days = i) for i in range((maxtime.date() - first).days + 1)]
+
+# Day bucket of a JSON row, from its clustering timestamp ('%Y-%m-%dT%H:%M:00Z', always UTC)
+def day_of(row):
+
+    timestamp = row["ts_start"] if "ts_start" in row else row["timestamp"]
+
+    return timestamp[:10]
+
+class DayBucketStatements:
+
+    '''Statement registry wrapper that binds :days for templates selecting from a day-bucketed table'''
+
+    def __init__(self, statements):
+
+        self._statements = statements
+        self.session = statements.session
+
+    def execute(self, template, parameters = None, **kwargs):
+
+        return self._statements.execute(template, self._with_days(template, parameters), **kwargs)
+
+    def execute_async(self, template, parameters = None, **kwargs):
+
+        return self._statements.execute_async(template, self._with_days(template, parameters), **kwargs)
+
+    def _with_days(self, template, parameters):
+
+        if parameters is None or ":days" not in template:
+            return parameters
+
+        return dict(parameters, days = days_between(parameters["mintime"], parameters["maxtime"]))
+
+    def __getattr__(self, name):
+
+        return getattr(self._statements, name)
+
+class DayBucketWriter:
+
+    '''
+    BulkWriter wrapper that adds day to the JSON rows written to day-bucketed tables.
+
+    With dual_write, rows are also written with the legacy template, so the legacy tables stay complete
+    until every reader has moved to the bucketed schema.
+    '''
+
+    def __init__(self, writer, legacy_templates = None):
+
+        self._writer = writer
+        self._legacy_templates = legacy_templates or {}
+
+    def write(self, template, rows):
+
+        legacy = self._legacy_templates.get(template)
+
+        if legacy is not None:
+            self._writer.write(legacy, rows)
+
+        if "_by_day" not in template:
+            return self._writer.write(template, rows)
+
+        bucketed = []
+
+        for key, parameters in rows:
+            parameters = {name: self._add_day(value) if isinstance(value, str) else value for name, value in parameters.items()}
+            bucketed.append((key, parameters))
+
+        return self._writer.write(template, bucketed)
+
+    def skip(self, template, count):
+
+        legacy = self._legacy_templates.get(template)
+
+        if legacy is not None:
+            self._writer.skip(legacy, count)
+
+        return self._writer.skip(template, count)
+
+    def _add_day(self, value):
+
+        row = json.loads(value)
+        row["day"] = day_of(row)
+
+        return json.dumps(row)
+
+    def __getattr__(self, name):
+
+        return getattr(self._writer, name)
+
+# Route reads and writes of a repository through the day-bucketed templates of its class
+# Without bucketed_reads, and for the tables of EXTERNAL_TABLES, the repository keeps the legacy read templates
+def _use_day_buckets(repository, legacy_class, dual_write, bucketed_reads):
+
+    for name in dir(legacy_class):
+        if name.endswith("_QUERY_TEMPLATE") and not name.startswith("_WRITE_"):
+            table = re.search(r"FROM flexheat\.(\w+)_by_day", getattr(repository, name))
+
+            if table is not None and (not bucketed_reads or table.group(1) in EXTERNAL_TABLES):
+                setattr(repository, name, getattr(legacy_class, name))
+
+    legacy_templates = {}
+
+    if dual_write:
+        for name in dir(legacy_class):
+            if name.startswith("_WRITE_") and name.endswith("_TEMPLATE"):
+                template = getattr(repository, name)
+
+                if template != getattr(legacy_class, name):
+                    legacy_templates[template] = getattr(legacy_class, name)
+
+    repository._statements = DayBucketStatements(repository._statements)
+    repository._writer = DayBucketWriter(repository._writer, legacy_templates)
+
+class BucketedHouseRepository(CassandraHouseRepository):
+
+    _SUBCENTRAL_QUERY_TEMPLATE = '''
+        SELECT tstamp_record AS tstamp,
+               heating_inflow_temperature AS inflow_temp,
+               outside_temperature AS measured_outside_temp,
+               heating_outflow_temperature AS return_temp
+          FROM flexheat.timeseries_by_day
+         WHERE customer_id = :customer_id
+            AND subcentral_id = :subcentral_id
+            AND day IN :days
+            AND tstamp_record >= :mintime
+            AND tstamp_record <= :maxtime
+    '''
+
+    _APARTMENT_QUERY_TEMPLATE = '''
+        SELECT tstamp_record AS tstamp, sensor_temperature AS average_indoor_temperature
+          FROM flexheat.average_measurement_by_day
+         WHERE customer_id = :customer_id
+            AND subcentral_id = :subcentral_id
+            AND day IN :days
+            AND tstamp_record >= :mintime
+            AND tstamp_record <= :maxtime
+    '''
+
+    _FLEXIBILITY_PLAN_QUERY_TEMPLATE = '''
+        SELECT ts_start, power_offset AS subcentral_plan
+          FROM flexheat.subcentral_flexibility_plan_by_day
+         WHERE customer_id = :customer_id
+            AND subcentral_id = :subcentral_id
+            AND day IN :days
+            AND ts_start >= :mintime
+            AND ts_start <= :maxtime
+    '''
+
+    _FLEXIBILITY_DISPATCH_QUERY_TEMPLATE = '''
+        SELECT ts_start, power_offset AS subcentral_dispatch
+          FROM flexheat.subcentral_flexibility_dispatch_by_day
+         WHERE customer_id = :customer_id
+            AND subcentral_id = :subcentral_id
+            AND day IN :days
+            AND ts_start >= :mintime
+            AND ts_start <= :maxtime
+    '''
+
+    # subcentral_id and day are partition key columns here, the IN restrictions select their cartesian product
+    _FLEXIBILITY_PLANS_QUERY_TEMPLATE = '''
+        SELECT subcentral_id, ts_start, power_offset AS subcentral_plan
+          FROM flexheat.subcentral_flexibility_plan_by_day
+         WHERE customer_id = :customer_id
+            AND subcentral_id IN :subcentral_ids
+            AND day IN :days
+            AND ts_start >= :mintime
+            AND ts_start <= :maxtime
+    '''
+
+    _FLEXIBILITY_DISPATCHES_QUERY_TEMPLATE = '''
+        SELECT subcentral_id, ts_start, power_offset AS subcentral_dispatch
+          FROM flexheat.subcentral_flexibility_dispatch_by_day
+         WHERE customer_id = :customer_id
+            AND subcentral_id IN :subcentral_ids
+            AND day IN :days
+            AND ts_start >= :mintime
+            AND ts_start <= :maxtime
+    '''
+
+    # grid_zone is a regular column here, _changed_rows compares it
+    _LAST_PLAN_QUERY_TEMPLATE = '''
+        SELECT ts_start, ts_end, grid_zone, outside_temperature, heating_baseline, heating_power, power_offset, average_indoor_temperature,
+               fallback
+          FROM flexheat.subcentral_flexibility_plan_by_day
+         WHERE customer_id = :customer_id
+            AND subcentral_id = :subcentral_id
+            AND day IN :days
+            AND ts_start >= :mintime
+            AND ts_start <= :maxtime
+    '''
+
+    # mpc_planning and dynamic_indoor_temperature_model are not time-bucketed
+    _WRITE_QUERY_TEMPLATE = CassandraHouseRepository._WRITE_QUERY_TEMPLATE
+
+    _WRITE_PLAN_QUERY_TEMPLATE = '''
+        INSERT INTO flexheat.subcentral_flexibility_plan_by_day JSON
+        :plan_json
+        USING TIMESTAMP :write_time
+    '''
+    _WRITE_DISPATCH_QUERY_TEMPLATE = '''
+        INSERT INTO flexheat.subcentral_flexibility_dispatch_by_day JSON
+        :dispatch_json
+    '''
+
+    _WRITE_REPORT_QUERY_TEMPLATE = '''
+        INSERT INTO flexheat.subcentral_flexibility_report_by_day JSON
+        :report_json
+    '''
+
+    def __init__(self, session, dual_write = False, bucketed_reads = True, write_tolerance = CassandraHouseRepository.WRITE_TOLERANCE):
+
+        CassandraHouseRepository.__init__(self, session, write_tolerance)
+        _use_day_buckets(self, CassandraHouseRepository, dual_write, bucketed_reads)
+
+class BucketedWeatherRepository(CassandraWeatherRepository):
+
+    _WEATHER_QUERY_TEMPLATE = '''
+        SELECT timestamp AS tstamp, temperature AS forecast_outside_temp, total_cloud_cover AS forecast_cloud_cover
+          FROM flexheat.darksky_forecast_by_day
+         WHERE location = :location
+            AND day IN :days
+            AND timestamp >= :mintime
+            AND timestamp <= :maxtime
+    '''
+
+    _TEMP_DEVIATION_QUERY_TEMPLATE = '''
+        SELECT timestamp AS tstamp, measure_forecast_deviation
+          FROM flexheat.outside_temperature_forecast_by_day
+         WHERE customer_id = :customer_id
+            AND subcentral_id = :subcentral_id
+            AND day IN :days
+            AND timestamp >= :mintime
+            AND timestamp <= :maxtime
+    '''
+
+    _WRITE_QUERY_TEMPLATE = '''
+        INSERT INTO flexheat.outside_temperature_forecast_by_day JSON
+        :deviation_forecast_json
+    '''
+
+    def __init__(self, session, dual_write = False, bucketed_reads = True):
+
+        CassandraWeatherRepository.__init__(self, session)
+        _use_day_buckets(self, CassandraWeatherRepository, dual_write, bucketed_reads)
+
+# Same method resolution as CassandraRepository: _WRITE_QUERY_TEMPLATE is the mpc_planning template of the house repository
+class BucketedRepository(BucketedHouseRepository, BucketedWeatherRepository, CassandraRepository):
+
+    _WRITE_QUERY_TEMPLATE = CassandraHouseRepository._WRITE_QUERY_TEMPLATE
+
+    def __init__(self, session, dual_write = False, bucketed_reads = True, write_tolerance = CassandraHouseRepository.WRITE_TOLERANCE):
+
+        CassandraRepository.__init__(self, session, write_tolerance)
+        _use_day_buckets(self, CassandraRepository, dual_write, bucketed_reads)
+
+class BucketedAggregateRepository(CassandraAggregateRepository):
+
+    _GRID_PEAK_QUERY_TEMPLATE = '''
+        SELECT ts_start, ts_end
+          FROM flexheat.peak_hours_by_day
+         WHERE customer_id = :customer_id
+            AND grid_zone = :grid_zone
+            AND day IN :days
+            AND ts_start >= :mintime
+            AND ts_start <= :maxtime
+    '''
+
+    _GRID_PLAN_QUERY_TEMPLATE = '''
+        SELECT ts_start, power_offset AS aggregate_plan
+          FROM flexheat.aggregate_flexibility_plan_by_day
+         WHERE customer_id = :customer_id
+            AND grid_zone = :grid_zone
+            AND day IN :days
+            AND ts_start >= :mintime
+            AND ts_start <= :maxtime
+    '''
+
+    _GRID_DISPATCH_QUERY_TEMPLATE = '''
+        SELECT ts_start, power_offset AS aggregate_dispatch
+          FROM flexheat.aggregate_flexibility_dispatch_by_day
+         WHERE customer_id = :customer_id
+            AND grid_zone = :grid_zone
+            AND day IN :days
+            AND ts_start >= :mintime
+            AND ts_start <= :maxtime
+    '''
+
+    _WRITE_PLAN_QUERY_TEMPLATE = '''
+        INSERT INTO flexheat.aggregate_flexibility_plan_by_day JSON
+        :output_json
+    '''
+
+    _WRITE_REPORT_QUERY_TEMPLATE = '''
+        INSERT INTO flexheat.aggregate_flexibility_report_by_day JSON
+        :output_json
+    '''
+
+    def __init__(self, session, dual_write = False, bucketed_reads = True):
+
+        CassandraAggregateRepository.__init__(self, session)
+        _use_day_buckets(self, CassandraAggregateRepository, dual_write, bucketed_reads)
+
+BUCKETED_CLASSES = {CassandraHouseRepository: BucketedHouseRepository,
+                    CassandraWeatherRepository: BucketedWeatherRepository,
+                    CassandraRepository: BucketedRepository,
+                    CassandraAggregateRepository: BucketedAggregateRepository}
+
+# Repository of a Cassandra*Repository class on the schema of a DAY_BUCKET_MODES mode
+# The day-bucketed modes always write the legacy tables as well, other services still read them
+def repository_for(repository_class, session, mode = "off"):
+
+    if mode not in DAY_BUCKET_MODES:
+        raise ValueError(f"Unknown day bucket mode {mode}, expected one of {DAY_BUCKET_MODES}")
+
+    if mode == "off":
+        return repository_class(session)
+
+    return BUCKETED_CLASSES[repository_class](session, dual_write = True, bucketed_reads = mode == "read")
+
+@dataclass
+class BucketedTable:
+
+    '''Copy specification from a legacy table to its day-bucketed companion, used by migrate_bucketed_tables.py'''
+
+    legacy: str
+    table: str
+    key: tuple # Partition key columns without day, the first one selects the legacy rows
+    time: str # Clustering timestamp, day is derived from it
+    columns: tuple # Copied columns
+    source: tuple = None # Legacy select expressions of columns, if they differ
+    condition: str = "" # Extra legacy filter
+
+    def select_template(self):
+
+        source = self.source or self.columns
+        selected = ", ".join(self.key + (self.time,) + tuple(f"{expression} AS {column}" if expression != column else column
+                                                                for expression, column in zip(source, self.columns)))
+
+        return f'''
+        SELECT {selected} FROM flexheat.{self.legacy}
+         WHERE {self.key[0]} = :entity
+            AND {self.time} >= :mintime
+            AND {self.time} <= :maxtime{self.condition}
+            ALLOW FILTERING
+    '''
+
+    def insert_template(self):
+
+        columns = self.key + ("day", self.time) + self.columns
+
+        return f'''
+        INSERT INTO flexheat.{self.table} ({", ".join(columns)})
+        VALUES ({", ".join(":" + column for column in columns)})
+    '''
+
+BUCKETED_TABLES = [
+    BucketedTable("timeseries", "timeseries_by_day", ("customer_id", "subcentral_id"), "tstamp_record",
+                  ("heating_inflow_temperature", "outside_temperature", "heating_outflow_temperature"),
+                  source = ("heating_system.heating_inflow_temperature", "heating_system.outside_temperature",
+                            "heating_system.heating_outflow_temperature"),
+                  condition = "\n            AND asset_id = 6000"),
+    BucketedTable("average_measurement", "average_measurement_by_day", ("customer_id", "subcentral_id"), "tstamp_record",
+                  ("sensor_temperature",)),
+    BucketedTable("darksky_forecast", "darksky_forecast_by_day", ("location",), "timestamp",
+                  ("temperature", "total_cloud_cover")),
+    BucketedTable("outside_temperature_forecast", "outside_temperature_forecast_by_day", ("customer_id", "subcentral_id"), "timestamp",
+                  ("measure_forecast_deviation", "tstamp_record")),
+    BucketedTable("peak_hours", "peak_hours_by_day", ("customer_id", "grid_zone"), "ts_start",
+                  ("ts_end", "tstamp_record")),
+    BucketedTable("subcentral_flexibility_plan", "subcentral_flexibility_plan_by_day", ("customer_id", "subcentral_id"), "ts_start",
+                  ("grid_zone", "ts_end", "outside_temperature", "heating_baseline", "heating_power", "power_offset",
+                   "average_indoor_temperature", "fallback", "tstamp_record")),
+    BucketedTable("subcentral_flexibility_dispatch", "subcentral_flexibility_dispatch_by_day", ("customer_id", "subcentral_id"), "ts_start",
+                  ("grid_zone", "ts_end", "power_offset", "tstamp_record")),
+    BucketedTable("subcentral_flexibility_report", "subcentral_flexibility_report_by_day", ("customer_id", "subcentral_id"), "ts_start",
+                  ("grid_zone", "ts_end", "outside_temperature", "heating_baseline", "heating_power", "power_offset",
+                   "average_indoor_temperature", "tstamp_record")),
+    BucketedTable("aggregate_flexibility_plan", "aggregate_flexibility_plan_by_day", ("customer_id", "grid_zone"), "ts_start",
+                  ("ts_end", "power_offset", "tstamp_record")),
+    BucketedTable("aggregate_flexibility_dispatch", "aggregate_flexibility_dispatch_by_day", ("customer_id", "grid_zone"), "ts_start",
+                  ("ts_end", "power_offset", "tstamp_record")),
+    BucketedTable("aggregate_flexibility_report", "aggregate_flexibility_report_by_day", ("customer_id", "grid_zone"), "ts_start",
+                  ("ts_end", "power_offset", "tstamp_record")),
+]
+
+label_templates(BucketedHouseRepository, BucketedWeatherRepository, BucketedAggregateRepository)
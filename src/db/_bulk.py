@@ -0,0 +1,155 @@
+from cassandra.query import BatchStatement, BatchType
+from dataclasses import dataclass
+from db._prepared import PreparedStatementRegistry
+import weakref
+import time
+import re
+import logging
+
+logger = logging.getLogger("__main__")
+
+@dataclass
+class TableWriteStats:
+
+    rows: int = 0
+    skipped: int = 0 # rows left out because they equal the last written ones
+    statements: int = 0
+    failures: int = 0
+    seconds: float = 0
+
+    def merge(self, other):
+
+        self.rows += other.rows
+        self.skipped += other.skipped
+        self.statements += other.statements
+        self.failures += other.failures
+        self.seconds += other.seconds
+
+    def to_dict(self):
+
+        return {"rows": self.rows,
+                "skipped": self.skipped,
+                "statements": self.statements,
+                "failures": self.failures,
+                "seconds": round(self.seconds, 3),
+                "rows_per_second": round(self.rows / self.seconds, 1) if self.seconds > 0 else None}
+
+class BulkWriter:
+
+    '''
+    Pipeline INSERTs instead of one blocking round trip per row.
+
+    Statements are executed asynchronously with at most `concurrency` requests in flight.
+    If batch_rows > 1, rows sharing a partition key are grouped into UNLOGGED batches of at most batch_rows rows,
+    so each batch is applied on a single replica set without the batch log.
+    '''
+
+    CONCURRENCY = 32
+    BATCH_ROWS = 0 # 0: no batches, every row is a separate statement
+
+    __WRITERS = weakref.WeakKeyDictionary() # One writer per session, writers reach it only weakly through the registry
+    __TABLE = re.compile(r"INSERT\s+INTO\s+([\w.]+)", re.IGNORECASE)
+
+    def __init__(self, statements: PreparedStatementRegistry, concurrency = CONCURRENCY, batch_rows = BATCH_ROWS):
+
+        self._statements = statements
+        self.concurrency = concurrency
+        self.batch_rows = batch_rows
+        self.stats = {}
+
+        BulkWriter.__WRITERS[statements.session] = self
+
+    @classmethod
+    def for_session(cls, session):
+
+        writer = cls.__WRITERS.get(session)
+
+        if writer is None:
+            writer = cls(PreparedStatementRegistry.for_session(session))
+
+        return writer
+
+    # rows: list of (partition key, bound values), e.g. ((customer_id, subcentral_id), {"plan_json": ...})
+    def write(self, template, rows):
+
+        table = self.__TABLE.search(template).group(1).split('.')[-1]
+        stats = self.stats.setdefault(table, TableWriteStats())
+
+        if len(rows) == 0:
+            return stats
+
+        prepared = self._statements.prepare(template)
+
+        if self.batch_rows > 1:
+            statements = self._batches(prepared, rows)
+        else:
+            statements = [(prepared, parameters) for _, parameters in rows]
+
+        start = time.perf_counter()
+        results = self._statements.execute_concurrent(statements, self.concurrency)
+        elapsed = time.perf_counter() - start
+
+        errors = [result for success, result in results if not success]
+
+        stats.rows += len(rows)
+        stats.statements += len(statements)
+        stats.failures += len(errors)
+        stats.seconds += elapsed
+
+        logger.debug(f"Wrote {len(rows)} rows to {table} in {len(statements)} statements, {elapsed:.3f} s")
+
+        if len(errors) > 0:
+            for error in errors[:3]:
+                logger.error(f"Write to {table} failed: {error}")
+
+            raise ValueError(f"{len(errors)} out of {len(statements)} statements failed writing to {table}")
+
+        return stats
+
+    # Count rows that were not written since they did not change, see CassandraHouseRepository._changed_rows
+    def skip(self, template, count):
+
+        table = self.__TABLE.search(template).group(1).split('.')[-1]
+        stats = self.stats.setdefault(table, TableWriteStats())
+        stats.skipped += count
+
+        return stats
+
+    def _batches(self, prepared, rows):
+
+        partitions = {}
+
+        for key, parameters in rows:
+            partitions.setdefault(key, []).append(parameters)
+
+        statements = []
+
+        for key, group in partitions.items():
+            for i in range(0, len(group), self.batch_rows):
+                batch = BatchStatement(batch_type = BatchType.UNLOGGED)
+
+                for parameters in group[i:i + self.batch_rows]:
+                    batch.add(prepared, parameters)
+
+                statements.append((batch, None))
+
+        return statements
+
+    # Rows, statements and write time per table, {table: TableWriteStats} as in self.stats
+    def merge(self, stats):
+
+        for table, other in stats.items():
+            self.stats.setdefault(table, TableWriteStats()).merge(other)
+
+    def summary(self):
+
+        return {table: stats.to_dict() for table, stats in self.stats.items()}
+
+    def log_summary(self):
+
+        for table, stats in self.summary().items():
+            logger.info(f"Write summary for {table}: {stats}")
+
+    def reset(self):
+
+        self.stats = {}
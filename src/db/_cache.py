@@ -0,0 +1,197 @@
+from dataclasses import dataclass
+from collections import OrderedDict
+import threading
+import weakref
+import time
+import logging
+
+logger = logging.getLogger("__main__")
+
+@dataclass
+class CacheStats:
+
+    hits: int = 0
+    misses: int = 0
+    preloaded: int = 0
+    invalidations: int = 0
+    evictions: int = 0
+
+    def merge(self, other):
+
+        self.hits += other.hits
+        self.misses += other.misses
+        self.preloaded += other.preloaded
+        self.invalidations += other.invalidations
+        self.evictions += other.evictions
+
+    def to_dict(self):
+
+        requests = self.hits + self.misses
+
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "preloaded": self.preloaded,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / requests, 3) if requests > 0 else None}
+
+class RunCache:
+
+    '''
+    Read-through cache living as long as the repository that owns it, i.e. one lambda run.
+
+    Entries never expire by themselves, call invalidate() when the underlying rows change.
+    Cached values are shared between callers and must be treated as read-only.
+    '''
+
+    def __init__(self, name):
+
+        self.name = name
+        self.stats = CacheStats()
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    # Return the cached value for key, call load() and cache its result on a miss
+    # Exceptions raised by load() are not cached
+    def get(self, key, load):
+
+        with self._lock:
+            if key in self._entries:
+                self.stats.hits += 1
+                return self._entries[key]
+
+            self.stats.misses += 1
+
+        value = load()
+
+        with self._lock:
+            self._entries[key] = value
+
+        return value
+
+    def put(self, key, value):
+
+        with self._lock:
+            self._entries[key] = value
+            self.stats.preloaded += 1
+
+    # Drop one key, or every entry if key is None
+    def invalidate(self, key = None):
+
+        with self._lock:
+            if key is None:
+                self.stats.invalidations += len(self._entries)
+                self._entries = {}
+
+            elif self._entries.pop(key, None) is not None:
+                self.stats.invalidations += 1
+
+    def __contains__(self, key):
+
+        return key in self._entries
+
+    def __len__(self):
+
+        return len(self._entries)
+
+    def log_summary(self):
+
+        logger.info(f"Cache summary for {self.name}: {self.stats.to_dict()}")
+
+class WindowCache:
+
+    '''
+    Time-indexed frames per key (e.g. weather forecast per location), each covering a [mintime, maxtime] window.
+
+    A request inside the cached window is sliced from memory. Otherwise window() returns the union of the
+    cached and the requested window, which the caller fetches once and stores, so houses asking for
+    overlapping windows of the same key share one query.
+    At most maxsize keys are kept (least recently used are evicted) and entries older than max_age seconds are refetched.
+    '''
+
+    MAXSIZE = 64
+    MAX_AGE = 600 # seconds
+
+    __CACHES = weakref.WeakKeyDictionary() # {session: {name: cache}}, caches do not reference the session
+
+    def __init__(self, name, maxsize = MAXSIZE, max_age = MAX_AGE):
+
+        self.name = name
+        self.maxsize = maxsize
+        self.max_age = max_age
+        self.stats = CacheStats()
+        self._entries = OrderedDict() # key -> (mintime, maxtime, loaded_at, frame)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_session(cls, session, name, maxsize = MAXSIZE, max_age = MAX_AGE):
+
+        caches = cls.__CACHES.setdefault(session, {})
+
+        if name not in caches:
+            caches[name] = cls(name, maxsize = maxsize, max_age = max_age)
+
+        return caches[name]
+
+    # Return None if [mintime, maxtime] can be sliced from the cache, else the window to fetch
+    def window(self, key, mintime, maxtime):
+
+        with self._lock:
+            entry = self._fresh(key)
+
+            if entry is not None and entry[0] <= mintime and maxtime <= entry[1]:
+                self.stats.hits += 1
+                return None
+
+            self.stats.misses += 1
+
+            if entry is None:
+                return mintime, maxtime
+
+            return min(entry[0], mintime), max(entry[1], maxtime)
+
+    def store(self, key, mintime, maxtime, data):
+
+        with self._lock:
+            self._entries[key] = (mintime, maxtime, time.monotonic(), data)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last = False)
+                self.stats.evictions += 1
+
+    def slice(self, key, mintime, maxtime):
+
+        with self._lock:
+            data = self._entries[key][3]
+            self._entries.move_to_end(key)
+
+        return data[(data.index >= mintime) & (data.index <= maxtime)]
+
+    def invalidate(self, key = None):
+
+        with self._lock:
+            if key is None:
+                self.stats.invalidations += len(self._entries)
+                self._entries = OrderedDict()
+
+            elif self._entries.pop(key, None) is not None:
+                self.stats.invalidations += 1
+
+    def _fresh(self, key):
+
+        entry = self._entries.get(key)
+
+        if entry is not None and time.monotonic() - entry[2] > self.max_age:
+            del self._entries[key]
+            return None
+
+        return entry
+
+    def __len__(self):
+
+        return len(self._entries)
+
+    def log_summary(self):
+
+        logger.info(f"Cache summary for {self.name}: {self.stats.to_dict()}, fetches avoided: {self.stats.hits}")
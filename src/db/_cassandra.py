@@ -1,141 +1,278 @@
-from cassandra.cluster import Cluster
+from cassandra.cluster import Cluster, ExecutionProfile, EXEC_PROFILE_DEFAULT
+from cassandra.policies import DCAwareRoundRobinPolicy, TokenAwarePolicy, HostDistance
 import models
 import pytz
 from db._base import HouseSensorRepository, WeatherRepository, HouseModelRepository, FlexibilityModelRepository
 import typing
+import numpy as np
 import pandas as pd
 import logging
 import dateutil.parser
 from datetime import datetime
 from datetime import timedelta
-import json
+from collections import deque
 from pandas.core.frame import DataFrame
 from mpc.params import FlexibilityConfiguration
+from mpc.warm_start import WarmStart
+from db._prepared import PreparedStatementRegistry, bind_timestamp
+from db._bulk import BulkWriter
+from db._metrics import label_templates
+from db._cache import WindowCache
+from db._columnar import COLUMNAR_PROFILE, FETCH_SIZE, TIMESTAMP, columnar_factory, read_columns, time_indexed_frame
+from db._timecodec import format_timestamp, format_timestamps, record_time, write_time, utc_index
 
 logger = logging.getLogger("__main__")
 
 class DBConnection:
+    
+    POOL_SIZE = 2 # connections per local host
+    COMPRESSION = True # lz4 or snappy, whichever is installed
+    HEALTH_CHECK_QUERY = "SELECT release_version FROM system.local"
+    HEALTH_CHECK_TIMEOUT = 5 # seconds
        
-    def __init__(self, db):
+    def __init__(self, db, write_concurrency = BulkWriter.CONCURRENCY, write_batch_rows = BulkWriter.BATCH_ROWS,
+                 pool_size = POOL_SIZE, compression = COMPRESSION, local_dc = None):
                        
         self.db = db
-        self.cluster = Cluster([db])
+        # Statements are routed to a replica of their partition (prepared statements carry the routing key),
+        # falling back to round robin over the local data center
+        load_balancing_policy = TokenAwarePolicy(DCAwareRoundRobinPolicy(local_dc = local_dc))
+        # Timeseries reads use the columnar row factory, all other statements keep the driver defaults
+        self.cluster = Cluster([db], compression = compression,
+                               execution_profiles = {EXEC_PROFILE_DEFAULT: ExecutionProfile(load_balancing_policy = load_balancing_policy),
+                                                     COLUMNAR_PROFILE: ExecutionProfile(load_balancing_policy = load_balancing_policy,
+                                                                                        row_factory = columnar_factory)})
+        # Protocol v3+ multiplexes requests over one connection per host, the pool size only applies to v1/v2
+        if self.cluster.protocol_version < 3:
+            self.cluster.set_core_connections_per_host(HostDistance.LOCAL, pool_size)
+            self.cluster.set_max_connections_per_host(HostDistance.LOCAL, pool_size)
         self.session = self.cluster.connect() 
+        self.statements = PreparedStatementRegistry(self.session) # Statements are prepared once per session
+        self.writer = BulkWriter(self.statements, concurrency = write_concurrency, batch_rows = write_batch_rows)
         logger.info(f"Connected to database {self.db}")   
 
+    # Round trip to the coordinator, False if the session was shut down or the query fails
+    def is_healthy(self):
+        
+        if self.session.is_shutdown:
+            return False
+        
+        try:
+            self.session.execute(self.HEALTH_CHECK_QUERY, timeout = self.HEALTH_CHECK_TIMEOUT)
+        except Exception as ex:
+            logger.warning(f"Health check of database {self.db} failed: {ex}")
+            return False
+        
+        return True
+
     def db_shutdown(self):
         
-        self.session.shutdown()
+        self.cluster.shutdown()
         logger.info(f"Close connection to database {self.db}")   
 
-# Read/write data for subcentral/building                              
+# Frame of many houses indexed by (customer_id, subcentral_id, time)
+def _by_house_frame(customer_ids, subcentral_ids, times, values):
+    
+    index = pd.MultiIndex.from_arrays([customer_ids, subcentral_ids, times], names = ["customer_id", "subcentral_id", times.name])
+    
+    return values.set_axis(index, axis = 0)
+
 class CassandraHouseRepository(HouseSensorRepository):
 
     _SUBCENTRAL_QUERY_TEMPLATE = '''
-        SELECT JSON * FROM flexheat.timeseries
-         WHERE customer_id = {customer_id}
-            AND subcentral_id = {subcentral_id}
+        SELECT tstamp_record AS tstamp,
+               heating_system.heating_inflow_temperature AS inflow_temp,
+               heating_system.outside_temperature AS measured_outside_temp,
+               heating_system.heating_outflow_temperature AS return_temp
+          FROM flexheat.timeseries
+         WHERE customer_id = :customer_id
+            AND subcentral_id = :subcentral_id
             AND asset_id= 6000
-            AND tstamp_record >= '{mintime}'
-            AND tstamp_record <= '{maxtime}'
+            AND tstamp_record >= :mintime
+            AND tstamp_record <= :maxtime
             ALLOW FILTERING
     '''    
     
     _APARTMENT_QUERY_TEMPLATE = '''
-        SELECT JSON * FROM flexheat.average_measurement
-         WHERE customer_id = {customer_id}
-            AND subcentral_id = {subcentral_id}
-            AND tstamp_record >= '{mintime}'
-            AND tstamp_record <= '{maxtime}'
+        SELECT tstamp_record AS tstamp, sensor_temperature AS average_indoor_temperature
+          FROM flexheat.average_measurement
+         WHERE customer_id = :customer_id
+            AND subcentral_id = :subcentral_id
+            AND tstamp_record >= :mintime
+            AND tstamp_record <= :maxtime
             ALLOW FILTERING
     '''   
     
     _FLEXIBILITY_PLAN_QUERY_TEMPLATE = '''
-        SELECT JSON * FROM flexheat.subcentral_flexibility_plan
-         WHERE customer_id = {customer_id}
-            AND subcentral_id = {subcentral_id}
-            AND ts_start >= '{mintime}'
-            AND ts_start <= '{maxtime}'
+        SELECT ts_start, power_offset AS subcentral_plan
+          FROM flexheat.subcentral_flexibility_plan
+         WHERE customer_id = :customer_id
+            AND subcentral_id = :subcentral_id
+            AND ts_start >= :mintime
+            AND ts_start <= :maxtime
             ALLOW FILTERING
     '''      
     
     _FLEXIBILITY_DISPATCH_QUERY_TEMPLATE = '''
-        SELECT JSON * FROM flexheat.subcentral_flexibility_dispatch
-         WHERE customer_id = {customer_id}
-            AND subcentral_id = {subcentral_id}
-            AND ts_start >= '{mintime}'
-            AND ts_start <= '{maxtime}'
+        SELECT ts_start, power_offset AS subcentral_dispatch
+          FROM flexheat.subcentral_flexibility_dispatch
+         WHERE customer_id = :customer_id
+            AND subcentral_id = :subcentral_id
+            AND ts_start >= :mintime
+            AND ts_start <= :maxtime
             ALLOW FILTERING
     '''  
+    
+    # Batch variants of the plan/dispatch queries, subcentral_id is the first clustering column of the customer partition
+    _FLEXIBILITY_PLANS_QUERY_TEMPLATE = '''
+        SELECT subcentral_id, ts_start, power_offset AS subcentral_plan
+          FROM flexheat.subcentral_flexibility_plan
+         WHERE customer_id = :customer_id
+            AND subcentral_id IN :subcentral_ids
+            AND ts_start >= :mintime
+            AND ts_start <= :maxtime
+            ALLOW FILTERING
+    '''
+    
+    _FLEXIBILITY_DISPATCHES_QUERY_TEMPLATE = '''
+        SELECT subcentral_id, ts_start, power_offset AS subcentral_dispatch
+          FROM flexheat.subcentral_flexibility_dispatch
+         WHERE customer_id = :customer_id
+            AND subcentral_id IN :subcentral_ids
+            AND ts_start >= :mintime
+            AND ts_start <= :maxtime
+            ALLOW FILTERING
+    '''
         
+    # Column dtypes of the queries above, executed with COLUMNAR_PROFILE
+    _SUBCENTRAL_COLUMNS = {"tstamp": TIMESTAMP, "inflow_temp": float, "measured_outside_temp": float, "return_temp": float}
+    _APARTMENT_COLUMNS = {"tstamp": TIMESTAMP, "average_indoor_temperature": float}
+    _FLEXIBILITY_PLAN_COLUMNS = {"ts_start": TIMESTAMP, "subcentral_plan": float}
+    _FLEXIBILITY_DISPATCH_COLUMNS = {"ts_start": TIMESTAMP, "subcentral_dispatch": float}
+    _FLEXIBILITY_PLANS_COLUMNS = {"subcentral_id": int, "ts_start": TIMESTAMP, "subcentral_plan": float}
+    _FLEXIBILITY_DISPATCHES_COLUMNS = {"subcentral_id": int, "ts_start": TIMESTAMP, "subcentral_dispatch": float}
+    
+    # Last written rows of the horizon, compared with a new plan/schedule before it is written
+    _LAST_PLAN_QUERY_TEMPLATE = '''
+        SELECT ts_start, ts_end, grid_zone, outside_temperature, heating_baseline, heating_power, power_offset, average_indoor_temperature,
+               fallback
+          FROM flexheat.subcentral_flexibility_plan
+         WHERE customer_id = :customer_id
+            AND subcentral_id = :subcentral_id
+            AND grid_zone = :grid_zone
+            AND ts_start >= :mintime
+            AND ts_start <= :maxtime
+    '''
+    
+    _LAST_SCHEDULE_QUERY_TEMPLATE = '''
+        SELECT ts_start, ts_end, out_temp, baseline_power, scheduled_power, power_offset, inflow_temp_offset,
+               indoor_temp_estimate, solar_irradiation, scheduled_inflow_temp, fallback
+          FROM flexheat.mpc_planning
+         WHERE customer_id = :customer_id
+            AND subcentral_id = :subcentral_id
+            AND ts_start >= :mintime
+            AND ts_start <= :maxtime
+            ALLOW FILTERING
+    '''
+    
+    # Table column: output column, the values compared by _changed_rows. fallback (a schedule of mpc/fallback.py) compares
+    # as 0/1, a row that switches between a fallback and an optimized plan is rewritten even if its values did not move
+    _PLAN_VALUES = {"outside_temperature": "out_temp_with_deviation", "heating_baseline": "baseline_power", "heating_power": "power",
+                    "power_offset": "power_offset", "average_indoor_temperature": "indoor_temperature", "fallback": "fallback"}
+    _SCHEDULE_VALUES = {"out_temp": "out_temp_with_deviation", "baseline_power": "baseline_power", "scheduled_power": "power",
+                        "power_offset": "power_offset", "inflow_temp_offset": "inflow_temp_offset", "indoor_temp_estimate": "indoor_temperature",
+                        "solar_irradiation": "solar", "scheduled_inflow_temp": "new_inflow_temp", "fallback": "fallback"}
+    
+    # Rows are written with the microsecond clock of their write call (write_time), so a delayed write of an older run
+    # cannot overwrite a newer one and two runs in the same minute never tie
     _WRITE_QUERY_TEMPLATE = '''
         INSERT INTO flexheat.mpc_planning JSON 
-        '{model_output_json}'
+        :model_output_json
+        USING TIMESTAMP :write_time
     '''       
     _WRITE_MODEL_QUERY_TEMPLATE = '''
         INSERT INTO flexheat.dynamic_indoor_temperature_model JSON 
-        '{dynamic_model_json}'
+        :dynamic_model_json
     '''   
     _WRITE_PLAN_QUERY_TEMPLATE = '''
         INSERT INTO flexheat.subcentral_flexibility_plan JSON 
-        '{plan_json}'
+        :plan_json
+        USING TIMESTAMP :write_time
     '''    
     _WRITE_DISPATCH_QUERY_TEMPLATE = '''
         INSERT INTO flexheat.subcentral_flexibility_dispatch JSON 
-        '{dispatch_json}'
+        :dispatch_json
     ''' 
     
     _WRITE_REPORT_QUERY_TEMPLATE = '''
         INSERT INTO flexheat.subcentral_flexibility_report JSON 
-        '{report_json}'
+        :report_json
     '''        
+    
+    # Solution of the last plan/execution run, the warm start of the next one (see mpc/warm_start.py)
+    _WARM_START_QUERY_TEMPLATE = '''
+        SELECT solution
+          FROM flexheat.mpc_warm_start
+         WHERE customer_id = :customer_id
+            AND subcentral_id = :subcentral_id
+            AND model = :model
+    '''
+    
+    _WRITE_WARM_START_QUERY_TEMPLATE = '''
+        INSERT INTO flexheat.mpc_warm_start JSON 
+        :warm_start_json
+    '''
            
     __TIMEZONE = pytz.timezone('UTC')
-    __DATETIME_FORMAT = '%Y-%m-%dT%H:%M:00Z'
     __TIME_TOLERANCE = 15 * 60 # 15 minutes
+    __SAMPLE_INTERVAL = 60 # seconds, used to preallocate the columns of timeseries and average_measurement reads
+    __BATCH_CONCURRENCY = 64 # queries in flight for the batch getters
+    __BATCH_IN_SIZE = 100 # subcentral ids per IN query
+    __FLOAT_RTOL = 1e-6 # CQL float is single precision, values read back differ from the written doubles
 
-    def __init__(self, session):
+    # Plan and schedule rows within WRITE_TOLERANCE of the last written values are not written again, None writes every row
+    WRITE_TOLERANCE = 1e-3
+
+    def __init__(self, session, write_tolerance = WRITE_TOLERANCE):
         
         self.session = session
+        self.write_tolerance = write_tolerance
+        self._statements = PreparedStatementRegistry.for_session(session)
+        self._writer = BulkWriter.for_session(session)
 
     def get_data_for_subcentral(self, house: models.House, time_range, now: pytz.datetime.datetime):
         
-        now = now
+        template, parameters = self._subcentral_request(house, time_range, now)
+        rows = self._statements.execute(template, parameters, execution_profile = COLUMNAR_PROFILE, fetch_size = FETCH_SIZE)
+        
+        return self._subcentral_frame(house, rows, time_range, now, parameters)
+
+    # Reads are split into request and frame so that CassandraRepository can issue them asynchronously
+    # request returns (template, parameters), or None if no query is needed; frame builds the result from the rows
+    def _subcentral_request(self, house: models.House, time_range, now: pytz.datetime.datetime):
+        
         mintime = now - time_range[0]
         maxtime = now + time_range[1]
         
         logger.info(f"Fetching subcentral data for cid = {house.customer_id}, sid = {house.subcentral_id} in time_range")
 
-        query = self._SUBCENTRAL_QUERY_TEMPLATE.format(customer_id = house.customer_id, subcentral_id = house.subcentral_id, \
-                                                       mintime=mintime.strftime(self.__DATETIME_FORMAT), \
-                                                       maxtime=maxtime.strftime(self.__DATETIME_FORMAT))
+        parameters = {"customer_id": house.customer_id,
+                      "subcentral_id": house.subcentral_id,
+                      "mintime": bind_timestamp(mintime),
+                      "maxtime": bind_timestamp(maxtime)}
         
+        return self._SUBCENTRAL_QUERY_TEMPLATE, parameters
 
-        dictionary ={"tstamp":[],"inflow_temp":[], "measured_outside_temp":[], "return_temp":[]}
-        print(query)
+    def _subcentral_frame(self, house: models.House, rows, time_range, now: pytz.datetime.datetime, parameters = None):
 
-        rows = self.session.execute(query)
+        columns = read_columns(rows, self._SUBCENTRAL_COLUMNS, expected_rows = self._expected_rows(time_range))
                
-        if len(rows._current_rows) == 0:
+        if len(columns["tstamp"]) == 0:
                     
             raise ValueError(f"No initial subcentral data is found for cid = {house.customer_id}, sid = {house.subcentral_id}, \
                             please check the data communication before starting MPC planning!")
                
-        for row in rows:
-            
-            subcentral_data = json.loads(row.json)
-            
-            dictionary["tstamp"].append(subcentral_data["tstamp_record"])
-            
-            heating = subcentral_data["heating_system"]   
-            dictionary["inflow_temp"].append(heating["heating_inflow_temperature"]) 
-            dictionary["measured_outside_temp"].append(heating["outside_temperature"]) 
-            dictionary["return_temp"].append(heating["heating_outflow_temperature"]) 
-            
-        data = pd.DataFrame(dictionary)
-        data.set_index("tstamp", inplace = True) 
-        data.index = pd.to_datetime(data.index)
-        data.sort_index(ascending = True, inplace = True)
+        data = time_indexed_frame(columns, "tstamp")
         
 #        data = data[data.index <= now]
         
@@ -144,7 +281,6 @@ class CassandraHouseRepository(HouseSensorRepository):
         logger.warning(f"{data.return_temp.isnull().sum()} null return_temp out of {len(data)}")
         
         valid_indexes = data.inflow_temp.notnull().index[-1]
-        valid_indexes = datetime.strptime(str(valid_indexes), "%Y-%m-%d %H:%M:%S.%f%z")
         
         if (now - valid_indexes).total_seconds() > self.__TIME_TOLERANCE:
             
@@ -152,47 +288,46 @@ class CassandraHouseRepository(HouseSensorRepository):
             
         return data
 
+    def _expected_rows(self, time_range):
+        
+        return int((time_range[0] + time_range[1]).total_seconds() // self.__SAMPLE_INTERVAL) + 1
+
     def get_data_for_building(self, house: models.House, time_range, now: pytz.datetime.datetime):
         
-        now = now
+        template, parameters = self._building_request(house, time_range, now)
+        rows = self._statements.execute(template, parameters, execution_profile = COLUMNAR_PROFILE, fetch_size = FETCH_SIZE)
+        
+        return self._building_frame(house, rows, time_range, now, parameters)
+
+    def _building_request(self, house: models.House, time_range, now: pytz.datetime.datetime):
+        
         mintime = now - time_range[0]
         maxtime = now + time_range[1]
         logger.info(f"Fetching apartment data for cid = {house.customer_id}, sid = {house.subcentral_id} in time_range")
 
-        query = self._APARTMENT_QUERY_TEMPLATE.format(customer_id = house.customer_id, subcentral_id = house.subcentral_id, \
-                                                      mintime=mintime.strftime(self.__DATETIME_FORMAT), \
-                                                      maxtime=maxtime.strftime(self.__DATETIME_FORMAT))
+        parameters = {"customer_id": house.customer_id,
+                      "subcentral_id": house.subcentral_id,
+                      "mintime": bind_timestamp(mintime),
+                      "maxtime": bind_timestamp(maxtime)}
 
-        print(query)
+        return self._APARTMENT_QUERY_TEMPLATE, parameters
 
-        dictionary ={"tstamp":[], "average_indoor_temperature":[]}
+    def _building_frame(self, house: models.House, rows, time_range, now: pytz.datetime.datetime, parameters = None):
 
-        rows = self.session.execute(query)
+        columns = read_columns(rows, self._APARTMENT_COLUMNS, expected_rows = self._expected_rows(time_range))
         
-        if len(rows._current_rows) == 0:
+        if len(columns["tstamp"]) == 0:
                     
             raise ValueError(f"No initial indoor temperature is found for cid = {house.customer_id}, sid = {house.subcentral_id}, \
                             please check the data communication before starting MPC planning!")
        
-        for row in rows:
-            
-            apartment_data = json.loads(row.json)
-                           
-            dictionary["tstamp"].append(apartment_data["tstamp_record"])
-            dictionary["average_indoor_temperature"].append(apartment_data["sensor_temperature"])
-
-            
-        data = pd.DataFrame(dictionary)
-        data.set_index("tstamp", inplace = True) 
-        data.index = pd.to_datetime(data.index)
-        data.sort_index(ascending = True, inplace = True)
+        data = time_indexed_frame(columns, "tstamp")
 
 #        data = data[data.index <= now]
         
         logger.warning(f"{data.average_indoor_temperature.isnull().sum()} null average_indoor_temperature out of {len(data)}")    
             
         valid_indexes = data.average_indoor_temperature.notnull().index[-1]
-        valid_indexes = datetime.strptime(str(valid_indexes), "%Y-%m-%d %H:%M:%S%z")
         
         if (now - valid_indexes).total_seconds() > self.__TIME_TOLERANCE:
             
@@ -208,33 +343,19 @@ class CassandraHouseRepository(HouseSensorRepository):
         maxtime = now + time_range[1]
         logger.debug(f"Fetching flexibility plan for cid = {house.customer_id}, sid = {house.subcentral_id} in time_range")
 
-        query = self._FLEXIBILITY_PLAN_QUERY_TEMPLATE.format(customer_id = house.customer_id, subcentral_id = house.subcentral_id, \
-                                                      mintime=mintime.strftime(self.__DATETIME_FORMAT), \
-                                                      maxtime=maxtime.strftime(self.__DATETIME_FORMAT))
-
-        print(query)
+        parameters = {"customer_id": house.customer_id,
+                      "subcentral_id": house.subcentral_id,
+                      "mintime": bind_timestamp(mintime),
+                      "maxtime": bind_timestamp(maxtime)}
 
-        dictionary ={"ts_start":[], "subcentral_plan":[]}
-
-        rows = self.session.execute(query)
+        rows = self._statements.execute(self._FLEXIBILITY_PLAN_QUERY_TEMPLATE, parameters, execution_profile = COLUMNAR_PROFILE, fetch_size = FETCH_SIZE)
+        data = time_indexed_frame(read_columns(rows, self._FLEXIBILITY_PLAN_COLUMNS), "ts_start")
         
-        if len(rows._current_rows) == 0:
+        if data.empty:
                     
             logger.warning(f"No planned flexibility is found for cid = {house.customer_id}, sid = {house.subcentral_id}")
-            data = pd.DataFrame(dictionary)
-       
         else:
-            for row in rows:          
-                      
-                schedules = json.loads(row.json)                
-                dictionary["ts_start"].append(schedules["ts_start"])
-                dictionary["subcentral_plan"].append(schedules["power_offset"]) 
-                            
-            data = pd.DataFrame(dictionary)
-            data.set_index("ts_start", inplace = True) 
-            data.index = pd.to_datetime(data.index)
-            data.sort_index(ascending = True, inplace = True)
-            logger.warning(f"{data.subcentral_plan.isnull().sum()} null subcentral_plan out of {len(data)}")    
+            logger.warning(f"{data.subcentral_plan.isnull().sum()} null subcentral_plan out of {len(data)}")
       
         return data
 
@@ -246,51 +367,161 @@ class CassandraHouseRepository(HouseSensorRepository):
         maxtime = now + time_range[1]
         logger.debug(f"Fetching dispatch plan for cid = {house.customer_id}, sid = {house.subcentral_id} in time_range")
 
-        query = self._FLEXIBILITY_DISPATCH_QUERY_TEMPLATE.format(customer_id = house.customer_id, subcentral_id = house.subcentral_id, \
-                                                      mintime=mintime.strftime(self.__DATETIME_FORMAT), \
-                                                      maxtime=maxtime.strftime(self.__DATETIME_FORMAT))
+        parameters = {"customer_id": house.customer_id,
+                      "subcentral_id": house.subcentral_id,
+                      "mintime": bind_timestamp(mintime),
+                      "maxtime": bind_timestamp(maxtime)}
 
-        print(query)
-
-        dictionary ={"ts_start":[], "subcentral_dispatch":[]}
-
-        rows = self.session.execute(query)
+        rows = self._statements.execute(self._FLEXIBILITY_DISPATCH_QUERY_TEMPLATE, parameters, execution_profile = COLUMNAR_PROFILE, fetch_size = FETCH_SIZE)
+        data = time_indexed_frame(read_columns(rows, self._FLEXIBILITY_DISPATCH_COLUMNS), "ts_start")
         
-        if len(rows._current_rows) == 0:
+        if data.empty:
                     
             logger.warning(f"No dispatch plan is found for cid = {house.customer_id}, sid = {house.subcentral_id}")
-            data = pd.DataFrame(dictionary)
-       
         else:
-            for row in rows:          
-                      
-                schedules = json.loads(row.json)                
-                dictionary["ts_start"].append(schedules["ts_start"])
-                dictionary["subcentral_dispatch"].append(schedules["power_offset"]) 
-                            
-            data = pd.DataFrame(dictionary)
-            data.set_index("ts_start", inplace = True) 
-            data.index = pd.to_datetime(data.index)
-            data.sort_index(ascending = True, inplace = True)
-            logger.warning(f"{data.subcentral_dispatch.isnull().sum()} null subcentral_dispatch out of {len(data)}")    
+            logger.warning(f"{data.subcentral_dispatch.isnull().sum()} null subcentral_dispatch out of {len(data)}")
       
         return data
     
+    # Batch getters for a grid zone, the result is one frame indexed by (customer_id, subcentral_id, time)
+    # Houses without data are logged and left out, like the per-house loops of the lambdas skip them
+    def get_data_for_subcentrals(self, houses: typing.List[models.House], time_range, now: pytz.datetime.datetime):
+        
+        return self._gather_by_houses(houses, time_range, now, self._subcentral_request, self._subcentral_frame)
+
+    def get_data_for_buildings(self, houses: typing.List[models.House], time_range, now: pytz.datetime.datetime):
+        
+        return self._gather_by_houses(houses, time_range, now, self._building_request, self._building_frame)
+
+    # Add for flexibility service
+    def get_plans_by_houses(self, houses: typing.List[models.House], time_range, now: pytz.datetime.datetime):
+        
+        logger.debug(f"Fetching flexibility plans for {len(houses)} subcentrals in time_range")
+        
+        return self._gather_by_customer(houses, time_range, now, self._FLEXIBILITY_PLANS_QUERY_TEMPLATE, self._FLEXIBILITY_PLANS_COLUMNS)
+
+    # Add for flexibility service
+    def get_dispatches_by_houses(self, houses: typing.List[models.House], time_range, now: pytz.datetime.datetime):
+        
+        logger.debug(f"Fetching dispatch plans for {len(houses)} subcentrals in time_range")
+        
+        return self._gather_by_customer(houses, time_range, now, self._FLEXIBILITY_DISPATCHES_QUERY_TEMPLATE, self._FLEXIBILITY_DISPATCHES_COLUMNS)
+
+    # One query per house, each restricted to its own partition: prepared statements carry the routing key,
+    # so the driver's token-aware policy sends them straight to a replica. At most __BATCH_CONCURRENCY are in flight.
+    def _gather_by_houses(self, houses, time_range, now, request, frame):
+        
+        pending = deque()
+        frames = {}
+        
+        def collect():
+            house, parameters, future = pending.popleft()
+            rows = future.result() if future is not None else None
+            
+            try:
+                frames[(house.customer_id, house.subcentral_id)] = frame(house, rows, time_range, now, parameters)
+            except ValueError as e:
+                logger.error(e)
+        
+        for house in houses:
+            query = request(house, time_range, now)
+            
+            if query is None:
+                pending.append((house, None, None))
+            else:
+                template, parameters = query
+                future = self._statements.execute_async(template, parameters, execution_profile = COLUMNAR_PROFILE, fetch_size = FETCH_SIZE)
+                pending.append((house, parameters, future))
+            
+            if len(pending) >= self.__BATCH_CONCURRENCY:
+                collect()
+                
+        while pending:
+            collect()
+        
+        if not frames:
+            return _by_house_frame([], [], utc_index([], name = "tstamp"), pd.DataFrame())
+        
+        return pd.concat(frames, names = ["customer_id", "subcentral_id"]).sort_index()
+
+    # One query per customer and __BATCH_IN_SIZE subcentrals, the rows carry subcentral_id
+    # At most __BATCH_CONCURRENCY in flight, as in _gather_by_houses
+    def _gather_by_customer(self, houses, time_range, now, template, dtypes):
+        
+        mintime = bind_timestamp(now - time_range[0])
+        maxtime = bind_timestamp(now + time_range[1])
+        subcentrals = {}
+        
+        for house in houses:
+            subcentrals.setdefault(house.customer_id, set()).add(house.subcentral_id)
+        
+        pending = deque()
+        customer_ids, subcentral_ids, times, values = [], [], [], []
+        
+        def collect():
+            customer_id, future = pending.popleft()
+            columns = read_columns(future.result(), dtypes)
+            customer_ids.append(np.full(len(columns["subcentral_id"]), customer_id))
+            subcentral_ids.append(columns.pop("subcentral_id"))
+            times.append(columns.pop("ts_start"))
+            values.append(pd.DataFrame(columns))
+        
+        for customer_id, customer_subcentrals in subcentrals.items():
+            customer_subcentrals = sorted(customer_subcentrals)
+            
+            for i in range(0, len(customer_subcentrals), self.__BATCH_IN_SIZE):
+                parameters = {"customer_id": customer_id,
+                              "subcentral_ids": customer_subcentrals[i:i + self.__BATCH_IN_SIZE],
+                              "mintime": mintime,
+                              "maxtime": maxtime}
+                
+                pending.append((customer_id, self._statements.execute_async(template, parameters, execution_profile = COLUMNAR_PROFILE, fetch_size = FETCH_SIZE)))
+                
+                if len(pending) >= self.__BATCH_CONCURRENCY:
+                    collect()
+        
+        while pending:
+            collect()
+        
+        if not values:
+            return _by_house_frame([], [], utc_index([], name = "ts_start"), pd.DataFrame(columns = list(dtypes)[2:]))
+        
+        data = _by_house_frame(np.concatenate(customer_ids), np.concatenate(subcentral_ids),
+                               utc_index(np.concatenate(times), name = "ts_start"), pd.concat(values, ignore_index = True))
+        
+        if data.empty:
+            logger.warning(f"No {data.columns[0]} is found for {len(houses)} subcentrals")
+        
+        return data.sort_index()
+
     def write_schedule_for_house(self, house: models.House, output: DataFrame, house_repo: HouseModelRepository):
         
         _, _, config, _, _ = house_repo.get_parameters_by_house(house)
         timestep = config.timestep
+        record = record_time()
+        timestamp = write_time()
+        
+        changed = self._changed_rows(self._LAST_SCHEDULE_QUERY_TEMPLATE, house, output, timestep, self._SCHEDULE_VALUES)
         
-        logger.info(f"Writing schedule data for cid = {house.customer_id}, sid = {house.subcentral_id}")
+        logger.info(f"Writing schedule data for cid = {house.customer_id}, sid = {house.subcentral_id}: {changed.sum()} of {len(output)} rows changed")
+
+        if output['fallback'].any():
+            logger.warning(f"The schedule of cid = {house.customer_id}, sid = {house.subcentral_id} is the fallback schedule, see mpc/fallback.py")
 
-        for index, row in output.iterrows():
+        rows = []
+        changed_output = output[changed]
+        tstamp_record = format_timestamp(record)
+        ts_starts = format_timestamps(changed_output.index)
+        ts_ends = format_timestamps(changed_output.index + timedelta(seconds = timestep))
+
+        for row, ts_start, ts_end in zip(changed_output.to_dict('records'), ts_starts, ts_ends):
             
             model_output = models.ModelOutput(                
             customer_id = house.customer_id,
             subcentral_id = house.subcentral_id,
-            tstamp_record = datetime.now(pytz.timezone('UTC')).strftime(self.__DATETIME_FORMAT),
-            ts_start = index.strftime(self.__DATETIME_FORMAT),
-            ts_end = (index + timedelta(seconds = timestep)).strftime(self.__DATETIME_FORMAT),
+            tstamp_record = tstamp_record,
+            ts_start = ts_start,
+            ts_end = ts_end,
             out_temp = row['out_temp_with_deviation'],
             baseline_power = row['baseline_power'],
             scheduled_power = row['power'],
@@ -298,12 +529,14 @@ class CassandraHouseRepository(HouseSensorRepository):
             inflow_temp_offset = row['inflow_temp_offset'],
             indoor_temp_estimate = row['indoor_temperature'],
             solar_irradiation = row['solar'],
-            scheduled_inflow_temp = row['new_inflow_temp']
+            scheduled_inflow_temp = row['new_inflow_temp'],
+            fallback = bool(row['fallback'])
             )
                                    
-            query = self._WRITE_QUERY_TEMPLATE.format(model_output_json = model_output.to_json())
-               
-            self.session.execute(query)
+            rows.append(((house.customer_id, house.subcentral_id), {"model_output_json": model_output.to_json(), "write_time": timestamp}))
+
+        self._writer.write(self._WRITE_QUERY_TEMPLATE, rows)
+        self._writer.skip(self._WRITE_QUERY_TEMPLATE, len(output) - len(rows))
             
         logger.info("Finished writing schedules")
             
@@ -314,46 +547,130 @@ class CassandraHouseRepository(HouseSensorRepository):
         dynamic_model = models.DynamicIndoorModel(                
         customer_id = house.customer_id,
         subcentral_id = house.subcentral_id,
-        tstamp_record = datetime.now(pytz.timezone('UTC')).strftime(self.__DATETIME_FORMAT),
+        tstamp_record = format_timestamp(record_time()),
         intercept = model_intercept,
         variable_coef = model_coef)
                    
-        query = self._WRITE_MODEL_QUERY_TEMPLATE.format(dynamic_model_json = dynamic_model.to_json())
+        rows = [((house.customer_id, house.subcentral_id), {"dynamic_model_json": dynamic_model.to_json()})]
            
-        self.session.execute(query)
+        self._writer.write(self._WRITE_MODEL_QUERY_TEMPLATE, rows)
             
         logger.debug("Finished writing dynamic model")         
 
+    # model: 'plan' or 'execution', None if there is no solution to start from
+    def get_warm_start_by_house(self, house: models.House, model):
+        
+        parameters = {"customer_id": house.customer_id,
+                      "subcentral_id": house.subcentral_id,
+                      "model": model}
+
+        for row in self._statements.execute(self._WARM_START_QUERY_TEMPLATE, parameters):
+            return WarmStart.from_json(row.solution)
+        
+        logger.debug(f"No {model} warm start is found for cid = {house.customer_id}, sid = {house.subcentral_id}")
+
+        return None
+    
+    def write_warm_start_for_house(self, house: models.House, model, warm_start: WarmStart):
+        
+        if warm_start is None:
+            return
+        
+        logger.debug(f"Writing {model} warm start for cid = {house.customer_id}, sid = {house.subcentral_id}")
+        
+        row = models.MPCWarmStart(
+        customer_id = house.customer_id,
+        subcentral_id = house.subcentral_id,
+        model = model,
+        tstamp_record = format_timestamp(record_time()),
+        solution = warm_start.to_json())
+        
+        self._writer.write(self._WRITE_WARM_START_QUERY_TEMPLATE, [((house.customer_id, house.subcentral_id), {"warm_start_json": row.to_json()})])
+
     # Add for flexibility service
     def write_plan_for_house(self, house: models.House, output: DataFrame, house_repo: HouseModelRepository):
         
         _, _, config, _, _ = house_repo.get_parameters_by_house(house)
         timestep = config.timestep
+        record = record_time()
+        timestamp = write_time()
+        
+        changed = self._changed_rows(self._LAST_PLAN_QUERY_TEMPLATE, house, output, timestep, self._PLAN_VALUES)
         
-        logger.info(f"Writing flexibility plan data for cid = {house.customer_id}, sid = {house.subcentral_id}")
+        logger.info(f"Writing flexibility plan data for cid = {house.customer_id}, sid = {house.subcentral_id}: {changed.sum()} of {len(output)} rows changed")
+
+        if output['fallback'].any():
+            logger.warning(f"The flexibility plan of cid = {house.customer_id}, sid = {house.subcentral_id} is the fallback schedule, see mpc/fallback.py")
 
-        for index, row in output.iterrows():
+        rows = []
+        changed_output = output[changed]
+        tstamp_record = format_timestamp(record)
+        ts_starts = format_timestamps(changed_output.index)
+        ts_ends = format_timestamps(changed_output.index + timedelta(seconds = timestep))
+
+        for row, ts_start, ts_end in zip(changed_output.to_dict('records'), ts_starts, ts_ends):
             
             plan = models.Plan(                
             customer_id = house.customer_id,
             subcentral_id = house.subcentral_id,
             grid_zone = house.grid_zone,
-            tstamp_record = datetime.now(pytz.timezone('UTC')).strftime(self.__DATETIME_FORMAT),
-            ts_start = index.strftime(self.__DATETIME_FORMAT),
-            ts_end = (index + timedelta(seconds = timestep)).strftime(self.__DATETIME_FORMAT),
+            tstamp_record = tstamp_record,
+            ts_start = ts_start,
+            ts_end = ts_end,
             outside_temperature = row['out_temp_with_deviation'],
             heating_baseline = row['baseline_power'],
             heating_power = row['power'],
             power_offset = row['power_offset'],
-            average_indoor_temperature = row['indoor_temperature']
+            average_indoor_temperature = row['indoor_temperature'],
+            fallback = bool(row['fallback'])
             )
                                     
-            query = self._WRITE_PLAN_QUERY_TEMPLATE.format(plan_json = plan.to_json())
-               
-            self.session.execute(query)
+            rows.append(((house.customer_id, house.subcentral_id), {"plan_json": plan.to_json(), "write_time": timestamp}))
+
+        self._writer.write(self._WRITE_PLAN_QUERY_TEMPLATE, rows)
+        self._writer.skip(self._WRITE_PLAN_QUERY_TEMPLATE, len(output) - len(rows))
             
         logger.info("Finished writing plans")
 
+    # Mask of the output rows that differ from the last written rows of the horizon: missing rows, another ts_end or
+    # grid zone, or a value that moved by more than write_tolerance. One read per house, the horizon is a single slice.
+    def _changed_rows(self, template, house: models.House, output: DataFrame, timestep, values):
+        
+        changed = np.ones(len(output), dtype = bool)
+        
+        if self.write_tolerance is None or output.empty:
+            return changed
+        
+        index = output.index.tz_convert('UTC')
+        parameters = {"customer_id": house.customer_id,
+                      "subcentral_id": house.subcentral_id,
+                      "grid_zone": house.grid_zone,
+                      "mintime": bind_timestamp(index.min().to_pydatetime()),
+                      "maxtime": index.max().to_pydatetime()}
+        
+        dtypes = dict({"ts_start": TIMESTAMP, "ts_end": TIMESTAMP, "grid_zone": float}, **{column: float for column in values})
+        
+        if "grid_zone" not in template:
+            dtypes.pop("grid_zone")
+        
+        rows = self._statements.execute(template, parameters, execution_profile = COLUMNAR_PROFILE, fetch_size = FETCH_SIZE)
+        last = time_indexed_frame(read_columns(rows, dtypes), "ts_start")
+        last = last[~last.index.duplicated(keep = 'last')]
+        
+        written = index.isin(last.index)
+        last = last.reindex(index)
+        
+        unchanged = written & (utc_index(last["ts_end"].to_numpy()) == index + timedelta(seconds = timestep))
+        
+        if "grid_zone" in last:
+            unchanged &= last["grid_zone"].to_numpy() == house.grid_zone
+        
+        for column, output_column in values.items():
+            unchanged &= np.isclose(output[output_column].to_numpy(dtype = float), last[column].to_numpy(dtype = float),
+                                    rtol = self.__FLOAT_RTOL, atol = self.write_tolerance, equal_nan = True)
+        
+        return changed & ~unchanged
+
     # Add for flexibility service
     def write_dispatch_for_house(self, house: models.House, output: DataFrame, house_repo: HouseModelRepository):
         
@@ -362,21 +679,26 @@ class CassandraHouseRepository(HouseSensorRepository):
         
         logger.info(f"Writing flexibility dispatch data for cid = {house.customer_id}, sid = {house.subcentral_id}")
 
-        for index, row in output.iterrows():
+        rows = []
+        tstamp_record = format_timestamp(record_time())
+        ts_starts = format_timestamps(output.index)
+        ts_ends = format_timestamps(output.index + timedelta(seconds = timestep))
+
+        for row, ts_start, ts_end in zip(output.to_dict('records'), ts_starts, ts_ends):
             
             dispatch = models.Dispatch(                
             customer_id = house.customer_id,
             subcentral_id = house.subcentral_id,
             grid_zone = house.grid_zone,
-            tstamp_record = datetime.now(pytz.timezone('UTC')).strftime(self.__DATETIME_FORMAT),
-            ts_start = index.strftime(self.__DATETIME_FORMAT),
-            ts_end = (index + timedelta(seconds = timestep)).strftime(self.__DATETIME_FORMAT),
+            tstamp_record = tstamp_record,
+            ts_start = ts_start,
+            ts_end = ts_end,
             power_offset = row['subcentral_dispatch']
             )
                                    
-            query = self._WRITE_DISPATCH_QUERY_TEMPLATE.format(dispatch_json = dispatch.to_json())
-               
-            self.session.execute(query)
+            rows.append(((house.customer_id, house.subcentral_id), {"dispatch_json": dispatch.to_json()}))
+
+        self._writer.write(self._WRITE_DISPATCH_QUERY_TEMPLATE, rows)
             
         logger.info("Finished writing dispatch")
 
@@ -387,24 +709,29 @@ class CassandraHouseRepository(HouseSensorRepository):
 
         logger.info(f"Writing report data for cid = {house.customer_id}, sid = {house.subcentral_id}")
 
-        for index, row in output.iterrows():
+        rows = []
+        tstamp_record = format_timestamp(record_time())
+        ts_starts = format_timestamps(output.index)
+        ts_ends = format_timestamps(output.index + timedelta(seconds = timestep))
+
+        for row, ts_start, ts_end in zip(output.to_dict('records'), ts_starts, ts_ends):
             
             report = models.Report(                
             customer_id = house.customer_id,
             subcentral_id = house.subcentral_id,
             grid_zone = house.grid_zone,
-            tstamp_record = datetime.now(pytz.timezone('UTC')).strftime(self.__DATETIME_FORMAT),
-            ts_start = index.strftime(self.__DATETIME_FORMAT),
-            ts_end = (index + timedelta(seconds = timestep)).strftime(self.__DATETIME_FORMAT),
+            tstamp_record = tstamp_record,
+            ts_start = ts_start,
+            ts_end = ts_end,
             power_offset = row['power_offset'],
             heating_baseline = row['baseline_power'],
             heating_power = row['heat_power'],
             average_indoor_temperature = row['average_indoor_temperature']
             )
                              
-            query = self._WRITE_REPORT_QUERY_TEMPLATE.format(report_json = report.to_json())
-               
-            self.session.execute(query)
+            rows.append(((house.customer_id, house.subcentral_id), {"report_json": report.to_json()}))
+
+        self._writer.write(self._WRITE_REPORT_QUERY_TEMPLATE, rows)
             
         logger.info("Finished writing report")  
 
@@ -412,65 +739,82 @@ class CassandraHouseRepository(HouseSensorRepository):
 class CassandraWeatherRepository(WeatherRepository):
 
     _WEATHER_QUERY_TEMPLATE = '''
-        SELECT JSON * FROM flexheat.darksky_forecast
-         WHERE location = '{location}'
-            AND timestamp >= '{mintime}'
-            AND timestamp <= '{maxtime}'
+        SELECT timestamp AS tstamp, temperature AS forecast_outside_temp, total_cloud_cover AS forecast_cloud_cover
+          FROM flexheat.darksky_forecast
+         WHERE location = :location
+            AND timestamp >= :mintime
+            AND timestamp <= :maxtime
             ALLOW FILTERING
     '''
     _TEMP_DEVIATION_QUERY_TEMPLATE = '''
-        SELECT JSON * FROM flexheat.outside_temperature_forecast
-         WHERE customer_id = {customer_id}
-            AND subcentral_id = {subcentral_id}
-            AND timestamp >= '{mintime}'
-            AND timestamp <= '{maxtime}'
+        SELECT timestamp AS tstamp, measure_forecast_deviation
+          FROM flexheat.outside_temperature_forecast
+         WHERE customer_id = :customer_id
+            AND subcentral_id = :subcentral_id
+            AND timestamp >= :mintime
+            AND timestamp <= :maxtime
             ALLOW FILTERING
     '''
     
+    _WEATHER_COLUMNS = {"tstamp": TIMESTAMP, "forecast_outside_temp": float, "forecast_cloud_cover": float}
+    _TEMP_DEVIATION_COLUMNS = {"tstamp": TIMESTAMP, "measure_forecast_deviation": float}
+    
     _WRITE_QUERY_TEMPLATE = '''
         INSERT INTO flexheat.outside_temperature_forecast JSON 
-        '{deviation_forecast_json}'
+        :deviation_forecast_json
     ''' 
        
     __TIMEZONE = pytz.timezone('UTC')
-    __DATETIME_FORMAT = '%Y-%m-%dT%H:%M:00Z'
 
     def __init__(self, session):
         
         self.session = session
+        self._statements = PreparedStatementRegistry.for_session(session)
+        self._writer = BulkWriter.for_session(session)
+        self.weather_cache = WindowCache.for_session(session, "weather_forecast") # Keyed by location
         
     def get_weather_by_location(self, house: models.House, time_range, now: pytz.datetime.datetime):
         
-        now = now
+        request = self._weather_request(house, time_range, now)
+        
+        if request is None:
+            return self._weather_frame(house, None, time_range, now)
+        
+        template, parameters = request
+        rows = self._statements.execute(template, parameters, execution_profile = COLUMNAR_PROFILE, fetch_size = FETCH_SIZE)
+        
+        return self._weather_frame(house, rows, time_range, now, parameters)
+
+    # Forecasts are shared by all houses of a location, the union of the requested windows is fetched once
+    def _weather_request(self, house: models.House, time_range, now: pytz.datetime.datetime):
+        
+        mintime = bind_timestamp(now - time_range[0])
+        maxtime = bind_timestamp(now + time_range[1])
+        window = self.weather_cache.window(house.location, mintime, maxtime)
+        
+        if window is None:
+            logger.debug(f"Weather data for {house.location} in time_range is cached")
+            return None
+        
         logger.info(f"Fetching weather data for {house.location} in time_range")
 
-        mintime = now - time_range[0]
-        maxtime = now + time_range[1]
-        query = self._WEATHER_QUERY_TEMPLATE.format(location=house.location, \
-                                                    mintime=mintime.strftime(self.__DATETIME_FORMAT), \
-                                                    maxtime=maxtime.strftime(self.__DATETIME_FORMAT))
+        parameters = {"location": house.location,
+                      "mintime": window[0],
+                      "maxtime": window[1]}
 
-        dictionary ={"tstamp":[],"forecast_outside_temp":[], "forecast_cloud_cover":[]}
-        print(query)
+        return self._WEATHER_QUERY_TEMPLATE, parameters
 
-        rows = self.session.execute(query)
+    def _weather_frame(self, house: models.House, rows, time_range, now: pytz.datetime.datetime, parameters = None):
+
+        if rows is not None:
+            forecast = time_indexed_frame(read_columns(rows, self._WEATHER_COLUMNS), "tstamp")
+            self.weather_cache.store(house.location, parameters["mintime"], parameters["maxtime"], forecast)
+        
+        data = self.weather_cache.slice(house.location, bind_timestamp(now - time_range[0]), bind_timestamp(now + time_range[1]))
                 
-        if len(rows._current_rows) == 0:
+        if data.empty:
                     
             raise ValueError(f"No weather forecast is found for cid = {house.customer_id}, sid = {house.subcentral_id}")
-        
-        for row in rows:
-            
-            weather_forecast = json.loads(row.json)
-                        
-            dictionary["tstamp"].append(weather_forecast["timestamp"])
-            dictionary["forecast_outside_temp"].append(weather_forecast["temperature"])
-            dictionary["forecast_cloud_cover"].append(weather_forecast["total_cloud_cover"])
-            
-        data = pd.DataFrame(dictionary)
-        data.set_index("tstamp", inplace = True) 
-        data.index = pd.to_datetime(data.index)
-        data.sort_index(ascending = True, inplace = True)
 
         logger.warning(f"{data.forecast_outside_temp.isnull().sum()} null forecast_outside_temp out of {len(data)}")    
         logger.warning(f"{data.forecast_cloud_cover.isnull().sum()} null forecast_cloud_cover out of {len(data)}")    
@@ -479,38 +823,33 @@ class CassandraWeatherRepository(WeatherRepository):
 
     def get_temp_deviation_for_house(self, house: models.House, time_range, now: pytz.datetime.datetime):
         
-        now = now
+        template, parameters = self._temp_deviation_request(house, time_range, now)
+        rows = self._statements.execute(template, parameters, execution_profile = COLUMNAR_PROFILE, fetch_size = FETCH_SIZE)
+        
+        return self._temp_deviation_frame(house, rows, time_range, now, parameters)
+
+    def _temp_deviation_request(self, house: models.House, time_range, now: pytz.datetime.datetime):
+        
         logger.info(f"Fetching temp_deviation_for_house for {house.location} in time_range")
 
         mintime = now - time_range[0]
         maxtime = now + time_range[1]
-        query = self._TEMP_DEVIATION_QUERY_TEMPLATE.format(customer_id = house.customer_id, subcentral_id = house.subcentral_id, \
-                                                    mintime=mintime.strftime(self.__DATETIME_FORMAT), \
-                                                    maxtime=maxtime.strftime(self.__DATETIME_FORMAT))
+        parameters = {"customer_id": house.customer_id,
+                      "subcentral_id": house.subcentral_id,
+                      "mintime": bind_timestamp(mintime),
+                      "maxtime": bind_timestamp(maxtime)}
+
+        return self._TEMP_DEVIATION_QUERY_TEMPLATE, parameters
 
-        dictionary ={"tstamp":[],"measure_forecast_deviation":[]}
-        print(query)
+    def _temp_deviation_frame(self, house: models.House, rows, time_range, now: pytz.datetime.datetime, parameters = None):
 
-        rows = self.session.execute(query)
+        data = time_indexed_frame(read_columns(rows, self._TEMP_DEVIATION_COLUMNS), "tstamp")
                 
-        if len(rows._current_rows) == 0:
+        if data.empty:
                     
             logger.info(f"No deviation forecast is found for cid = {house.customer_id}, sid = {house.subcentral_id}")
-            
-            data = pd.DataFrame(dictionary)
         
         else:
-            for row in rows:
-                
-                forecast = json.loads(row.json)
-                            
-                dictionary["tstamp"].append(forecast["timestamp"])
-                dictionary["measure_forecast_deviation"].append(forecast["measure_forecast_deviation"])
-                
-            data = pd.DataFrame(dictionary)
-            data.set_index("tstamp", inplace = True) 
-            data.index = pd.to_datetime(data.index)
-            data.sort_index(ascending = True, inplace = True)
             logger.warning(f"{data.measure_forecast_deviation.isnull().sum()} null measure_forecast_deviation out of {len(data)}")    
         
         return data 
@@ -522,50 +861,105 @@ class CassandraWeatherRepository(WeatherRepository):
         
         logger.info(f"Writing forecast outside temperature deviation for cid = {house.customer_id}, sid = {house.subcentral_id}")
 
-        for index, row in forecast.iterrows():
+        rows = []
+        tstamp_record = format_timestamp(record_time())
+
+        for row, timestamp in zip(forecast.to_dict('records'), format_timestamps(forecast.index)):
             
             deviation_forecast = models.OutTempDeviationForecast(                
             customer_id = house.customer_id,
             subcentral_id = house.subcentral_id,
-            timestamp = index.strftime(self.__DATETIME_FORMAT),
+            timestamp = timestamp,
             measure_forecast_deviation = row['forecast_devaition'],
-            tstamp_record = datetime.now(pytz.timezone('UTC')).strftime(self.__DATETIME_FORMAT)
+            tstamp_record = tstamp_record
             )
                     
-            query = self._WRITE_QUERY_TEMPLATE.format(deviation_forecast_json = deviation_forecast.to_json())
-               
-            self.session.execute(query)
+            rows.append(((house.customer_id, house.subcentral_id), {"deviation_forecast_json": deviation_forecast.to_json()}))
+
+        self._writer.write(self._WRITE_QUERY_TEMPLATE, rows)
             
         logger.info("Finished writing forecast")
 
 # Read/write data for subcentral/building and weather
 class CassandraRepository(CassandraHouseRepository, CassandraWeatherRepository):
     
+    def __init__(self, session, write_tolerance = CassandraHouseRepository.WRITE_TOLERANCE):
+        
+        CassandraHouseRepository.__init__(self, session, write_tolerance)
+        CassandraWeatherRepository.__init__(self, session)
+    
+    # Issue the reads of one house with execute_async and build the frames once all of them are sent
+    # Identical requests (same template and bound values) are executed once and their frame is shared
+    def _gather_by_house(self, house, time_range, now, readers):
+        
+        futures = {}
+        requests = []
+        
+        for reader, (request, frame) in enumerate(readers):
+            query = request(house, time_range, now)
+            
+            # Served without a query (e.g. from a cache)
+            if query is None:
+                requests.append((reader, frame, None))
+                continue
+            
+            template, parameters = query
+            key = (template, tuple(sorted(parameters.items())))
+            
+            if key not in futures:
+                futures[key] = self._statements.execute_async(template, parameters, execution_profile = COLUMNAR_PROFILE, fetch_size = FETCH_SIZE)
+                
+            requests.append((key, frame, parameters))
+            
+        frames = {}
+        
+        for key, frame, parameters in requests:
+            if key not in frames:
+                rows = futures[key].result() if parameters is not None else None
+                frames[key] = frame(house, rows, time_range, now, parameters)
+        
+        return [frames[key] for key, _, _ in requests]
+    
     def get_all_by_house(self, house, time_range, now):
-        data = self.get_weather_by_location(house, time_range, now)
-        data = data.join(self.get_temp_deviation_for_house(house, time_range, now), how = 'outer')
-        data = data.join(self.get_data_for_subcentral(house, time_range, now), how = 'outer')
-        data = data.join(self.get_data_for_building(house, time_range, now), how = 'outer')
+        weather, deviation, subcentral, building = self._gather_by_house(house, time_range, now, [
+            (self._weather_request, self._weather_frame),
+            (self._temp_deviation_request, self._temp_deviation_frame),
+            (self._subcentral_request, self._subcentral_frame),
+            (self._building_request, self._building_frame)])
+        
+        data = weather
+        data = data.join(deviation, how = 'outer')
+        data = data.join(subcentral, how = 'outer')
+        data = data.join(building, how = 'outer')
 
         return data
     
     # Add for mpc with auto dynamic model 
     # Resample subcentral data (inflow_temp, measured_outside_temp) and building data (average_indoor_temperature) by timestep
     def get_all_by_house_resample(self, house, time_range, now, timestep):
-        data = self.get_weather_by_location(house, time_range, now)        
-        if not self.get_temp_deviation_for_house(house, time_range, now).empty:
-            data = data.join(self.get_temp_deviation_for_house(house, time_range, now).resample(timedelta(seconds = timestep)).mean(), how = 'outer')
+        weather, deviation, subcentral, building = self._gather_by_house(house, time_range, now, [
+            (self._weather_request, self._weather_frame),
+            (self._temp_deviation_request, self._temp_deviation_frame),
+            (self._subcentral_request, self._subcentral_frame),
+            (self._building_request, self._building_frame)])
+        
+        data = weather
+        if not deviation.empty:
+            data = data.join(deviation.resample(timedelta(seconds = timestep)).mean(), how = 'outer')
 
-        data = data.join(self.get_data_for_subcentral(house, time_range, now).resample(timedelta(seconds = timestep)).mean(), how = 'outer')
-        data = data.join(self.get_data_for_building(house, time_range, now).resample(timedelta(seconds = timestep)).first(), how = 'outer')
+        data = data.join(subcentral.resample(timedelta(seconds = timestep)).mean(), how = 'outer')
+        data = data.join(building.resample(timedelta(seconds = timestep)).first(), how = 'outer')
 
         return data
 
     # Add for mpc with auto dynamic model
     # Get subcentral data (inflow_temp) and building data (average_indoor_temperature) before planning start  
     def get_initial_by_house(self, house, time_range, now):
-        data = self.get_data_for_subcentral(house, time_range, now)
-        data = data.join(self.get_data_for_building(house, time_range, now), how = 'outer')
+        subcentral, building = self._gather_by_house(house, time_range, now, [
+            (self._subcentral_request, self._subcentral_frame),
+            (self._building_request, self._building_frame)])
+        
+        data = subcentral.join(building, how = 'outer')
 
         return data
 
@@ -574,46 +968,54 @@ class CassandraRepository(CassandraHouseRepository, CassandraWeatherRepository):
 class CassandraAggregateRepository():
     
     _GRID_PEAK_QUERY_TEMPLATE = '''
-        SELECT JSON * FROM flexheat.peak_hours
-         WHERE customer_id = {customer_id}
-            AND grid_zone = {grid_zone}
-            AND ts_start >= '{mintime}'
-            AND ts_start <= '{maxtime}'
+        SELECT ts_start, ts_end
+          FROM flexheat.peak_hours
+         WHERE customer_id = :customer_id
+            AND grid_zone = :grid_zone
+            AND ts_start >= :mintime
+            AND ts_start <= :maxtime
             ALLOW FILTERING
     '''   
     
     _GRID_PLAN_QUERY_TEMPLATE = '''
-        SELECT JSON * FROM flexheat.aggregate_flexibility_plan
-         WHERE customer_id = {customer_id}
-            AND grid_zone = {grid_zone}
-            AND ts_start >= '{mintime}'
-            AND ts_start <= '{maxtime}'
+        SELECT ts_start, power_offset AS aggregate_plan
+          FROM flexheat.aggregate_flexibility_plan
+         WHERE customer_id = :customer_id
+            AND grid_zone = :grid_zone
+            AND ts_start >= :mintime
+            AND ts_start <= :maxtime
             ALLOW FILTERING
     '''    
     _GRID_DISPATCH_QUERY_TEMPLATE = '''
-        SELECT JSON * FROM flexheat.aggregate_flexibility_dispatch
-         WHERE customer_id = {customer_id}
-            AND grid_zone = {grid_zone}
-            AND ts_start >= '{mintime}'
-            AND ts_start <= '{maxtime}'
+        SELECT ts_start, power_offset AS aggregate_dispatch
+          FROM flexheat.aggregate_flexibility_dispatch
+         WHERE customer_id = :customer_id
+            AND grid_zone = :grid_zone
+            AND ts_start >= :mintime
+            AND ts_start <= :maxtime
             ALLOW FILTERING
     '''    
     
+    _GRID_PEAK_COLUMNS = {"ts_start": TIMESTAMP, "ts_end": TIMESTAMP}
+    _GRID_PLAN_COLUMNS = {"ts_start": TIMESTAMP, "aggregate_plan": float}
+    _GRID_DISPATCH_COLUMNS = {"ts_start": TIMESTAMP, "aggregate_dispatch": float}
+    
     _WRITE_PLAN_QUERY_TEMPLATE = '''
         INSERT INTO flexheat.aggregate_flexibility_plan JSON 
-        '{output_json}'
+        :output_json
     '''    
     
     _WRITE_REPORT_QUERY_TEMPLATE = '''
         INSERT INTO flexheat.aggregate_flexibility_report JSON 
-        '{output_json}'
+        :output_json
     '''   
     
-    __DATETIME_FORMAT = '%Y-%m-%dT%H:%M:00Z'
     
     def __init__(self, session):
         
         self.session = session 
+        self._statements = PreparedStatementRegistry.for_session(session)
+        self._writer = BulkWriter.for_session(session)
         
     def get_peak_by_customer(self, customer, grid, time_range, now: pytz.datetime.datetime):
                 
@@ -622,36 +1024,19 @@ class CassandraAggregateRepository():
         maxtime = now + time_range[1]
         logger.debug(f"Fetching peak hours for customer_id = {customer}, grid_zone = {grid}")
 
-        query = self._GRID_PEAK_QUERY_TEMPLATE.format(customer_id = customer, \
-                                                      grid_zone = grid, \
-                                                      mintime=mintime.strftime(self.__DATETIME_FORMAT), \
-                                                      maxtime=maxtime.strftime(self.__DATETIME_FORMAT))
-
-        print(query)
+        parameters = {"customer_id": customer,
+                      "grid_zone": grid,
+                      "mintime": bind_timestamp(mintime),
+                      "maxtime": bind_timestamp(maxtime)}
 
-        dictionary ={"ts_start":[], "ts_end":[]}
+        rows = self._statements.execute(self._GRID_PEAK_QUERY_TEMPLATE, parameters, execution_profile = COLUMNAR_PROFILE, fetch_size = FETCH_SIZE)
+        columns = read_columns(rows, self._GRID_PEAK_COLUMNS)
 
-        rows = self.session.execute(query)
+        data = pd.DataFrame({name: utc_index(values) for name, values in columns.items()})
         
-        if len(rows._current_rows) == 0:
+        if data.empty:
                     
             logger.warning(f"No peak hour is found for cid = {customer}, grid_zone = {grid}")
-            data = pd.DataFrame(dictionary)
-       
-        else:
-            for row in rows:          
-                      
-                schedules = json.loads(row.json)                
-                dictionary["ts_start"].append(schedules["ts_start"])
-                dictionary["ts_end"].append(schedules["ts_end"]) 
-                            
-            data = pd.DataFrame(dictionary)
-#            data.set_index("ts_start", inplace = True) 
-#            data.index = pd.to_datetime(data.index)
-#            data.sort_index(ascending = True, inplace = True)
-#            data = data[data.index <= now]
-            data['ts_start']= pd.to_datetime(data['ts_start']) 
-            data['ts_end']= pd.to_datetime(data['ts_end']) 
 
         return data  
             
@@ -662,34 +1047,19 @@ class CassandraAggregateRepository():
         maxtime = now + time_range[1]
         logger.debug(f"Fetching flexibility plan for customer_id = {customer}, grid_zone = {grid}")
 
-        query = self._GRID_PLAN_QUERY_TEMPLATE.format(customer_id = customer, \
-                                                      grid_zone = grid, \
-                                                      mintime=mintime.strftime(self.__DATETIME_FORMAT), \
-                                                      maxtime=maxtime.strftime(self.__DATETIME_FORMAT))
-
-        print(query)
-
-        dictionary ={"ts_start":[], "aggregate_plan":[]}
+        parameters = {"customer_id": customer,
+                      "grid_zone": grid,
+                      "mintime": bind_timestamp(mintime),
+                      "maxtime": bind_timestamp(maxtime)}
 
-        rows = self.session.execute(query)
+        rows = self._statements.execute(self._GRID_PLAN_QUERY_TEMPLATE, parameters, execution_profile = COLUMNAR_PROFILE, fetch_size = FETCH_SIZE)
+        data = time_indexed_frame(read_columns(rows, self._GRID_PLAN_COLUMNS), "ts_start")
         
-        if len(rows._current_rows) == 0:
+        if data.empty:
                     
             logger.warning(f"No flexibility plan is found for cid = {customer}, grid_zone = {grid}")
-            data = pd.DataFrame(dictionary)
-       
         else:
-            for row in rows:          
-                      
-                schedules = json.loads(row.json)                
-                dictionary["ts_start"].append(schedules["ts_start"])
-                dictionary["aggregate_plan"].append(schedules["power_offset"]) 
-                            
-            data = pd.DataFrame(dictionary)
-            data.set_index("ts_start", inplace = True) 
-            data.index = pd.to_datetime(data.index)
-            data.sort_index(ascending = True, inplace = True)
-            logger.warning(f"{data.aggregate_plan.isnull().sum()} null aggregate_plan out of {len(data)}")    
+            logger.warning(f"{data.aggregate_plan.isnull().sum()} null aggregate_plan out of {len(data)}")
       
         return data           
     
@@ -701,34 +1071,19 @@ class CassandraAggregateRepository():
         maxtime = now + time_range[1]
         logger.debug(f"Fetching dispatch plan for customer_id = {customer}, grid_zone = {grid}")
 
-        query = self._GRID_DISPATCH_QUERY_TEMPLATE.format(customer_id = customer, \
-                                                          grid_zone = grid, \
-                                                          mintime=mintime.strftime(self.__DATETIME_FORMAT), \
-                                                          maxtime=maxtime.strftime(self.__DATETIME_FORMAT))
-
-        print(query)
-
-        dictionary ={"ts_start":[], "aggregate_dispatch":[]}
+        parameters = {"customer_id": customer,
+                      "grid_zone": grid,
+                      "mintime": bind_timestamp(mintime),
+                      "maxtime": bind_timestamp(maxtime)}
 
-        rows = self.session.execute(query)
+        rows = self._statements.execute(self._GRID_DISPATCH_QUERY_TEMPLATE, parameters, execution_profile = COLUMNAR_PROFILE, fetch_size = FETCH_SIZE)
+        data = time_indexed_frame(read_columns(rows, self._GRID_DISPATCH_COLUMNS), "ts_start")
         
-        if len(rows._current_rows) == 0:
+        if data.empty:
                     
             logger.warning(f"No dispatch is found for cid = {customer}, grid_zone = {grid}")
-            data = pd.DataFrame(dictionary)
-       
         else:
-            for row in rows:          
-                      
-                schedules = json.loads(row.json)                
-                dictionary["ts_start"].append(schedules["ts_start"])
-                dictionary["aggregate_dispatch"].append(schedules["power_offset"]) 
-                            
-            data = pd.DataFrame(dictionary)
-            data.set_index("ts_start", inplace = True) 
-            data.index = pd.to_datetime(data.index)
-            data.sort_index(ascending = True, inplace = True)
-            logger.warning(f"{data.aggregate_dispatch.isnull().sum()} null powe_offset out of {len(data)}")    
+            logger.warning(f"{data.aggregate_dispatch.isnull().sum()} null powe_offset out of {len(data)}")
       
         return data           
         
@@ -739,19 +1094,25 @@ class CassandraAggregateRepository():
         
         logger.info(f"Writing aggregate flexibility plan data for energy company customer_id = {customer}, grid_zone = {grid}")
 
-        for index, row in aggregate_plan.iterrows():
+        rows = []
+        tstamp_record = format_timestamp(record_time())
+        ts_starts = format_timestamps(aggregate_plan.index)
+        ts_ends = format_timestamps(aggregate_plan.index + timedelta(seconds = timestep))
+
+        # The frame also holds one power_offset column per subcentral, only the aggregate is written
+        for power_offset, ts_start, ts_end in zip(aggregate_plan['aggregate_power_offset'].tolist(), ts_starts, ts_ends):
             
             output = models.Flexibility(                                        
             customer_id = customer,
             grid_zone = grid,
-            tstamp_record = datetime.now(pytz.timezone('UTC')).strftime(self.__DATETIME_FORMAT),
-            ts_start = index.strftime(self.__DATETIME_FORMAT),
-            ts_end = (index + timedelta(seconds = timestep)).strftime(self.__DATETIME_FORMAT),
-            power_offset = row['aggregate_power_offset']
+            tstamp_record = tstamp_record,
+            ts_start = ts_start,
+            ts_end = ts_end,
+            power_offset = power_offset
             )                         
-            query = self._WRITE_PLAN_QUERY_TEMPLATE.format(output_json = output.to_json())
-               
-            self.session.execute(query)
+            rows.append(((customer, grid), {"output_json": output.to_json()}))
+
+        self._writer.write(self._WRITE_PLAN_QUERY_TEMPLATE, rows)
             
         logger.info("Finished writing plans")   
 
@@ -762,18 +1123,27 @@ class CassandraAggregateRepository():
         
         logger.info(f"Writing aggregate flexibility report data for customer_id = {customer}, grid_zone = {grid}")
 
-        for index, row in aggregate_report.iterrows():
+        rows = []
+        tstamp_record = format_timestamp(record_time())
+        ts_starts = format_timestamps(aggregate_report.index)
+        ts_ends = format_timestamps(aggregate_report.index + timedelta(seconds = timestep))
+
+        # The frame also holds one power_offset column per subcentral, only the aggregate is written
+        for power_offset, ts_start, ts_end in zip(aggregate_report['aggregate_power_offset'].tolist(), ts_starts, ts_ends):
             
             output = models.Flexibility(                                        
             customer_id = customer,
             grid_zone = grid,
-            tstamp_record = datetime.now(pytz.timezone('UTC')).strftime(self.__DATETIME_FORMAT),
-            ts_start = index.strftime(self.__DATETIME_FORMAT),
-            ts_end = (index + timedelta(seconds = timestep)).strftime(self.__DATETIME_FORMAT),
-            power_offset = row['aggregate_power_offset']
+            tstamp_record = tstamp_record,
+            ts_start = ts_start,
+            ts_end = ts_end,
+            power_offset = power_offset
             )                         
-            query = self._WRITE_REPORT_QUERY_TEMPLATE.format(output_json = output.to_json())
-               
-            self.session.execute(query)
+            rows.append(((customer, grid), {"output_json": output.to_json()}))
+
+        self._writer.write(self._WRITE_REPORT_QUERY_TEMPLATE, rows)
             
-        logger.info("Finished writing report")  
\ No newline at end of file
+        logger.info("Finished writing report")
+
+# Name the query metrics after the templates
+label_templates(CassandraHouseRepository, CassandraWeatherRepository, CassandraAggregateRepository)
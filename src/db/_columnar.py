@@ -0,0 +1,148 @@
+'''
+Columnar decoding of query results.
+
+Queries executed with COLUMNAR_PROFILE select only the columns they need with native CQL types
+(no SELECT JSON), and every result page is transposed by columnar_factory into one tuple per column.
+read_columns() streams the pages with an explicit fetch size and appends them to preallocated typed NumPy arrays.
+'''
+
+import time
+import numpy as np
+import pandas as pd
+from db._timecodec import utc_index
+
+COLUMNAR_PROFILE = 'columnar'
+FETCH_SIZE = 5000 # Rows per page of columnar reads
+
+TIMESTAMP = 'datetime64[ms]' # CQL timestamp, decoded by the driver as naive UTC datetime
+
+class ColumnPage:
+
+    def __init__(self, colnames, rows):
+
+        self.colnames = list(colnames)
+        self._length = len(rows)
+
+        if self._length == 0:
+            self.columns = {name: () for name in self.colnames}
+        else:
+            self.columns = dict(zip(self.colnames, zip(*rows)))
+
+    def __len__(self):
+
+        return self._length
+
+    # Row-wise iteration is kept for callers that do not need columns
+    def __iter__(self):
+
+        return zip(*(self.columns[name] for name in self.colnames))
+
+# Row factory for COLUMNAR_PROFILE, see cassandra.cluster.ExecutionProfile.row_factory
+def columnar_factory(colnames, rows):
+
+    return ColumnPage(colnames, rows)
+
+# Yield the pages of a result set one by one
+# The next page is requested before the current one is handed out, so it is decoded while the next one is in flight
+# Results of an instrumented registry (db/_metrics.py) get the following pages reported with the time spent waiting for them
+def stream_pages(result_set):
+
+    future = getattr(result_set, 'response_future', None)
+    record_page = getattr(result_set, 'record_page', None)
+    page = result_set._current_rows
+    more = result_set.has_more_pages
+
+    while True:
+        if more and future is not None:
+            future.start_fetching_next_page()
+
+        yield page
+
+        if not more:
+            break
+
+        if future is not None:
+            start = time.perf_counter()
+            page = future.result()._current_rows
+            more = future.has_more_pages
+
+            if record_page is not None:
+                record_page(page, time.perf_counter() - start)
+
+        else:
+            result_set.fetch_next_page()
+            page = result_set._current_rows
+            more = result_set.has_more_pages
+
+class ColumnBuffer:
+
+    '''
+    Preallocated typed arrays that page chunks are appended to.
+
+    Capacity starts at the expected number of rows and doubles when exceeded,
+    so only one page of Python objects is alive at a time however long the read is.
+    '''
+
+    def __init__(self, dtypes, capacity = FETCH_SIZE):
+
+        self._arrays = {name: np.empty(max(capacity, 1), dtype = dtype) for name, dtype in dtypes.items()}
+        self._size = 0
+
+    def append(self, page: ColumnPage):
+
+        rows = len(page)
+
+        if rows == 0:
+            return
+
+        end = self._size + rows
+        capacity = len(next(iter(self._arrays.values())))
+
+        if end > capacity:
+            capacity = max(2 * capacity, end)
+
+            for name, array in self._arrays.items():
+                grown = np.empty(capacity, dtype = array.dtype)
+                grown[:self._size] = array[:self._size]
+                self._arrays[name] = grown
+
+        for name, array in self._arrays.items():
+            array[self._size:end] = page.columns[name]
+
+        self._size = end
+
+    def __len__(self):
+
+        return self._size
+
+    def columns(self):
+
+        return {name: array[:self._size] for name, array in self._arrays.items()}
+
+# Decode all pages of a result set into one array per column
+# dtypes: {column name: numpy dtype}, null values become NaN/NaT
+def read_columns(result_set, dtypes, expected_rows = None):
+
+    buffer = ColumnBuffer(dtypes, capacity = expected_rows or FETCH_SIZE)
+
+    for page in stream_pages(result_set):
+        if not isinstance(page, ColumnPage):
+            page = ColumnPage(dtypes.keys(), list(page))
+
+        buffer.append(page)
+
+    columns = buffer.columns()
+    record_decoded = getattr(result_set, 'record_decoded', None)
+
+    if record_decoded is not None:
+        record_decoded(sum(array.nbytes for array in columns.values()))
+
+    return columns
+
+# Build a frame indexed by the timestamp column `index`, sorted by time
+def time_indexed_frame(columns, index):
+
+    columns = dict(columns)
+    data = pd.DataFrame(columns, index = utc_index(columns.pop(index), name = index))
+
+    return data.sort_index(ascending = True)
@@ -0,0 +1,183 @@
+from db._prepared import PreparedStatementRegistry
+from db._metrics import label_templates
+from db._cache import CacheStats
+import models
+import threading
+import weakref
+import time
+import json
+import logging
+
+logger = logging.getLogger("__main__")
+
+class HeatCurveStore:
+
+    '''
+    Active heat curves of each subcentral, read once per session.
+
+    The curves of a subcentral are indexed in a 12-slot month lookup when they are loaded,
+    slot m - 1 holds the curve valid in month m. If several active curves are valid in the same month,
+    the first row returned by the query (the latest curve) is kept, as before.
+    The session outlives a lambda run, so the curves of a subcentral or customer are read again once they are
+    older than MAX_AGE, heat curve edits are used from then on.
+    '''
+
+    MAX_AGE = 600 # seconds
+
+    _HEATCURVE_QUERY_TEMPLATE = '''
+        SELECT JSON * FROM flexheat.subcentral_heatcurve
+         WHERE customer_id = :customer_id
+            AND subcentral_id = :subcentral_id
+            AND active = :active
+            ALLOW FILTERING
+    '''
+
+    _CUSTOMER_HEATCURVE_QUERY_TEMPLATE = '''
+        SELECT JSON * FROM flexheat.subcentral_heatcurve
+         WHERE customer_id = :customer_id
+            AND active = :active
+            ALLOW FILTERING
+    '''
+
+    __STORES = weakref.WeakKeyDictionary() # One store per session, stores reach it only weakly through the registry
+
+    def __init__(self, statements: PreparedStatementRegistry, max_age = MAX_AGE):
+
+        self._statements = statements
+        self.max_age = max_age
+        self._months = {} # (customer_id, subcentral_id) -> (loaded_at, 12 slots of (HeatCurve, number of valid curves))
+        self._customers = {} # customer_id -> (loaded_at, number of subcentrals)
+        self._lock = threading.Lock()
+        self.stats = CacheStats()
+
+        HeatCurveStore.__STORES[statements.session] = self
+
+    @classmethod
+    def for_session(cls, session):
+
+        store = cls.__STORES.get(session)
+
+        if store is None:
+            store = cls(PreparedStatementRegistry.for_session(session))
+
+        return store
+
+    def get(self, house: models.House, month):
+
+        key = (house.customer_id, house.subcentral_id)
+        months = self._fresh(self._months.get(key))
+
+        if months is None:
+            self.stats.misses += 1
+            logger.info(f"Fetching heat curve for cid = {house.customer_id}, sid = {house.subcentral_id}")
+
+            rows = self._statements.execute(self._HEATCURVE_QUERY_TEMPLATE, {"customer_id": house.customer_id,
+                                                                              "subcentral_id": house.subcentral_id,
+                                                                              "active": True})
+            months = self._index([json.loads(row.json) for row in rows])
+
+            with self._lock:
+                self._months[key] = (time.monotonic(), months)
+
+        else:
+            self.stats.hits += 1
+
+        if all(slot is None for slot in months):
+
+            raise ValueError(f"No heat curve is found for cid = {house.customer_id}, sid = {house.subcentral_id}")
+
+        slot = months[month - 1]
+
+        if slot is None:
+            raise ValueError(f"No heat curve is found for {house.customer_id, house.subcentral_id} for month {month}, \
+                            please config the heat curve first!")
+
+        heatcurve, count = slot
+
+        if count > 1:
+            logger.warning(f"More than one active heat curve is found for {house.customer_id, house.subcentral_id} for month {month}, \
+                            the latest one will be used.")
+
+        return heatcurve
+
+    # Load the active curves of all subcentrals of the customer with one query
+    def load_customer(self, customer):
+
+        if self._fresh(self._customers.get(customer)) is not None:
+            return 0
+
+        logger.info(f"Preloading heat curves for cid = {customer}")
+
+        rows = self._statements.execute(self._CUSTOMER_HEATCURVE_QUERY_TEMPLATE, {"customer_id": customer, "active": True})
+
+        curves = {}
+
+        for row in rows:
+            heat_curve = json.loads(row.json)
+            curves.setdefault(heat_curve["subcentral_id"], []).append(heat_curve)
+
+        loaded_at = time.monotonic()
+
+        with self._lock:
+            for subcentral, subcentral_curves in curves.items():
+                self._months[(customer, subcentral)] = (loaded_at, self._index(subcentral_curves))
+
+            self._customers[customer] = (loaded_at, len(curves))
+            self.stats.preloaded += len(curves)
+
+        return len(curves)
+
+    # Drop the curves of one house, or all curves if house is None
+    def invalidate(self, house: models.House = None):
+
+        with self._lock:
+            if house is None:
+                self.stats.invalidations += len(self._months)
+                self._months = {}
+                self._customers = {}
+
+            elif self._months.pop((house.customer_id, house.subcentral_id), None) is not None:
+                self.stats.invalidations += 1
+                self._customers.pop(house.customer_id, None)
+
+    # Value of a (loaded_at, value) entry, None if there is none or it is older than max_age
+    def _fresh(self, entry):
+
+        if entry is None or time.monotonic() - entry[0] > self.max_age:
+            return None
+
+        return entry[1]
+
+    # Rows are in query order, the first curve valid in a month wins
+    def _index(self, heat_curves):
+
+        months = [None] * 12
+
+        for heat_curve in heat_curves:
+
+            # There can be different heat curves in different season, e.g. valid from month 10 until month 4
+            valid_start = heat_curve["valid_start_month"]
+            valid_end = heat_curve["valid_until_month"]
+
+            heatcurve = models.HeatCurve(
+            break_point = heat_curve["break_point_number"],
+            out_temp = heat_curve["outside_temperature"],
+            inflow_temp = heat_curve["inflow_temperature"],
+            power = heat_curve["heating_power"]
+            )
+
+            for k in range((valid_end - valid_start) % 12 + 1):
+                slot = (valid_start - 1 + k) % 12
+
+                if months[slot] is None:
+                    months[slot] = (heatcurve, 1)
+                else:
+                    months[slot] = (months[slot][0], months[slot][1] + 1)
+
+        return months
+
+    def log_summary(self):
+
+        logger.info(f"Heat curve store summary: {self.stats.to_dict()}")
+
+label_templates(HeatCurveStore)
@@ -0,0 +1,609 @@
+'''
+Local stand-in backend for offline runs, profiling and benchmarks.
+
+LocalSession answers the CQL statements of the repositories from a SQLite database (in memory or on disk),
+so every repository, cache and writer runs unchanged on a laptop. It understands the statement shapes used in
+this package: SELECT [JSON] columns FROM table WHERE column (=|<|<=|>|>=|IN) value [AND ...] [LIMIT n] and
+INSERT INTO table JSON :row [USING TIMESTAMP :time] / INSERT INTO table (columns) VALUES (markers). INSERTs are
+upserts on the primary key of the table (PRIMARY_KEYS) in the order they arrive, write times are not compared.
+Rows are returned in clustering order.
+
+LocalElasticsearch answers the term/range searches of deploy_utils from documents kept in the same database.
+Use DB_URL=local:<path> and ES_URL=local:<path> to point the lambdas at a file written by local_fleet.py.
+'''
+
+from cassandra.cluster import EXEC_PROFILE_DEFAULT
+from cassandra.query import named_tuple_factory
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+import pandas as pd
+import threading
+import sqlite3
+import json
+import re
+import logging
+from db._columnar import COLUMNAR_PROFILE, columnar_factory
+from db._prepared import PreparedStatementRegistry
+from db._bulk import BulkWriter
+
+logger = logging.getLogger("__main__")
+
+LOCAL_PREFIX = "local:"
+
+# Primary key of each table, clustering columns prefixed with '-' are in descending order
+# Tables outside create_flexheatV4*_tables.cql are keyed the way their readers use them (latest row first)
+PRIMARY_KEYS = {
+    "timeseries": ("customer_id", "subcentral_id", "asset_id", "tstamp_record"),
+    "average_measurement": ("customer_id", "subcentral_id", "tstamp_record"),
+    "darksky_forecast": ("location", "timestamp"),
+    "outside_temperature_forecast": ("customer_id", "subcentral_id", "timestamp"),
+    "mpc_planning": ("customer_id", "subcentral_id", "ts_start"),
+    "mpc_warm_start": ("customer_id", "subcentral_id", "model"),
+    "model_parameters": ("customer_id", "subcentral_id", "-tstamp_record"),
+    "subcentral_heatcurve": ("customer_id", "subcentral_id", "-tstamp_record", "valid_start_month"),
+    "dynamic_indoor_temperature_model": ("customer_id", "subcentral_id", "-tstamp_record"),
+    "flexibility_config": ("customer_id",),
+    "peak_hours": ("customer_id", "grid_zone", "ts_start"),
+    "subcentral_flexibility_plan": ("customer_id", "subcentral_id", "grid_zone", "ts_start"),
+    "subcentral_flexibility_dispatch": ("customer_id", "subcentral_id", "grid_zone", "ts_start"),
+    "subcentral_flexibility_report": ("customer_id", "subcentral_id", "grid_zone", "ts_start"),
+    "aggregate_flexibility_plan": ("customer_id", "grid_zone", "ts_start"),
+    "aggregate_flexibility_dispatch": ("customer_id", "grid_zone", "ts_start"),
+    "aggregate_flexibility_report": ("customer_id", "grid_zone", "ts_start"),
+    "timeseries_by_day": ("customer_id", "subcentral_id", "day", "tstamp_record"),
+    "average_measurement_by_day": ("customer_id", "subcentral_id", "day", "tstamp_record"),
+    "darksky_forecast_by_day": ("location", "day", "timestamp"),
+    "outside_temperature_forecast_by_day": ("customer_id", "subcentral_id", "day", "timestamp"),
+    "peak_hours_by_day": ("customer_id", "grid_zone", "day", "ts_start"),
+    "subcentral_flexibility_plan_by_day": ("customer_id", "subcentral_id", "day", "ts_start"),
+    "subcentral_flexibility_dispatch_by_day": ("customer_id", "subcentral_id", "day", "ts_start"),
+    "subcentral_flexibility_report_by_day": ("customer_id", "subcentral_id", "day", "ts_start"),
+    "aggregate_flexibility_plan_by_day": ("customer_id", "grid_zone", "day", "ts_start"),
+    "aggregate_flexibility_dispatch_by_day": ("customer_id", "grid_zone", "day", "ts_start"),
+    "aggregate_flexibility_report_by_day": ("customer_id", "grid_zone", "day", "ts_start"),
+}
+
+TIMESTAMP_COLUMNS = {"tstamp_record", "ts_start", "ts_end", "timestamp"}
+DATE_COLUMNS = {"day"}
+
+_SELECT = re.compile(r"^\s*SELECT\s+(JSON\s+)?(.+?)\s+FROM\s+([\w.]+)(?:\s+WHERE\s+(.+?))?(?:\s+LIMIT\s+(\d+))?(?:\s+ALLOW\s+FILTERING)?\s*$",
+                     re.IGNORECASE | re.DOTALL)
+_INSERT_JSON = re.compile(r"^\s*INSERT\s+INTO\s+([\w.]+)\s+JSON\s+:(\w+)(?:\s+USING\s+TIMESTAMP\s+:\w+)?\s*$", re.IGNORECASE | re.DOTALL)
+_INSERT_VALUES = re.compile(r"^\s*INSERT\s+INTO\s+([\w.]+)\s*\((.+?)\)\s*VALUES\s*\((.+?)\)\s*$", re.IGNORECASE | re.DOTALL)
+_CONDITION = re.compile(r"^([\w.]+)\s*(=|<=|>=|<|>|IN)\s*(.+)$", re.IGNORECASE | re.DOTALL)
+_COLUMN = re.compile(r"^([\w]+)(?:\.(\w+))?(?:\s+AS\s+(\w+))?$", re.IGNORECASE)
+_EPOCH = datetime(1970, 1, 1)
+
+def _quote(name):
+
+    return '"' + name + '"'
+
+def _table_name(name):
+
+    return name.split('.')[-1]
+
+def _literal(text):
+
+    text = text.strip()
+
+    if text.startswith("'"):
+        return text[1:-1]
+
+    if text.lower() in ("true", "false"):
+        return text.lower() == "true"
+
+    return float(text) if '.' in text else int(text)
+
+# Value as stored in SQLite, timestamps as milliseconds since the epoch (naive datetimes are UTC like in the driver)
+def _encode(column, value):
+
+    if value is None:
+        return None
+
+    if column in TIMESTAMP_COLUMNS:
+        timestamp = pd.Timestamp(value)
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.tz_convert('UTC').tz_localize(None)
+        return (timestamp.to_pydatetime() - _EPOCH) // timedelta(milliseconds = 1)
+
+    if column in DATE_COLUMNS:
+        return str(value)[:10]
+
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+
+    return value
+
+# Value as returned by the driver: naive UTC datetimes, dates, collections and UDTs
+def _decode(column, value, json_columns):
+
+    if value is None:
+        return None
+
+    if column in TIMESTAMP_COLUMNS:
+        return _EPOCH + timedelta(milliseconds = value)
+
+    if column in DATE_COLUMNS:
+        return date.fromisoformat(value)
+
+    if column in json_columns:
+        return json.loads(value)
+
+    return value
+
+# Value as formatted by SELECT JSON
+def _json_value(value):
+
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S.') + f"{value.microsecond // 1000:03d}Z"
+
+    if isinstance(value, date):
+        return value.isoformat()
+
+    return value
+
+class LocalStatement:
+
+    '''Parsed statement, the local counterpart of a PreparedStatement'''
+
+    def __init__(self, query):
+
+        self.query_string = query
+        select = _SELECT.match(query)
+
+        if select is not None:
+            self.kind = "select"
+            self.json = select.group(1) is not None
+            self.system = select.group(3).lower().startswith("system.")
+            self.table = _table_name(select.group(3))
+            self.columns = [] if select.group(2).strip() == "*" else [self._column(column) for column in select.group(2).split(",")]
+            self.conditions = [self._condition(condition) for condition in re.split(r"\s+AND\s+", select.group(4), flags = re.IGNORECASE)] if select.group(4) else []
+            self.limit = int(select.group(5)) if select.group(5) else None
+            return
+
+        insert = _INSERT_JSON.match(query)
+
+        if insert is not None:
+            self.kind = "insert_json"
+            self.table = _table_name(insert.group(1))
+            self.marker = insert.group(2)
+            return
+
+        insert = _INSERT_VALUES.match(query)
+
+        if insert is not None:
+            self.kind = "insert"
+            self.table = _table_name(insert.group(1))
+            self.names = [name.strip() for name in insert.group(2).split(",")]
+            self.markers = [marker.strip().lstrip(":") for marker in insert.group(3).split(",")]
+            return
+
+        raise ValueError(f"Statement is not supported by the local backend: {' '.join(query.split())}")
+
+    # (column, UDT field or None, result name)
+    def _column(self, text):
+
+        column = _COLUMN.match(text.strip())
+
+        if column is None:
+            raise ValueError(f"Column is not supported by the local backend: {text.strip()}")
+
+        name, field, alias = column.groups()
+
+        return name, field, alias or field or name
+
+    # (column, operator, marker name or None, literal value)
+    def _condition(self, text):
+
+        condition = _CONDITION.match(text.strip())
+
+        if condition is None:
+            raise ValueError(f"Condition is not supported by the local backend: {text.strip()}")
+
+        column, operator, value = condition.groups()
+        value = value.strip()
+
+        if value.startswith(":"):
+            return column, operator.upper(), value[1:], None
+
+        return column, operator.upper(), None, _literal(value)
+
+    def bind(self, parameters):
+
+        return LocalBoundStatement(self, parameters)
+
+class LocalBoundStatement:
+
+    def __init__(self, prepared, values):
+
+        self.prepared = prepared
+        self.values = values
+        self.fetch_size = None
+
+# Paged result, rows are passed through the row factory of the execution profile one page at a time
+class LocalResultSet:
+
+    def __init__(self, colnames, rows, fetch_size, row_factory):
+
+        self.column_names = colnames
+        self._pages = [rows[i:i + fetch_size] for i in range(0, len(rows), fetch_size)] or [[]]
+        self._page = 0
+        self._row_factory = row_factory
+        self.paging_state = None
+
+    @property
+    def _current_rows(self):
+
+        return self._row_factory(self.column_names, self._pages[self._page])
+
+    @property
+    def has_more_pages(self):
+
+        return self._page + 1 < len(self._pages)
+
+    def fetch_next_page(self):
+
+        self._page += 1
+
+    def one(self):
+
+        rows = self._current_rows
+
+        return rows[0] if len(rows) > 0 else None
+
+    def __iter__(self):
+
+        while True:
+            yield from self._current_rows
+
+            if not self.has_more_pages:
+                break
+
+            self.fetch_next_page()
+
+# Future of an asynchronous statement
+# Statements and callbacks run on the session's worker thread, so cassandra.concurrent never recurses into callbacks
+class LocalResponseFuture:
+
+    _col_names = None
+    _col_types = None
+    _paging_state = None
+    _continuous_paging_session = None
+    has_more_pages = False
+
+    def __init__(self, executor):
+
+        self._executor = executor
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._result = None
+        self._exception = None
+
+    def _run(self, execute):
+
+        try:
+            self._result = execute()
+        except Exception as ex:
+            self._exception = ex
+
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            callback()
+
+    def result(self):
+
+        self._done.wait()
+
+        if self._exception is not None:
+            raise self._exception
+
+        return self._result
+
+    def add_callbacks(self, callback, errback, callback_args = (), errback_args = (), callback_kwargs = None, errback_kwargs = None):
+
+        def run():
+            if self._exception is None:
+                callback(list(self._result), *callback_args, **(callback_kwargs or {}))
+            else:
+                errback(self._exception, *errback_args, **(errback_kwargs or {}))
+
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(run)
+                return
+
+        self._executor.submit(run)
+
+    def clear_callbacks(self):
+
+        with self._lock:
+            self._callbacks = []
+
+class LocalSession:
+
+    '''SQLite-backed stand-in for cassandra.cluster.Session, see the module docstring'''
+
+    def __init__(self, path = ":memory:", fetch_size = 5000, row_factories = None):
+
+        self.path = path
+        self.default_fetch_size = fetch_size
+        self.row_factories = {EXEC_PROFILE_DEFAULT: named_tuple_factory, COLUMNAR_PROFILE: columnar_factory}
+        self.row_factories.update(row_factories or {})
+        self.is_shutdown = False
+        self.executed = 0
+
+        self._db = sqlite3.connect(path, check_same_thread = False)
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "local-session")
+        self._columns = {}
+        self._statements = {}
+
+        with self._lock:
+            # Durability is not needed for a stand-in, every statement commits
+            self._db.execute("PRAGMA synchronous = OFF")
+            self._db.execute("PRAGMA journal_mode = MEMORY")
+            self._db.execute("CREATE TABLE IF NOT EXISTS _local_json_columns (table_name TEXT, column_name TEXT, PRIMARY KEY (table_name, column_name))")
+            self._json_columns = {}
+
+            for table, column in self._db.execute("SELECT table_name, column_name FROM _local_json_columns"):
+                self._json_columns.setdefault(table, set()).add(column)
+
+    def prepare(self, query):
+
+        statement = self._statements.get(query)
+
+        if statement is None:
+            statement = LocalStatement(query)
+            self._statements[query] = statement
+
+        return statement
+
+    def execute(self, query, parameters = None, timeout = None, execution_profile = EXEC_PROFILE_DEFAULT, paging_state = None):
+
+        fetch_size = self.default_fetch_size
+
+        if isinstance(query, LocalBoundStatement):
+            fetch_size = query.fetch_size or fetch_size
+            query, parameters = query.prepared, query.values
+        elif not isinstance(query, LocalStatement):
+            query = self.prepare(query)
+
+        self.executed += 1
+        row_factory = self.row_factories.get(execution_profile, named_tuple_factory)
+
+        with self._lock:
+            if query.kind == "select":
+                colnames, rows = self._select(query, parameters or {})
+                return LocalResultSet(colnames, rows, fetch_size, row_factory)
+
+            if query.kind == "insert_json":
+                self._upsert(query.table, json.loads(parameters[query.marker]))
+            else:
+                self._upsert(query.table, {name: parameters[marker] for name, marker in zip(query.names, query.markers)})
+
+            self._db.commit()
+
+        return LocalResultSet([], [], fetch_size, row_factory)
+
+    def execute_async(self, query, parameters = None, timeout = None, execution_profile = EXEC_PROFILE_DEFAULT, paging_state = None):
+
+        future = LocalResponseFuture(self._executor)
+        self._executor.submit(future._run, lambda: self.execute(query, parameters, timeout, execution_profile, paging_state))
+
+        return future
+
+    # Used by cassandra.concurrent for errbacks past its recursion limit
+    def submit(self, fn, *args, **kwargs):
+
+        return self._executor.submit(fn, *args, **kwargs)
+
+    # Bulk load of plain rows, e.g. by local_fleet.py, in one transaction
+    def insert(self, table, rows):
+
+        with self._lock:
+            for row in rows:
+                self._upsert(table, row)
+
+            self._db.commit()
+
+    def shutdown(self):
+
+        self._executor.shutdown(wait = True)
+        self._db.close()
+        self.is_shutdown = True
+
+    def _key(self, table):
+
+        return [column.lstrip("-") for column in PRIMARY_KEYS.get(table, ())]
+
+    # Create the table or add the missing columns, the schema grows with the columns that are written or selected
+    def _ensure_columns(self, table, columns):
+
+        known = self._columns.get(table)
+
+        if known is None:
+            known = [row[1] for row in self._db.execute(f"PRAGMA table_info({_quote(table)})")]
+
+            if not known:
+                key = self._key(table)
+                definitions = ", ".join(_quote(column) for column in key or ["_rowid"])
+                constraint = f", PRIMARY KEY ({', '.join(_quote(column) for column in key)})" if key else ""
+                self._db.execute(f"CREATE TABLE {_quote(table)} ({definitions}{constraint})")
+                known = list(key or ["_rowid"])
+
+            known = set(known)
+            self._columns[table] = known
+
+        for column in columns:
+            if column not in known:
+                self._db.execute(f"ALTER TABLE {_quote(table)} ADD COLUMN {_quote(column)}")
+                known.add(column)
+
+    def _upsert(self, table, row):
+
+        json_columns = [column for column, value in row.items() if isinstance(value, (list, dict)) and column not in self._json_columns.get(table, ())]
+
+        for column in json_columns:
+            self._db.execute("INSERT OR IGNORE INTO _local_json_columns VALUES (?, ?)", (table, column))
+            self._json_columns.setdefault(table, set()).add(column)
+
+        columns = list(row)
+        self._ensure_columns(table, columns)
+        key = self._key(table)
+        values = [_encode(column, row[column]) for column in columns]
+        statement = f"INSERT INTO {_quote(table)} ({', '.join(_quote(column) for column in columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+        # Cassandra INSERTs are upserts, only the written columns change
+        if key and set(key) <= set(columns):
+            updates = [column for column in columns if column not in key]
+            conflict = f"DO UPDATE SET {', '.join(f'{_quote(column)} = excluded.{_quote(column)}' for column in updates)}" if updates else "DO NOTHING"
+            statement += f" ON CONFLICT ({', '.join(_quote(column) for column in key)}) {conflict}"
+
+        self._db.execute(statement, values)
+
+    def _select(self, statement, parameters):
+
+        table = statement.table
+
+        # Health checks read system.local
+        if statement.system:
+            return ["release_version"], [("local",)]
+
+        referenced = {column for column, _, _ in statement.columns} | {column for column, _, _, _ in statement.conditions}
+        self._ensure_columns(table, referenced)
+
+        where, values = [], []
+
+        for column, operator, marker, literal in statement.conditions:
+            value = parameters[marker] if marker is not None else literal
+
+            if operator == "IN":
+                value = list(value)
+                where.append(f"{_quote(column)} IN ({', '.join('?' * len(value))})" if value else "0")
+                values.extend(_encode(column, item) for item in value)
+            else:
+                where.append(f"{_quote(column)} {operator} ?")
+                values.append(_encode(column, value))
+
+        if statement.columns:
+            selected = [f"json_extract({_quote(column)}, '$.{field}')" if field else _quote(column) for column, field, _ in statement.columns]
+            colnames = [name for _, _, name in statement.columns]
+            decoders = [name if field is None else None for name, field, _ in statement.columns]
+        else:
+            colnames = [column for column in self._columns[table] if column != "_rowid"]
+            selected = [_quote(column) for column in colnames]
+            decoders = colnames
+
+        order = [f"{_quote(column.lstrip('-'))}{' DESC' if column.startswith('-') else ''}" for column in PRIMARY_KEYS.get(table, ())] or ["rowid"]
+        query = f"SELECT {', '.join(selected)} FROM {_quote(table)}"
+
+        if where:
+            query += f" WHERE {' AND '.join(where)}"
+
+        query += f" ORDER BY {', '.join(order)}"
+
+        if statement.limit is not None:
+            query += f" LIMIT {statement.limit}"
+
+        json_columns = self._json_columns.get(table, set())
+        rows = [tuple(_decode(column, value, json_columns) if column is not None else value for column, value in zip(decoders, row))
+                for row in self._db.execute(query, values)]
+
+        if statement.json:
+            rows = [(json.dumps({name: _json_value(value) for name, value in zip(colnames, row)}),) for row in rows]
+            colnames = ["json"]
+
+        return colnames, rows
+
+class LocalDBConnection:
+
+    '''DBConnection on a LocalSession, DB_URL is local:<path> (local::memory: for an in-memory database)'''
+
+    def __init__(self, db, write_concurrency = BulkWriter.CONCURRENCY):
+
+        self.db = db
+        self.session = LocalSession(db[len(LOCAL_PREFIX):] or ":memory:")
+        self.statements = PreparedStatementRegistry(self.session)
+        # UNLOGGED batches need driver-side PreparedStatements, the local writer always sends single statements
+        self.writer = BulkWriter(self.statements, concurrency = write_concurrency, batch_rows = 0)
+        logger.info(f"Connected to local database {self.db}")
+
+    def is_healthy(self):
+
+        return not self.session.is_shutdown
+
+    def db_shutdown(self):
+
+        self.session.shutdown()
+        logger.info(f"Close connection to local database {self.db}")
+
+class LocalElasticsearch:
+
+    '''
+    Stand-in for the Elasticsearch client, for the bool/must term and range searches of deploy_utils.
+    Documents are kept per index in the _local_documents table of the local database.
+    '''
+
+    def __init__(self, url):
+
+        self.url = url
+        self._db = sqlite3.connect(url[len(LOCAL_PREFIX):] or ":memory:", check_same_thread = False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS _local_documents (index_name TEXT, document TEXT)")
+
+    @property
+    def transport(self):
+
+        return self
+
+    def index(self, index, body):
+
+        self._db.execute("INSERT INTO _local_documents VALUES (?, ?)", (index, json.dumps(body)))
+        self._db.commit()
+
+    def ping(self):
+
+        return True
+
+    def close(self):
+
+        self._db.close()
+
+    def search(self, index, body):
+
+        query = body.get("query", {}).get("bool", {})
+        hits = []
+
+        for (document,) in self._db.execute("SELECT document FROM _local_documents WHERE index_name = ? ORDER BY rowid", (index,)):
+            source = json.loads(document)
+
+            if all(self._matches(source, clause) for clause in query.get("must", [])) and \
+               not any(self._matches(source, clause) for clause in query.get("must_not", [])):
+                hits.append({"_index": index, "_source": source})
+
+        start = body.get("from", 0)
+
+        return {"hits": {"total": len(hits), "hits": hits[start:start + body.get("size", 10)]}}
+
+    # term values are compared as lower-case strings, range bounds as strings (ISO timestamps) or numbers
+    def _matches(self, source, clause):
+
+        if "term" in clause:
+            (field, value), = clause["term"].items()
+            return str(source.get(field)).lower() == str(value).lower()
+
+        if "range" in clause:
+            (field, bounds), = clause["range"].items()
+            value = source.get(field)
+
+            if value is None:
+                return False
+
+            operators = {"gt": lambda a, b: a > b, "gte": lambda a, b: a >= b, "lt": lambda a, b: a < b, "lte": lambda a, b: a <= b}
+
+            return all(operators[operator](value, type(value)(bound)) for operator, bound in bounds.items())
+
+        raise ValueError(f"Search clause is not supported by the local backend: {clause}")
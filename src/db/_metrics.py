@@ -0,0 +1,262 @@
+'''
+Per-query instrumentation of the statements executed through PreparedStatementRegistry.
+
+Every execution is labelled by the name of its template (e.g. CassandraHouseRepository._SUBCENTRAL_QUERY_TEMPLATE,
+see label_templates) and by its table. QueryMetrics records per label a latency histogram (request sent to first
+page received), the pages and rows read, and the bytes of the decoded columns of columnar reads (read_columns).
+Pages after the first are timed from the moment the reader waits for them, reads that prefetch pages
+(stream_pages) only count the time they are blocked. With trace enabled, every query also logs one JSON trace event.
+'''
+
+from dataclasses import dataclass, field
+import threading
+import bisect
+import time
+import json
+import re
+import logging
+
+logger = logging.getLogger("__main__")
+
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000) # upper bounds, the last bucket is open
+
+_TEMPLATE_NAMES = {}
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+([\w.]+)", re.IGNORECASE)
+_KIND = re.compile(r"^\s*(\w+)")
+
+# Name the templates of repository classes after the class attribute that defines them
+def label_templates(*classes):
+
+    for cls in classes:
+        for klass in reversed(cls.__mro__):
+            for name, value in vars(klass).items():
+                if name.endswith("_TEMPLATE") and isinstance(value, str):
+                    _TEMPLATE_NAMES.setdefault(value, f"{klass.__name__}.{name}")
+
+def template_label(template):
+
+    table = _TABLE.search(template)
+    table = table.group(1).split('.')[-1] if table is not None else ""
+    name = _TEMPLATE_NAMES.get(template)
+
+    if name is None:
+        kind = _KIND.match(template)
+        name = f"{kind.group(1).upper() if kind else 'QUERY'} {table}"
+
+    return name, table
+
+@dataclass
+class QueryStats:
+
+    table: str = ""
+    count: int = 0
+    failures: int = 0
+    rows: int = 0
+    pages: int = 0
+    bytes: int = 0
+    seconds: float = 0
+    max_seconds: float = 0
+    histogram: list = field(default_factory = lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1))
+
+    def add_latency(self, seconds):
+
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.histogram[bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1e3)] += 1
+
+    def merge(self, other):
+
+        self.count += other.count
+        self.failures += other.failures
+        self.rows += other.rows
+        self.pages += other.pages
+        self.bytes += other.bytes
+        self.seconds += other.seconds
+        self.max_seconds = max(self.max_seconds, other.max_seconds)
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+
+    # Upper bound of the bucket holding the q-quantile of the first-page latencies, in ms
+    def quantile_ms(self, q):
+
+        total = sum(self.histogram)
+
+        if total == 0:
+            return None
+
+        seen = 0
+
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+
+            if seen >= q * total:
+                return LATENCY_BUCKETS_MS[bucket] if bucket < len(LATENCY_BUCKETS_MS) else round(self.max_seconds * 1e3, 1)
+
+    def to_dict(self):
+
+        return {"table": self.table,
+                "count": self.count,
+                "failures": self.failures,
+                "rows": self.rows,
+                "pages": self.pages,
+                "bytes": self.bytes,
+                "seconds": round(self.seconds, 3),
+                "p50_ms": self.quantile_ms(0.5),
+                "p95_ms": self.quantile_ms(0.95),
+                "p99_ms": self.quantile_ms(0.99),
+                "max_ms": round(self.max_seconds * 1e3, 1),
+                "histogram_ms": dict(zip([str(bound) for bound in LATENCY_BUCKETS_MS] + ["inf"], self.histogram))}
+
+class QueryMetrics:
+
+    def __init__(self, trace = False):
+
+        self.trace = trace
+        self.stats = {}
+        self._lock = threading.Lock() # completion callbacks of asynchronous queries run on the driver's event loop
+
+    def _stats(self, label, table):
+
+        stats = self.stats.get(label)
+
+        if stats is None:
+            stats = self.stats.setdefault(label, QueryStats(table = table))
+
+        return stats
+
+    # A query received its first page (or failed) `seconds` after it was sent
+    def first_page(self, template, seconds, page = None, error = None):
+
+        label, table = template_label(template)
+
+        with self._lock:
+            stats = self._stats(label, table)
+            stats.count += 1
+            stats.add_latency(seconds)
+
+            if error is None:
+                stats.pages += 1
+                stats.rows += len(page) if page is not None else 0
+            else:
+                stats.failures += 1
+
+        if self.trace:
+            logger.debug(f"Query trace: {json.dumps({'query': label, 'table': table, 'ms': round(seconds * 1e3, 3), 'rows': len(page) if page is not None else 0, 'error': str(error) if error else None})}")
+
+    # A following page was received, after waiting `seconds` for it
+    def next_page(self, template, seconds, page):
+
+        label, table = template_label(template)
+
+        with self._lock:
+            stats = self._stats(label, table)
+            stats.pages += 1
+            stats.rows += len(page) if page is not None else 0
+            stats.seconds += seconds
+
+    def decoded(self, template, nbytes):
+
+        label, table = template_label(template)
+
+        with self._lock:
+            self._stats(label, table).bytes += nbytes
+
+    # Histograms and counters per label, {label: QueryStats} as in self.stats
+    def merge(self, stats):
+
+        with self._lock:
+            for label, other in stats.items():
+                self._stats(label, other.table).merge(other)
+
+    def summary(self):
+
+        with self._lock:
+            return {label: stats.to_dict() for label, stats in sorted(self.stats.items(), key = lambda item: -item[1].seconds)}
+
+    def log_summary(self):
+
+        for label, stats in self.summary().items():
+            logger.info(f"Query summary for {label}: {stats}")
+
+    def reset(self):
+
+        with self._lock:
+            self.stats = {}
+
+class InstrumentedResult:
+
+    '''Result set wrapper that reports the pages it hands out, everything else is delegated to the driver result'''
+
+    def __init__(self, result_set, template, metrics: QueryMetrics):
+
+        self._result_set = result_set
+        self._template = template
+        self._metrics = metrics
+
+    # Called by stream_pages for every page after the first one
+    def record_page(self, page, seconds):
+
+        self._metrics.next_page(self._template, seconds, page)
+
+    # Called by read_columns with the size of the decoded arrays
+    def record_decoded(self, nbytes):
+
+        self._metrics.decoded(self._template, nbytes)
+
+    def fetch_next_page(self):
+
+        start = time.perf_counter()
+        self._result_set.fetch_next_page()
+        self.record_page(self._result_set._current_rows, time.perf_counter() - start)
+
+    def __iter__(self):
+
+        while True:
+            yield from self._result_set._current_rows or ()
+
+            if not self._result_set.has_more_pages:
+                break
+
+            self.fetch_next_page()
+
+    def __getattr__(self, name):
+
+        return getattr(self._result_set, name)
+
+class InstrumentedFuture:
+
+    '''
+    Response future wrapper, the first-page latency is recorded by a callback when the response arrives.
+
+    The driver calls the callbacks of a future again for every following page, those pages are reported by the
+    reader (InstrumentedResult, stream_pages) instead.
+    '''
+
+    def __init__(self, future, template, metrics: QueryMetrics, sent):
+
+        self._future = future
+        self._template = template
+        self._metrics = metrics
+        self._sent = sent
+        self._recorded = False
+
+        future.add_callbacks(self._received, self._failed)
+
+    def _received(self, rows):
+
+        if not self._recorded:
+            self._recorded = True
+            self._metrics.first_page(self._template, time.perf_counter() - self._sent, rows)
+
+    def _failed(self, error):
+
+        if not self._recorded:
+            self._recorded = True
+            self._metrics.first_page(self._template, time.perf_counter() - self._sent, error = error)
+
+    def result(self):
+
+        return InstrumentedResult(self._future.result(), self._template, self._metrics)
+
+    def __getattr__(self, name):
+
+        return getattr(self._future, name)
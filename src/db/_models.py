@@ -3,6 +3,10 @@ import models
 from mpc.params import *
 from mpc.greybox_execution import PnPkModel_Execution
 from mpc.greybox_plan import PnPkModel_Plan
+from db._prepared import PreparedStatementRegistry
+from db._metrics import label_templates
+from db._cache import RunCache
+from db._heatcurve import HeatCurveStore
 import typing
 import json
 import logging
@@ -13,25 +17,24 @@ class RESTHouseModelRepository(HouseModelRepository):
 
     _PARAMETER_QUERY_TEMPLATE = '''
         SELECT JSON * FROM flexheat.model_parameters
-         WHERE customer_id = {customer_id}
-            AND subcentral_id = {subcentral_id}
-            AND active = {active}
+         WHERE customer_id = :customer_id
+            AND subcentral_id = :subcentral_id
+            AND active = :active
             LIMIT 1
             ALLOW FILTERING
     '''
-           
-    _HEATCURVE_QUERY_TEMPLATE = '''
-        SELECT JSON * FROM flexheat.subcentral_heatcurve
-         WHERE customer_id = {customer_id}
-            AND subcentral_id = {subcentral_id}
-            AND active = {active}
+    
+    _CUSTOMER_PARAMETER_QUERY_TEMPLATE = '''
+        SELECT JSON * FROM flexheat.model_parameters
+         WHERE customer_id = :customer_id
+            AND active = :active
             ALLOW FILTERING
-    '''    
-
+    '''
+           
     _MODEL_QUERY_TEMPLATE = '''
         SELECT JSON * FROM flexheat.dynamic_indoor_temperature_model
-         WHERE customer_id = {customer_id}
-            AND subcentral_id = {subcentral_id}
+         WHERE customer_id = :customer_id
+            AND subcentral_id = :subcentral_id
             LIMIT 1
             ALLOW FILTERING
     '''    
@@ -39,6 +42,10 @@ class RESTHouseModelRepository(HouseModelRepository):
     def __init__(self, session):
         
         self.session = session
+        self._statements = PreparedStatementRegistry.for_session(session)
+        self.parameter_cache = RunCache("model_parameters") # Keyed by (customer_id, subcentral_id)
+        self._preloaded_customers = set()
+        self.heatcurves = HeatCurveStore.for_session(session)
 
     # Add for auto dynamic model
     # dynamic_config and dynamic_model are added as inputs 
@@ -60,17 +67,63 @@ class RESTHouseModelRepository(HouseModelRepository):
 
         return PnPkModel_Execution(physical=phys, mpc_config=mpc_config, dynamic_config=dynamic_config, dynamic_model=dynamic_model) 
     
+    # Parameters are read once per run, see preload_parameters_by_customer and invalidate_parameters
     def get_parameters_by_house(self, house: models.House):
         
-        logger.info(f"Fetching model parameters for cid = {house.customer_id}, sid = {house.subcentral_id}")
+        return self.parameter_cache.get((house.customer_id, house.subcentral_id), lambda: self._fetch_parameters_by_house(house))
+
+    # Read the active parameters of every subcentral of the customer with one query and cache them
+    def preload_parameters_by_customer(self, customer):
+
+        if customer in self._preloaded_customers:
+            return 0
+
+        logger.info(f"Preloading model parameters for cid = {customer}")
+
+        rows = self._statements.execute(self._CUSTOMER_PARAMETER_QUERY_TEMPLATE, {"customer_id": customer, "active": True})
+
+        loaded = set()
+
+        for row in rows:
+
+            parameters = json.loads(row.json)
+            key = (customer, parameters["subcentral_id"])
+
+            # Rows come in the same order as for the per-house query, keep the first one like its LIMIT 1
+            if key in loaded:
+                continue
+
+            self.parameter_cache.put(key, self._parameters_from_row(parameters))
+            loaded.add(key)
+
+        self._preloaded_customers.add(customer)
+
+        return len(loaded)
+
+    # Drop cached parameters of one house, or of all houses if house is None
+    def invalidate_parameters(self, house: models.House = None):
+
+        if house is None:
+            self.parameter_cache.invalidate()
+            self._preloaded_customers = set()
+
+        else:
+            self.parameter_cache.invalidate((house.customer_id, house.subcentral_id))
 
-        query = self._PARAMETER_QUERY_TEMPLATE.format(customer_id = house.customer_id, \
-                                                      subcentral_id = house.subcentral_id, \
-                                                      active=True)
+    def _parameters_from_row(self, parameters):
 
-        print(query)
+        return (PhysicalHouseParameters(parameters), HouseSimulationParameters(parameters), MPCConfiguration(parameters),
+                SARIMAXConfiguration(parameters), DynamicConfiguration(parameters))
+
+    def _fetch_parameters_by_house(self, house: models.House):
         
-        rows = self.session.execute(query)
+        logger.info(f"Fetching model parameters for cid = {house.customer_id}, sid = {house.subcentral_id}")
+
+        parameters = {"customer_id": house.customer_id,
+                      "subcentral_id": house.subcentral_id,
+                      "active": True}
+
+        rows = self._statements.execute(self._PARAMETER_QUERY_TEMPLATE, parameters)
                
         if len(rows._current_rows) == 0:
                     
@@ -84,91 +137,27 @@ class RESTHouseModelRepository(HouseModelRepository):
             
             parameters = json.loads(row.json)
             
-            physical_house = PhysicalHouseParameters(parameters)
-
-            grey_params = HouseSimulationParameters(parameters)
-      
-            mpc_config = MPCConfiguration(parameters)
-            
-            sarimax_config = SARIMAXConfiguration(parameters)
-            
-            dynamic_config = DynamicConfiguration(parameters)
+            physical_house, grey_params, mpc_config, sarimax_config, dynamic_config = self._parameters_from_row(parameters)
             
         return physical_house, grey_params, mpc_config, sarimax_config, dynamic_config
     
+    # Heat curves are indexed by month once per session, see HeatCurveStore
     def get_heatcurve_by_house(self, house: models.House, planning_start):
 
-        logger.info(f"Fetching heat curve for cid = {house.customer_id}, sid = {house.subcentral_id}")
+        return self.heatcurves.get(house, planning_start.month)
 
-        query = self._HEATCURVE_QUERY_TEMPLATE.format(customer_id = house.customer_id, \
-                                                      subcentral_id = house.subcentral_id, \
-                                                      active=True)
+    def preload_heatcurves_by_customer(self, customer):
 
-        print(query)
-        
-        rows = self.session.execute(query)
-        
-        if len(rows._current_rows) == 0:
-                    
-            raise ValueError(f"No heat curve is found for cid = {house.customer_id}, sid = {house.subcentral_id}")  
-              
-        count = 0
-        heatcurve_group = []
-               
-        for row in rows:
-            
-            heat_curve = json.loads(row.json)
-                       
-            # There can be different heat curves in different season
-            # Compare current month with valid months
-            # If there are more than one active curves, the latest active curve is adopted
-            valid_start = heat_curve["valid_start_month"]
-            valid_end = heat_curve["valid_until_month"]
-            
-            if valid_start <= valid_end:
-                
-                valid_month = list(range(valid_start, valid_end + 1))
-                
-            else:
-                
-                valid_month = list(range(valid_start, 13)) + list(range(1, valid_end + 1))
-            
-            if planning_start.month not in valid_month:
-                
-                continue
-            
-            else:
-                           
-                heatcurve = models.HeatCurve(    
-                break_point = heat_curve["break_point_number"],
-                out_temp = heat_curve["outside_temperature"],
-                inflow_temp = heat_curve["inflow_temperature"],
-                power = heat_curve["heating_power"]                
-                )
-                
-                heatcurve_group.append(heatcurve)
-                count += 1
-
-        if count == 0:
-            raise ValueError(f"No heat curve is found for {house.customer_id, house.subcentral_id} for month {planning_start.month}, \
-                            please config the heat curve first!")
-        
-        elif count > 1:
-            logger.warning(f"More than one active heat curve is found for {house.customer_id, house.subcentral_id} for month {planning_start.month}, \
-                            the latest one will be used.")
-                    
-        return heatcurve_group[0] # Return the latest valid heat curve
+        return self.heatcurves.load_customer(customer)
         
     def get_dynamic_model_by_house(self, house: models.House):
 
         logger.debug(f"fetching dynamic indoor temperature model for cid = {house.customer_id}, sid = {house.subcentral_id}")
         
-        query = self._MODEL_QUERY_TEMPLATE.format(customer_id = house.customer_id,\
-                                                  subcentral_id = house.subcentral_id)
+        parameters = {"customer_id": house.customer_id,
+                      "subcentral_id": house.subcentral_id}
 
-        print(query)
-        
-        rows = self.session.execute(query)
+        rows = self._statements.execute(self._MODEL_QUERY_TEMPLATE, parameters)
         
         if len(rows._current_rows) == 0:
             
@@ -191,23 +180,22 @@ class FlexibilityModelRepository():
     
     _CONFIG_QUERY_TEMPLATE = '''
         SELECT JSON * FROM flexheat.flexibility_config
-         WHERE customer_id = {customer_id}
+         WHERE customer_id = :customer_id
             ALLOW FILTERING
     '''
          
     def __init__(self, session):
         
         self.session = session
+        self._statements = PreparedStatementRegistry.for_session(session)
         
     def get_config_by_customer(self, customer):
         
         logger.info(f"Fetching flexibility config parameters for cid = {customer}")
 
-        query = self._CONFIG_QUERY_TEMPLATE.format(customer_id = customer)
+        parameters = {"customer_id": customer}
 
-        print(query)
-        
-        rows = self.session.execute(query)
+        rows = self._statements.execute(self._CONFIG_QUERY_TEMPLATE, parameters)
                
         if len(rows._current_rows) == 0:
                     
@@ -220,4 +208,6 @@ class FlexibilityModelRepository():
             parameters = json.loads(row.json)    
             flexibility_config = FlexibilityConfiguration(parameters)
                         
-        return flexibility_config
\ No newline at end of file
+        return flexibility_config
+
+label_templates(RESTHouseModelRepository, FlexibilityModelRepository)
@@ -0,0 +1,114 @@
+from cassandra.cluster import EXEC_PROFILE_DEFAULT
+from cassandra.concurrent import execute_concurrent
+from db._metrics import QueryMetrics, InstrumentedResult, InstrumentedFuture
+import threading
+import time
+import weakref
+import logging
+
+logger = logging.getLogger("__main__")
+
+# Time boundaries used to be formatted as '%Y-%m-%dT%H:%M:00Z', keep the same minute resolution when binding
+def bind_timestamp(timestamp):
+
+    return timestamp.replace(second = 0, microsecond = 0)
+
+class PreparedStatementRegistry:
+
+    '''
+    Prepare each CQL template once per session and execute it with bound values.
+
+    Templates use named bind markers (e.g. :customer_id) instead of str.format fields,
+    so the coordinator parses every statement only once and values are sent in binary form.
+    '''
+
+    __REGISTRIES = weakref.WeakKeyDictionary() # One registry per session
+
+    def __init__(self, session):
+
+        self._session = weakref.ref(session) # a strong reference from the value of __REGISTRIES would keep its key alive
+        self.metrics = QueryMetrics() # latency, rows and pages per template, see db/_metrics.py
+        self._statements = {}
+        self._lock = threading.Lock()
+
+        PreparedStatementRegistry.__REGISTRIES[session] = self
+
+    @property
+    def session(self):
+
+        return self._session()
+
+    # Return the registry owned by the session, create one if the session is not wrapped by DBConnection
+    @classmethod
+    def for_session(cls, session):
+
+        registry = cls.__REGISTRIES.get(session)
+
+        if registry is None:
+            registry = cls(session)
+
+        return registry
+
+    def prepare(self, template):
+
+        statement = self._statements.get(template)
+
+        if statement is None:
+            with self._lock:
+                statement = self._statements.get(template)
+
+                if statement is None:
+                    logger.debug(f"Preparing statement: {' '.join(template.split())}")
+                    statement = self.session.prepare(template)
+                    self._statements[template] = statement
+
+        return statement
+
+    def bind(self, template, parameters):
+
+        return self.prepare(template).bind(parameters)
+
+    # fetch_size sets the page size of the statement, paging_state resumes a paged read where it stopped
+    def execute(self, template, parameters = None, execution_profile = EXEC_PROFILE_DEFAULT, fetch_size = None, paging_state = None):
+
+        statement, parameters = self._statement(template, parameters, fetch_size)
+        start = time.perf_counter()
+
+        try:
+            result = self.session.execute(statement, parameters, execution_profile = execution_profile, paging_state = paging_state)
+        except Exception as ex:
+            self.metrics.first_page(template, time.perf_counter() - start, error = ex)
+            raise
+
+        self.metrics.first_page(template, time.perf_counter() - start, result._current_rows)
+
+        return InstrumentedResult(result, template, self.metrics)
+
+    def execute_async(self, template, parameters = None, execution_profile = EXEC_PROFILE_DEFAULT, fetch_size = None, paging_state = None):
+
+        statement, parameters = self._statement(template, parameters, fetch_size)
+        sent = time.perf_counter()
+        future = self.session.execute_async(statement, parameters, execution_profile = execution_profile, paging_state = paging_state)
+
+        return InstrumentedFuture(future, template, self.metrics, sent)
+
+    def _statement(self, template, parameters, fetch_size):
+
+        if fetch_size is None:
+            return self.prepare(template), parameters
+
+        statement = self.bind(template, parameters)
+        statement.fetch_size = fetch_size
+
+        return statement, None
+
+    # Execute (statement, parameters) pairs with at most `concurrency` requests in flight
+    # Returns a list of (success, result_or_exception), failures do not stop the remaining statements
+    def execute_concurrent(self, statements_and_parameters, concurrency):
+
+        return execute_concurrent(self.session, statements_and_parameters,
+                                  concurrency = concurrency, raise_on_first_error = False)
+
+    def __len__(self):
+
+        return len(self._statements)
@@ -0,0 +1,56 @@
+'''
+Timestamp codec of the repositories, whole columns at a time.
+
+Rows are written in UTC with minute resolution ('%Y-%m-%dT%H:%M:00Z'). format_timestamps() formats a whole index
+with numpy's datetime_as_string instead of one strftime per row, and every write batch takes a single tstamp_record
+(record_time) and a single USING TIMESTAMP (write_time). Reads get timestamps from the driver as naive UTC datetimes (see _columnar), strings in the
+ISO format of the rows are parsed with a fixed format in one call.
+'''
+
+from datetime import datetime
+import time
+import numpy as np
+import pandas as pd
+import pytz
+
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:00Z'
+PARSE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# Time of the rows written by one call, tstamp_record of the batch
+def record_time():
+
+    return datetime.now(pytz.utc).replace(second = 0, microsecond = 0)
+
+# Microseconds since the epoch, USING TIMESTAMP of the batch
+# Not the minute of record_time: Cassandra breaks ties of equal write times per cell by value, so two runs in
+# the same minute (e.g. a rerun after a failure) would mix their columns in a row
+def write_time():
+
+    return time.time_ns() // 1000
+
+def format_timestamp(timestamp):
+
+    return str(format_timestamps([timestamp])[0])
+
+# Format every timestamp of an index (tz-aware or naive UTC), returns an array of strings
+def format_timestamps(index):
+
+    index = pd.DatetimeIndex(index)
+
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+
+    minutes = np.datetime_as_string(index.to_numpy().astype('datetime64[m]'), unit = 'm')
+
+    return np.char.add(minutes, ':00Z')
+
+# Nanosecond unit like pd.date_range, frames with millisecond and nanosecond indexes do not join on time
+# Strings are parsed as '%Y-%m-%dT%H:%M:%SZ', e.g. timestamps of JSON rows or Elasticsearch documents
+def utc_index(values, name = None):
+
+    values = np.asarray(values)
+
+    if values.dtype.kind in "OU" and len(values) > 0 and isinstance(values[0], str):
+        return pd.DatetimeIndex(pd.to_datetime(values, format = PARSE_FORMAT, utc = True), name = name).as_unit('ns')
+
+    return pd.DatetimeIndex(values, name = name).as_unit('ns').tz_localize('UTC')
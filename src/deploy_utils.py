@@ -1,20 +1,300 @@
 import logging
 import os
 import json
+import time
+import copy
+import uuid
+import weakref
+import collections
+import multiprocessing
+import multiprocessing.connection
 from elasticsearch import Elasticsearch
 from forecasters._plan_aggregation import AggregationPlan
+from db import DBConnection, CassandraRepository, RESTHouseModelRepository
+from db._bucketed import repository_for
+from db._prepared import PreparedStatementRegistry
+from db._bulk import BulkWriter
+from db._cache import CacheStats
+from mpc.solver import SolverStrategy
+from db._local import LocalDBConnection, LocalElasticsearch, LOCAL_PREFIX
 
 logger = logging.getLogger(__name__)
 logger.setLevel('DEBUG')
 
+# Connections are kept at module level so that warm lambda invocations reuse them instead of
+# discovering the cluster again; a reused connection is checked at most every HEALTH_CHECK_INTERVAL seconds
+# and replaced if the check fails
+HEALTH_CHECK_INTERVAL = 60 # seconds
+_connections = {}
+
+def _reuseConnection(key, connect, is_healthy, close):
+
+    connection, checked, _ = _connections.get(key, (None, None, None))
+
+    if connection is not None and time.monotonic() - checked > HEALTH_CHECK_INTERVAL:
+        if is_healthy(connection):
+            logger.info(f"Reuse connection to {key[1]}")
+        else:
+            logger.warning(f"Connection to {key[1]} is not healthy, reconnecting")
+            try:
+                close(connection)
+            except Exception as ex:
+                logger.error(ex)
+            connection = None
+
+    if connection is None:
+        connection = connect()
+
+    _connections[key] = (connection, time.monotonic(), close)
+
+    return connection
+
+# DB_URL/ES_URL local:<path> use the SQLite stand-in of db/_local.py, e.g. a fleet written by local_fleet.py
+def connectDB(DB_URL):
+
+    connection = LocalDBConnection if DB_URL.startswith(LOCAL_PREFIX) else DBConnection
+
+    dbConnection = _reuseConnection(("cassandra", DB_URL),
+                                    connect = lambda: connection(DB_URL),
+                                    is_healthy = lambda dbConnection: dbConnection.is_healthy(),
+                                    close = lambda dbConnection: dbConnection.db_shutdown())
+
+    # QUERY_TRACE logs one trace event per query
+    dbConnection.statements.metrics.trace = "QUERY_TRACE" in os.environ
+
+    # DAY_BUCKETS selects the schema of the repositories (off, write or read, see db/_bucketed.py)
+    dbConnection.day_buckets = os.environ.get("DAY_BUCKETS", "off")
+
+    return dbConnection
+
+# Cassandra*Repository of the connection, on the schema selected by DAY_BUCKETS
+def cassandraRepository(dbConnection, repository_class):
+
+    return repository_for(repository_class, dbConnection.session, dbConnection.day_buckets)
+
+# Query and write statistics of the run, returned by the lambdas
+# Statistics start over afterwards, a warm invocation reports only its own queries
+def runSummary(dbConnection):
+
+    summary = {"queries": dbConnection.statements.metrics.summary(),
+               "writes": dbConnection.writer.summary()}
+
+    dbConnection.statements.metrics.log_summary()
+    dbConnection.writer.log_summary()
+    dbConnection.statements.metrics.reset()
+    dbConnection.writer.reset()
+
+    return summary
+
 def connectES(ES_URL):
     
     if "ES_URL" in os.environ:
         ES_URL = os.environ['ES_URL']
 
-    es = Elasticsearch([ES_URL])  
-    
-    return es  
+    return _reuseConnection(("elasticsearch", ES_URL),
+                            connect = lambda: LocalElasticsearch(ES_URL) if ES_URL.startswith(LOCAL_PREFIX) else Elasticsearch([ES_URL]),
+                            is_healthy = lambda es: es.ping(),
+                            close = lambda es: es.transport.close())
+
+# Close all connections and worker processes, for scripts that run once (the lambdas keep them for the next invocation)
+def closeConnections():
+
+    for connection, _, close in _connections.values():
+        try:
+            close(connection)
+        except Exception as ex:
+            logger.error(ex)
+
+    _connections.clear()
+
+    for pool in _workers.values():
+        for worker in pool:
+            worker.stop()
+
+    _workers.clear()
+
+# Subcentral runs of the lambdas in worker processes: HOUSE_WORKERS processes (1: the houses are run one after the
+# other in the lambda process), at most HOUSE_TIMEOUT seconds per house. Like the connections, the workers are kept
+# for warm invocations, each with its own connection. A worker gets houses and sends back results over a Pipe
+# (multiprocessing.Pool and ProcessPoolExecutor need /dev/shm for their queues, which Lambda does not provide).
+# A worker that exceeds the timeout is killed, also inside native solver code, and replaced by a new one.
+HOUSE_WORKERS = int(os.environ.get("HOUSE_WORKERS", 1))
+HOUSE_TIMEOUT = float(os.environ.get("HOUSE_TIMEOUT", 300)) # seconds
+_workers = {}
+_runs = weakref.WeakKeyDictionary() # house_repo of the lambda run -> run id
+
+# Query, write, cache and solver statistics of the worker since the last call, which start over afterwards
+def _takeCounters(dbConnection, cassandra_repo, house_repo):
+
+    counters = {"queries": dbConnection.statements.metrics.stats,
+                "writes": dbConnection.writer.stats,
+                "parameter_cache": house_repo.parameter_cache.stats,
+                "heatcurves": house_repo.heatcurves.stats,
+                "weather_cache": cassandra_repo.weather_cache.stats,
+                "solves": copy.copy(SolverStrategy.STATS)}
+
+    dbConnection.statements.metrics.reset()
+    dbConnection.writer.reset()
+    house_repo.parameter_cache.stats = CacheStats()
+    house_repo.heatcurves.stats = CacheStats()
+    cassandra_repo.weather_cache.stats = CacheStats()
+    SolverStrategy.STATS.clear()
+
+    return counters
+
+# Add the statistics of a worker to the ones of the lambda process, so that the summaries of the run include them
+def _mergeCounters(counters, cassandra_repo, house_repo):
+
+    PreparedStatementRegistry.for_session(house_repo.session).metrics.merge(counters["queries"])
+    BulkWriter.for_session(house_repo.session).merge(counters["writes"])
+    house_repo.parameter_cache.stats.merge(counters["parameter_cache"])
+    house_repo.heatcurves.stats.merge(counters["heatcurves"])
+    cassandra_repo.weather_cache.stats.merge(counters["weather_cache"])
+    SolverStrategy.STATS.merge(counters["solves"])
+
+# Main loop of a worker process
+# ("run", run_id, customers): repositories are created anew for every lambda run, so the run caches do not outlive
+# it, and the parameters and heat curves of the customers are preloaded once per run
+# ("house", run, house, args): run(house, cassandra_repo, house_repo, *args), answered with (house, output, counters)
+def _houseWorker(connection, DB_URL):
+
+    dbConnection = connectDB(DB_URL)
+    run_id = None
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+
+        if message[0] == "run":
+            _, new_run_id, customers = message
+
+            if new_run_id != run_id:
+                run_id = new_run_id
+                cassandra_repo = cassandraRepository(dbConnection, CassandraRepository)
+                house_repo = RESTHouseModelRepository(dbConnection.session)
+                preloaded = set()
+
+            preloadParameters(house_repo, [{"customer_id": customer} for customer in customers - preloaded])
+            preloaded |= customers
+
+        else:
+            _, run, house, args = message
+
+            try:
+                output = run(house, cassandra_repo, house_repo, *args)
+            except Exception as ex:
+                logger.error(f"{house}: {ex}")
+                output = None
+
+            connection.send((house, output, _takeCounters(dbConnection, cassandra_repo, house_repo)))
+
+class _HouseWorker:
+
+    # Workers are started fresh (spawn): a forked worker would inherit the connections of the lambda process
+    def __init__(self, DB_URL):
+
+        context = multiprocessing.get_context("spawn")
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target = _houseWorker, args = (child, DB_URL), daemon = True)
+        self.process.start()
+        child.close()
+        self.house = None
+        self.deadline = None
+
+    def start_run(self, run_id, customers):
+
+        self.connection.send(("run", run_id, customers))
+
+    def submit(self, run, house, args, timeout):
+
+        self.connection.send(("house", run, house, args))
+        self.house = house
+        self.deadline = time.monotonic() + timeout
+
+    def is_alive(self):
+
+        return self.process.is_alive()
+
+    def stop(self):
+
+        self.connection.close()
+        self.process.kill()
+        self.process.join()
+
+# The workers of (workers, DB_URL), the ones that died or were stopped are replaced
+def _houseWorkers(workers, DB_URL):
+
+    pool = [worker for worker in _workers.get((workers, DB_URL), []) if worker.is_alive()]
+    pool += [_HouseWorker(DB_URL) for _ in range(workers - len(pool))]
+    _workers[(workers, DB_URL)] = pool
+
+    return pool
+
+# Run run(house, cassandra_repo, house_repo, *args) for every (house, args) of tasks in the worker processes
+# Yields (house, output) in the order the houses finish, output None for a house that failed or timed out
+# The statistics of the workers are added to the ones of cassandra_repo and house_repo, the repositories of the run
+def runHouses(run, tasks, DB_URL, cassandra_repo, house_repo, workers = HOUSE_WORKERS, timeout = HOUSE_TIMEOUT):
+
+    run_id = _runs.setdefault(house_repo, uuid.uuid4().hex)
+    customers = {house.customer_id for house, _ in tasks}
+    pool = _houseWorkers(workers, DB_URL)
+    pending = collections.deque(tasks)
+    idle = list(pool)
+    busy = {} # connection -> worker
+
+    for worker in idle:
+        worker.start_run(run_id, customers)
+
+    # A failed worker is replaced right away, the remaining houses keep all workers busy
+    def replace(worker):
+
+        worker.stop()
+        replacement = _HouseWorker(DB_URL)
+        replacement.start_run(run_id, customers)
+        pool[pool.index(worker)] = replacement
+        idle.append(replacement)
+
+    try:
+        while pending or busy:
+            while pending and idle:
+                worker = idle.pop()
+                house, args = pending.popleft()
+                worker.submit(run, house, args, timeout)
+                busy[worker.connection] = worker
+
+            wait = min(worker.deadline for worker in busy.values()) - time.monotonic()
+
+            for connection in multiprocessing.connection.wait(list(busy), timeout = max(wait, 0)):
+                worker = busy.pop(connection)
+
+                try:
+                    house, output, counters = connection.recv()
+
+                except (EOFError, OSError) as ex:
+                    logger.error(f"Worker of {worker.house} failed: {ex!r}")
+                    replace(worker)
+                    yield worker.house, None
+                    continue
+
+                _mergeCounters(counters, cassandra_repo, house_repo)
+                idle.append(worker)
+                yield house, output
+
+            now = time.monotonic()
+
+            for connection, worker in list(busy.items()):
+                if worker.deadline <= now:
+                    logger.error(f"{worker.house} did not finish within {timeout} seconds, its worker is replaced")
+                    del busy[connection]
+                    replace(worker)
+                    yield worker.house, None
+
+    finally:
+        # Left early: the houses still running are abandoned, their workers replaced on the next call
+        for worker in busy.values():
+            worker.stop()
 
 # Fetch all energy companies that enable the flexibility service
 def getActiveUtility(es):
@@ -69,6 +349,18 @@ def getActiveSubcentrals(es, utility, grid):
         
     return subcentrals
 
+# Read the model parameters and heat curves of all subcentrals with one query per customer
+# If preloading fails, they are read per house on first use
+def preloadParameters(house_repo, subcentrals):
+
+    for customer in {subcentral['customer_id'] for subcentral in subcentrals}:
+        try:
+            house_repo.preload_parameters_by_customer(customer)
+            house_repo.preload_heatcurves_by_customer(customer)
+
+        except Exception as ex:
+            logger.error(ex)
+
 # Process peak hours for planning
 def runGridPeak(utility, grid, aggregate_repo, flexibility_repo, planning_start):
     logger.info(f"Get peak hours for customer_id = {utility}, grid_zone = {grid}")
@@ -180,6 +180,15 @@ class HouseDataForecaster(HouseForecaster):
         
         # Add for auto dynamic model
         return self._house_repo.get_model_by_house_execution(self._house)
+
+    # Solution of the previous plan/execution run of the subcentral, model is 'plan' or 'execution'
+    def warm_start(self, model):
+        
+        return self._cassandra_repo.get_warm_start_by_house(self._house, model)
+    
+    def write_warm_start(self, model, warm_start):
+        
+        self._cassandra_repo.write_warm_start_for_house(self._house, model, warm_start)
         
     # Add for flexibility service
     # Set peak hours for planning horizon: 1 peak hours, 0 off-peak hours
@@ -99,27 +99,32 @@ class AggregationPlan():
         
         aggregate_plan.fillna(0, inplace=True)
         
-        # Calculate dispatch for each subcentral             
-        for subcentral in subcentrals:
-            
-            logger.info(f"Get plan for subcentral_id = {subcentral}")
-            
-            house = House(
+        houses = [House(
                 location=subcentral["geo_city"],
                 customer_id=subcentral['customer_id'],
                 subcentral_id=subcentral['subcentral_id'],
                 longitude=subcentral['geo_coord_lon'],
                 latitude=subcentral["geo_coord_lat"],
                 grid_zone=subcentral["grid_zone"]
-            )        
+            ) for subcentral in subcentrals]
+        
+        # Fetch the plans of all subcentrals at once
+        subcentral_plans = cassandra_house_repo.get_plans_by_houses(
+            houses = houses, 
+            time_range = self._time_range, 
+            now = self._planning_start
+            )
+        subcentral_plans = {key: plan.droplevel(["customer_id", "subcentral_id"]) for key, plan in subcentral_plans.groupby(level = ["customer_id", "subcentral_id"])}
+        
+        # Calculate dispatch for each subcentral             
+        for subcentral, house in zip(subcentrals, houses):
+            
+            logger.info(f"Get plan for subcentral_id = {subcentral}")
             
-            subcentral_plan = cassandra_house_repo.get_plan_by_house(
-                house = house, 
-                time_range = self._time_range, 
-                now = self._planning_start
-                )
+            subcentral_plan = subcentral_plans.get((house.customer_id, house.subcentral_id))
         
-            if subcentral_plan.empty:
+            if subcentral_plan is None or subcentral_plan.empty:
+                logger.warning(f"No planned flexibility is found for cid = {house.customer_id}, sid = {house.subcentral_id}")
                 continue
             else:
                 subcentral_plan.fillna(0, inplace=True)
@@ -49,13 +49,13 @@ def lambda_handler(planning_start):
         if "DB_URL" in os.environ:
             DB_URL = os.environ['DB_URL']
     
-        dbConnection = DBConnection(DB_URL)
+        dbConnection = connectDB(DB_URL) # reused by warm invocations
         session = dbConnection.session
     
-        cassandra_house_repo = CassandraHouseRepository(session)
+        cassandra_house_repo = cassandraRepository(dbConnection, CassandraHouseRepository)
         house_repo = RESTHouseModelRepository(session)
         aggregate_repo = FlexibilityModelRepository(session)
-        flexibility_repo = CassandraAggregateRepository(session)
+        flexibility_repo = cassandraRepository(dbConnection, CassandraAggregateRepository)
           
         ES_URL = 'http://13.48.110.27:9200/'    
         es = connectES(ES_URL)    
@@ -85,12 +85,15 @@ def lambda_handler(planning_start):
                 subcentrals = getActiveSubcentrals(es, utility, grid)
                 
                 logger.info(f"Active subcentrals are: {subcentrals}")
+                preloadParameters(house_repo, subcentrals)
       
                 runGridDispatch(utility, grid, aggregate_repo, flexibility_repo, planning_start, subcentrals, cassandra_house_repo, house_repo)
                 
-        dbConnection.db_shutdown()
+        house_repo.parameter_cache.log_summary()
+        house_repo.heatcurves.log_summary()
+        summary = runSummary(dbConnection)
         
-        return json.dumps({})
+        return json.dumps(summary)
     
     except ValueError as ve:
         logger.error(ve)
@@ -9,6 +9,7 @@ from forecasters._plan_aggregation import AggregationPlan
 from models import *
 from regulators._mpc_flexibility_execution import MPCController_Execution
 from deploy_utils import *
+from mpc.solver import SolverStrategy
 
 logger = logging.getLogger(__name__)
 logger.setLevel('DEBUG')
@@ -82,13 +83,13 @@ def lambda_handler(planning_start):
         if "DB_URL" in os.environ:
             DB_URL = os.environ['DB_URL']
     
-        dbConnection = DBConnection(DB_URL)
+        dbConnection = connectDB(DB_URL) # reused by warm invocations
         session = dbConnection.session
     
-        cassandra_repo = CassandraRepository(session)
+        cassandra_repo = cassandraRepository(dbConnection, CassandraRepository)
         house_repo = RESTHouseModelRepository(session)
         aggregate_repo = FlexibilityModelRepository(session)
-        flexibility_repo = CassandraAggregateRepository(session)
+        flexibility_repo = cassandraRepository(dbConnection, CassandraAggregateRepository)
          
         ES_URL = 'http://13.48.110.27:9200/'    
         es = connectES(ES_URL)    
@@ -105,26 +106,48 @@ def lambda_handler(planning_start):
         
             subcentrals = getActiveSubcentrals_execution(es, utility)# return subcentrals belonging to the utility      
             logger.info(f"Active subcentrals are: {subcentrals}")
-    
-            for subcentral in subcentrals:
-                  
-                logger.info(f"Plan for subcentral_id = {subcentral}")
-                  
-                house = House(
+            preloadParameters(house_repo, subcentrals)
+            
+            # HOUSE_WORKERS schedules the subcentrals in worker processes, with the peak hours read once per grid zone
+            if HOUSE_WORKERS > 1:
+                grid_peaks = {grid: runGridPeak(utility, grid, aggregate_repo, flexibility_repo, planning_start)
+                              for grid in {subcentral["grid_zone"] for subcentral in subcentrals}}
+                tasks = [(House(
                     location=subcentral["geo_city"],
                     customer_id=subcentral['customer_id'],
                     subcentral_id=subcentral['subcentral_id'],
                     longitude=subcentral['geo_coord_lon'],
                     latitude=subcentral["geo_coord_lat"],
                     grid_zone=subcentral["grid_zone"]
-                    )
+                    ), (planning_start, grid_peaks[subcentral["grid_zone"]])) for subcentral in subcentrals]
+                
+                for house, output in runHouses(runSubcentralForecaster, tasks, DB_URL, cassandra_repo, house_repo):
+                    logger.info(f"Schedule for subcentral_id = {house.subcentral_id} {'done' if output is not None else 'failed'}")
+                
+            else:
+                for subcentral in subcentrals:
+                  
+                    logger.info(f"Plan for subcentral_id = {subcentral}")
+                  
+                    house = House(
+                        location=subcentral["geo_city"],
+                        customer_id=subcentral['customer_id'],
+                        subcentral_id=subcentral['subcentral_id'],
+                        longitude=subcentral['geo_coord_lon'],
+                        latitude=subcentral["geo_coord_lat"],
+                        grid_zone=subcentral["grid_zone"]
+                        )
                 
-                grid_peak = runGridPeak(utility, subcentral["grid_zone"], aggregate_repo, flexibility_repo, planning_start)
-                runSubcentralForecaster(house, cassandra_repo, house_repo, planning_start, grid_peak)
+                    grid_peak = runGridPeak(utility, subcentral["grid_zone"], aggregate_repo, flexibility_repo, planning_start)
+                    runSubcentralForecaster(house, cassandra_repo, house_repo, planning_start, grid_peak)
             
-        dbConnection.db_shutdown()
+        house_repo.parameter_cache.log_summary()
+        house_repo.heatcurves.log_summary()
+        cassandra_repo.weather_cache.log_summary()
+        SolverStrategy.STATS.log_summary()
+        summary = runSummary(dbConnection)
     
-        return json.dumps({})
+        return json.dumps(summary)
     
     except ValueError as ve:
         logger.error(ve)
@@ -6,12 +6,16 @@ from datetime import *
 from db import *
 from forecasters._forecast_flexibility import HouseDataForecaster
 from forecasters._plan_aggregation import AggregationPlan
-from regulators._mpc_flexibility_plan import MPCController_Plan
+from regulators._mpc_flexibility_plan import MPCController_Plan, MPCController_FleetPlan
 from models import *
 from deploy_utils import *
+from mpc.solver import SolverStrategy
+from mpc import fleet
 logger = logging.getLogger(__name__)
 logger.setLevel('DEBUG')
 
+FLEET_SOLVE = "FLEET_SOLVE" in os.environ
+
 '''
     Flexheat V4.0
     Step 1.3 in the 3-step service delivery model
@@ -47,6 +51,49 @@ def runSubcentralForecaster(house, cassandra_repo, house_repo, planning_start, g
     except Exception as ex:
         logger.error(ex)
 
+# Subcentral-level planning of all subcentrals of a grid zone, solved as block problems (see mpc/fleet.py)
+def runFleetForecaster(houses, cassandra_repo, house_repo, planning_start, grid_peak):
+    logger.info(f"start forecaster for {len(houses)} houses")
+
+    forecasters = []
+    
+    for house in houses:
+        logger.info(f"{house}")
+        
+        try:
+            forecasters.append(HouseDataForecaster(
+                house=house,
+                cassandra_repo=cassandra_repo,
+                house_repo=house_repo,
+                planning_start=planning_start,
+                grid_peak = grid_peak
+            ))
+            
+        except ValueError as ve:
+            logger.error(ve)
+
+        except Exception as ex:
+            logger.error(ex)
+
+    controller = MPCController_FleetPlan(forecasters)
+
+    outputs = controller.control()
+    subcentral_plans = []
+    
+    for forecaster, output in zip(forecasters, outputs):
+        
+        if output is None:
+            continue
+        
+        try:
+            cassandra_repo.write_plan_for_house(forecaster._house, output, house_repo)
+            subcentral_plans.append(output)
+
+        except Exception as ex:
+            logger.error(ex)
+            
+    return subcentral_plans
+
 # Aggregation-level planning, estimate aggregate flexibility in the grid        
 def runGridForecaster(customer, grid, aggregate_repo, planning_start, subcentral_plans, flexibility_repo):
     logger.info(f"Aggregate flexibility for energy company customer_id = {customer}, grid_zone = {grid}")
@@ -78,13 +125,13 @@ def lambda_handler():
         if "DB_URL" in os.environ:
             DB_URL = os.environ['DB_URL']
     
-        dbConnection = DBConnection(DB_URL)
+        dbConnection = connectDB(DB_URL) # reused by warm invocations
         session = dbConnection.session
     
-        cassandra_repo = CassandraRepository(session)
+        cassandra_repo = cassandraRepository(dbConnection, CassandraRepository)
         house_repo = RESTHouseModelRepository(session)
         aggregate_repo = FlexibilityModelRepository(session)
-        flexibility_repo = CassandraAggregateRepository(session)
+        flexibility_repo = cassandraRepository(dbConnection, CassandraAggregateRepository)
       
         start = datetime.utcnow() + timedelta(hours=1)
         start = start.strftime("%Y-%m-%d %H:00:00.000Z")
@@ -127,28 +174,49 @@ def lambda_handler():
                     continue
                 
                 logger.info(f"Active subcentrals are: {subcentrals}")
-      
-                for subcentral in subcentrals:
-                    
-                    logger.info(f"Plan for subcentral = {subcentral}")
-                    
-                    house = House(
-                        location=subcentral["geo_city"],
-                        customer_id=subcentral['customer_id'],
-                        subcentral_id=subcentral['subcentral_id'],
-                        longitude=subcentral['geo_coord_lon'],
-                        latitude=subcentral["geo_coord_lat"],
-                        grid_zone=subcentral["grid_zone"]
-                    )
-                    subcentral_plan = runSubcentralForecaster(house, cassandra_repo, house_repo, planning_start, grid_peak)
+                preloadParameters(house_repo, subcentrals)
+                
+                houses = [House(
+                    location=subcentral["geo_city"],
+                    customer_id=subcentral['customer_id'],
+                    subcentral_id=subcentral['subcentral_id'],
+                    longitude=subcentral['geo_coord_lon'],
+                    latitude=subcentral["geo_coord_lat"],
+                    grid_zone=subcentral["grid_zone"]
+                ) for subcentral in subcentrals]
+                
+                # FLEET_SOLVE plans the subcentrals of the grid zone together, one solver call per problem structure
+                # Only for subcentrals with a block solver (mpc_solver HIGHS or CLARABEL, see mpc/fleet.py), the others
+                # (e.g. the default CVXOPT) are planned one by one as without it
+                if FLEET_SOLVE:
+                    subcentral_plans = runFleetForecaster(houses, cassandra_repo, house_repo, planning_start, grid_peak)
+                
+                # HOUSE_WORKERS plans the subcentrals in worker processes, the plans come back as they finish
+                elif HOUSE_WORKERS > 1:
+                    for house, subcentral_plan in runHouses(runSubcentralForecaster, [(house, (planning_start, grid_peak)) for house in houses], DB_URL, cassandra_repo, house_repo):
+                        
+                        if subcentral_plan is not None:
+                            subcentral_plans.append(subcentral_plan)
                     
-                    subcentral_plans.append(subcentral_plan)
+                else:
+                    for house in houses:
+                        
+                        logger.info(f"Plan for subcentral = {house}")
+                        
+                        subcentral_plan = runSubcentralForecaster(house, cassandra_repo, house_repo, planning_start, grid_peak)
+                        
+                        subcentral_plans.append(subcentral_plan)
                     
                 runGridForecaster(utility, grid, aggregate_repo, planning_start, subcentral_plans, flexibility_repo)
             
-        dbConnection.db_shutdown()
+        house_repo.parameter_cache.log_summary()
+        house_repo.heatcurves.log_summary()
+        cassandra_repo.weather_cache.log_summary()
+        SolverStrategy.STATS.log_summary()
+        fleet.PROBLEMS.log_summary()
+        summary = runSummary(dbConnection)
     
-        return json.dumps({})
+        return json.dumps(summary)
     
     except ValueError as ve:
         logger.error(ve)
@@ -73,13 +73,13 @@ def lambda_handler(report_start):
         if "DB_URL" in os.environ:
             DB_URL = os.environ['DB_URL']
     
-        dbConnection = DBConnection(DB_URL)
+        dbConnection = connectDB(DB_URL) # reused by warm invocations
         session = dbConnection.session
     
-        cassandra_repo = CassandraRepository(session)
+        cassandra_repo = cassandraRepository(dbConnection, CassandraRepository)
         house_repo = RESTHouseModelRepository(session)
         aggregate_repo = FlexibilityModelRepository(session)
-        flexibility_repo = CassandraAggregateRepository(session)
+        flexibility_repo = cassandraRepository(dbConnection, CassandraAggregateRepository)
        
         ES_URL = 'http://13.48.110.27:9200/'
         
@@ -113,6 +113,7 @@ def lambda_handler(report_start):
                 subcentrals = getActiveSubcentrals(es, utility, grid)
                 
                 logger.info(f"Active subcentrals are: {subcentrals}")
+                preloadParameters(house_repo, subcentrals)
       
                 for subcentral in subcentrals:
                     
@@ -132,9 +133,12 @@ def lambda_handler(report_start):
                     
                 runGridReporter(utility, grid, aggregate_repo, report_start, subcentral_reports, flexibility_repo)
             
-        dbConnection.db_shutdown()
+        house_repo.parameter_cache.log_summary()
+        house_repo.heatcurves.log_summary()
+        cassandra_repo.weather_cache.log_summary()
+        summary = runSummary(dbConnection)
     
-        return json.dumps({})
+        return json.dumps(summary)
     
     except ValueError as ve:
         logger.error(ve)
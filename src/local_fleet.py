@@ -0,0 +1,208 @@
+import logging
+import argparse
+from datetime import datetime, timedelta
+import numpy as np
+import pytz
+from db._local import LocalSession, LocalElasticsearch, LOCAL_PREFIX
+
+logger = logging.getLogger(__name__)
+logger.setLevel('DEBUG')
+
+'''
+    Flexheat V4.0
+    Synthetic fleet for offline runs of the lambdas on the local backend (db/_local.py)
+
+    python local_fleet.py --db /tmp/fleet.sqlite --utilities 1 --customers 20 --subcentrals 10 --grids 2
+    DB_URL=local:/tmp/fleet.sqlite ES_URL=local:/tmp/fleet.sqlite python lambda_function_plan.py
+    python local_fleet.py --db /tmp/fleet.sqlite --accept
+    DB_URL=local:/tmp/fleet.sqlite ES_URL=local:/tmp/fleet.sqlite python lambda_function_dispatch.py
+    (then lambda_function_execution.py and lambda_function_report.py the same way)
+
+    Every utility gets --customers customers of --subcentrals subcentrals each, spread over --grids grid zones and --cities
+    weather locations. Measurements cover --days days before the next planning start, forecasts and peak hours
+    --days days on both sides of it. getActiveSubcentrals reads at most 10 customers per utility and
+    10 subcentrals per customer, larger fleets are generated but not planned.
+    --accept stands in for the utility confirming the plans: the aggregate plans become the aggregate dispatch.
+    --measure adds the measurements of the planned day, so the report has data to compare the plans with.
+'''
+
+ASSET_ID = 6000
+PEAK_HOURS = ((7, 9), (17, 19)) # UTC
+
+# Columns read by the parameter classes of mpc/params.py, None means the default value
+PARAMETER_COLUMNS = ["physical_capacitance", "physical_solar_area", "physical_control_valve_alpha", "physical_heat_loss_coeff",
+                     "simulation_thermal_coeff", "simulation_solar_coeff", "simulation_heating_coeff", "simulation_a", "simulation_b",
+                     "mpc_optimization_horizon", "mpc_timestep", "mpc_rate_limit", "mpc_rate_limit_lower", "mpc_below_error_priority",
+                     "mpc_energy_price", "mpc_energy_price_priority", "mpc_max_power_offset", "mpc_setpoint", "mpc_max_ramp",
+                     "flex_above_error_priority", "flex_hysteresis_above", "flex_hysteresis_below", "flex_flexibility_price",
+                     "flex_flexibility_price_priority", "flex_rebound_limit", "mpc_solver", "mpc_solver_warm_start",
+                     "mpc_solver_tolerance", "mpc_solver_max_iter", "mpc_solver_time_limit", "mpc_formulation",
+                     "mpc_fallback", "dynamic_in_temp_diff_lag", "dynamic_out_temp_diff_lag", "dynamic_solar_diff_lag", "dynamic_train_length", "sarimax_train_length", "sarimax_param"]
+
+HEATCURVE_OUT_TEMP = [-20.0, -10.0, 0.0, 10.0, 20.0]
+HEATCURVE_INFLOW_TEMP = [65.0, 55.0, 45.0, 35.0, 25.0]
+
+# Coefficients hardcoded in PnPkModel_Execution
+DYNAMIC_MODEL_COEF = [0.0, 0.9452124, 0.33690313, 5.348071E-4, -0.024608968, -0.16360809, 0.043476336, 0.017029949, -0.008980742, 0.1853629, -0.6580194]
+DYNAMIC_MODEL_INTERCEPT = 1.048
+
+def nextPlanningStart():
+
+    start = datetime.utcnow() + timedelta(hours = 1)
+
+    return start.replace(minute = 0, second = 0, microsecond = 0, tzinfo = pytz.utc)
+
+# Outside temperature of a city, daily cycle around a mean that differs per city
+def outsideTemperature(rng, city, times):
+
+    hours = np.array([(time - times[0]).total_seconds() / 3600 for time in times])
+
+    return 5 + city - 4 * np.cos(2 * np.pi * (hours + times[0].hour - 3) / 24) + rng.normal(0, 0.5, len(times))
+
+def generateFleet(session: LocalSession, es: LocalElasticsearch, utilities, customers, subcentrals, grids, cities,
+                  planning_start, days, sample_minutes, seed):
+
+    rng = np.random.default_rng(seed)
+    now = datetime.utcnow().replace(tzinfo = pytz.utc)
+    hours = [planning_start - timedelta(days = days) + timedelta(hours = i) for i in range(2 * days * 24 + 1)]
+
+    for city in range(cities):
+        forecast = outsideTemperature(rng, city, hours)
+
+        session.insert("darksky_forecast", [{"location": f"city_{city}", "timestamp": time, "temperature": float(temperature),
+                                             "total_cloud_cover": float(rng.uniform(0, 8))} for time, temperature in zip(hours, forecast)])
+
+    subcentral_id = 0
+    fleet = []
+
+    for utility in range(1, utilities + 1):
+        es.index("flexheat_customers", {"customer_id": utility, "customer_parent": 0, "enable_flex": True})
+        session.insert("flexibility_config", [{"customer_id": utility, "planning_horizon": 24, "timestep": 3600}])
+
+        for grid in range(1, grids + 1):
+            peaks = []
+
+            for day in range(-days, days + 1):
+                midnight = (planning_start + timedelta(days = day)).replace(hour = 0)
+
+                for start, end in PEAK_HOURS:
+                    peak = {"customer_id": utility, "grid_zone": grid, "ts_start": midnight + timedelta(hours = start),
+                            "ts_end": midnight + timedelta(hours = end), "tstamp_record": now}
+                    peaks.append(peak)
+                    es.index("flexheat_peak_hours", {"customer_id": utility, "grid_zone": grid,
+                                                     "ts_start": peak["ts_start"].strftime('%Y-%m-%dT%H:%M:%SZ'),
+                                                     "ts_end": peak["ts_end"].strftime('%Y-%m-%dT%H:%M:%SZ')})
+
+            session.insert("peak_hours", peaks)
+
+        for k in range(1, customers + 1):
+            customer = utility * 1000 + k
+            es.index("flexheat_customers", {"customer_id": customer, "customer_parent": utility, "enable_flex": True})
+
+            for i in range(subcentrals):
+                subcentral_id += 1
+                subcentral = {"customer_id": customer, "subcentral_id": subcentral_id, "grid_zone": i % grids + 1,
+                              "enable_fcc": True, "enable_flex": True, "geo_city": f"city_{subcentral_id % cities}",
+                              "geo_coord_lat": float(58 + rng.uniform(-0.5, 0.5)), "geo_coord_lon": float(15 + rng.uniform(-0.5, 0.5))}
+                es.index("flexheat_subcentral", subcentral)
+                fleet.append(subcentral)
+
+                generateSubcentral(session, rng, subcentral, now)
+
+    samples = measurePeriod(session, fleet, planning_start - timedelta(days = days), planning_start, sample_minutes, seed)
+
+    logger.info(f"Generated {utilities} utilities, {len(fleet)} subcentrals, {samples} samples per subcentral")
+
+    return fleet
+
+# Model parameters, heat curve and dynamic model of a subcentral
+def generateSubcentral(session, rng, subcentral, now):
+
+    key = {"customer_id": subcentral["customer_id"], "subcentral_id": subcentral["subcentral_id"]}
+    size = rng.uniform(100, 400) # heating power [kW] at -20 degrees
+    heating_power = [size * (20 - temperature) / 40 for temperature in HEATCURVE_OUT_TEMP]
+
+    session.insert("model_parameters", [dict(key, active = True, tstamp_record = now, **{column: None for column in PARAMETER_COLUMNS})])
+    session.insert("subcentral_heatcurve", [dict(key, active = True, tstamp_record = now, valid_start_month = 1, valid_until_month = 12,
+                                                 break_point_number = len(HEATCURVE_OUT_TEMP), outside_temperature = HEATCURVE_OUT_TEMP,
+                                                 inflow_temperature = HEATCURVE_INFLOW_TEMP, heating_power = heating_power)])
+    session.insert("dynamic_indoor_temperature_model", [dict(key, tstamp_record = now, intercept = DYNAMIC_MODEL_INTERCEPT,
+                                                             variable_coef = DYNAMIC_MODEL_COEF)])
+
+# Measurements of every subcentral in [start, end), e.g. to let a planned period pass before the report
+def measurePeriod(session: LocalSession, fleet, start, end, sample_minutes, seed):
+
+    rng = np.random.default_rng(seed + 1)
+    samples = [start + timedelta(minutes = sample_minutes * i) for i in range(int((end - start).total_seconds() // (60 * sample_minutes)))]
+
+    for subcentral in fleet:
+        key = {"customer_id": subcentral["customer_id"], "subcentral_id": subcentral["subcentral_id"]}
+        outside = outsideTemperature(rng, int(subcentral["geo_city"].split("_")[-1]), samples)
+        inflow = np.interp(outside, HEATCURVE_OUT_TEMP, HEATCURVE_INFLOW_TEMP) + rng.normal(0, 1, len(samples))
+        indoor = 21 + 0.5 * np.sin(np.arange(len(samples)) / 40) + rng.normal(0, 0.1, len(samples))
+
+        session.insert("timeseries", [dict(key, asset_id = ASSET_ID, tstamp_record = time,
+                                           heating_system = {"heating_inflow_temperature": float(inflow_temp),
+                                                             "outside_temperature": float(outside_temp),
+                                                             "heating_outflow_temperature": float(inflow_temp - 15)})
+                                      for time, inflow_temp, outside_temp in zip(samples, inflow, outside)])
+        session.insert("average_measurement", [dict(key, tstamp_record = time, sensor_temperature = float(temperature))
+                                               for time, temperature in zip(samples, indoor)])
+
+    return len(samples)
+
+# The utility confirms every plan in full: aggregate dispatch = aggregate plan
+def acceptPlans(session: LocalSession, planning_start, days):
+
+    parameters = {"mintime": planning_start - timedelta(days = days), "maxtime": planning_start + timedelta(days = days)}
+    rows = session.execute('''
+        SELECT customer_id, grid_zone, ts_start, ts_end, power_offset
+          FROM flexheat.aggregate_flexibility_plan
+         WHERE ts_start >= :mintime
+            AND ts_start <= :maxtime
+    ''', parameters)
+
+    dispatch = [dict(row._asdict(), tstamp_record = datetime.utcnow()) for row in rows]
+    session.insert("aggregate_flexibility_dispatch", dispatch)
+
+    logger.info(f"Accepted {len(dispatch)} aggregate plan rows as dispatch")
+
+    return len(dispatch)
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', required = True, help = 'SQLite file, used as DB_URL and ES_URL local:<file>')
+    parser.add_argument('--utilities', type = int, default = 1)
+    parser.add_argument('--customers', type = int, default = 2, help = 'customers per utility')
+    parser.add_argument('--subcentrals', type = int, default = 10, help = 'subcentrals per customer')
+    parser.add_argument('--grids', type = int, default = 2, help = 'grid zones per utility')
+    parser.add_argument('--cities', type = int, default = 3)
+    parser.add_argument('--days', type = int, default = 2)
+    parser.add_argument('--sample-minutes', type = int, default = 15)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--accept', action = 'store_true', help = 'turn the aggregate plans into aggregate dispatch instead of generating')
+    parser.add_argument('--measure', action = 'store_true', help = 'add measurements of the planned day instead of generating')
+    args = parser.parse_args()
+
+    planning_start = nextPlanningStart()
+    session = LocalSession(args.db)
+
+    try:
+        if args.accept:
+            acceptPlans(session, planning_start, args.days)
+        elif args.measure:
+            fleet = [document["_source"] for document in LocalElasticsearch(LOCAL_PREFIX + args.db).search("flexheat_subcentral", {"size": 1000000})["hits"]["hits"]]
+            measurePeriod(session, fleet, planning_start, planning_start + timedelta(days = 1), args.sample_minutes, args.seed)
+        else:
+            es = LocalElasticsearch(LOCAL_PREFIX + args.db)
+            generateFleet(session, es, args.utilities, args.customers, args.subcentrals, args.grids, args.cities,
+                          planning_start, args.days, args.sample_minutes, args.seed)
+            es.close()
+
+    finally:
+        session.shutdown()
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    main()
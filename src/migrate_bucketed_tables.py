@@ -0,0 +1,99 @@
+import logging
+import os
+import argparse
+from datetime import datetime, timedelta
+import pytz
+from db import DBConnection
+from db._bucketed import BUCKETED_TABLES
+from db._columnar import FETCH_SIZE
+
+logger = logging.getLogger(__name__)
+logger.setLevel('DEBUG')
+
+'''
+    Flexheat V4.0
+    Backfill the day-bucketed tables (create_flexheatV4_bucketed_tables.cql) from the legacy tables
+
+    python migrate_bucketed_tables.py --customers 1 2 --locations Linkoping --start 2020-09-01 --end 2020-10-01
+
+    Legacy rows are read one entity and one day at a time, so every scan stays bounded, and written with the
+    bulk writer. Inserts are upserts, a day can be copied again safely, e.g. after a failure or to catch up
+    on rows written to the legacy tables while the writers still use them (DAY_BUCKETS=write, see db/_bucketed.py).
+    Tables fed by other services (EXTERNAL_TABLES of db/_bucketed.py) stay read from the legacy tables until their
+    writers write the day-bucketed tables as well.
+'''
+
+def backfillDay(dbConnection, table, entity, day_start, dry_run):
+
+    parameters = {"entity": entity,
+                  "mintime": day_start,
+                  "maxtime": day_start + timedelta(days = 1) - timedelta(milliseconds = 1)}
+
+    rows = dbConnection.statements.execute(table.select_template(), parameters, fetch_size = FETCH_SIZE)
+    day = day_start.date()
+    bucketed = []
+
+    for row in rows:
+        values = row._asdict()
+        values["day"] = day
+        bucketed.append((tuple(values[column] for column in table.key) + (day,), values))
+
+    if not dry_run:
+        dbConnection.writer.write(table.insert_template(), bucketed)
+
+    return len(bucketed)
+
+def backfillTable(dbConnection, table, entities, start, end, dry_run):
+
+    copied = 0
+
+    for entity in entities:
+        day_start = start
+
+        while day_start < end:
+            count = backfillDay(dbConnection, table, entity, day_start, dry_run)
+            logger.debug(f"{table.legacy} -> {table.table}: {table.key[0]} = {entity}, {day_start.date()}: {count} rows")
+
+            copied += count
+            day_start += timedelta(days = 1)
+
+    logger.info(f"{table.legacy} -> {table.table}: {copied} rows{' (dry run)' if dry_run else ''}")
+
+    return copied
+
+def main():
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--customers', type = int, nargs = '*', default = [])
+    parser.add_argument('--locations', nargs = '*', default = [], help = 'locations of darksky_forecast')
+    parser.add_argument('--start', required = True, help = 'first day, YYYY-MM-DD (UTC)')
+    parser.add_argument('--end', required = True, help = 'day after the last day, YYYY-MM-DD (UTC)')
+    parser.add_argument('--tables', nargs = '*', default = None, help = 'legacy tables to copy, all by default')
+    parser.add_argument('--dry-run', action = 'store_true', help = 'read and count rows without writing')
+    args = parser.parse_args()
+
+    DB_URL = '13.48.110.27'
+    if "DB_URL" in os.environ:
+        DB_URL = os.environ['DB_URL']
+
+    start = datetime.strptime(args.start, '%Y-%m-%d').replace(tzinfo = pytz.utc)
+    end = datetime.strptime(args.end, '%Y-%m-%d').replace(tzinfo = pytz.utc)
+
+    dbConnection = DBConnection(DB_URL)
+
+    try:
+        for table in BUCKETED_TABLES:
+            if args.tables is not None and table.legacy not in args.tables:
+                continue
+
+            entities = args.locations if table.key[0] == "location" else args.customers
+            backfillTable(dbConnection, table, entities, start, end, args.dry_run)
+
+        dbConnection.writer.log_summary()
+
+    finally:
+        dbConnection.db_shutdown()
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    main()
@@ -1,2 +1,2 @@
-from ._house import House, HeatCurve, ModelOutput, OutTempDeviationForecast, DynamicIndoorModel, Plan, Dispatch, Report
+from ._house import House, HeatCurve, ModelOutput, OutTempDeviationForecast, DynamicIndoorModel, Plan, Dispatch, Report, MPCWarmStart
 from._aggregation import Flexibility
\ No newline at end of file
@@ -38,6 +38,7 @@ class ModelOutput:
     indoor_temp_estimate: float
     solar_irradiation: float
     scheduled_inflow_temp: float
+    fallback: bool = False # schedule of mpc/fallback.py instead of the optimized one
 
 @dataclass_json
 @dataclass(eq=True, frozen=True)
@@ -53,6 +54,7 @@ class Plan:
     heating_power: float
     power_offset: float
     average_indoor_temperature: float
+    fallback: bool = False # plan of mpc/fallback.py instead of the optimized one
 
 @dataclass_json
 @dataclass(eq=True, frozen=True)
@@ -96,4 +98,12 @@ class DynamicIndoorModel:
     tstamp_record: pytz.datetime.datetime
     intercept: float
     variable_coef: typing.List[float]
-    
+
+@dataclass_json
+@dataclass(eq=True, frozen=True)
+class MPCWarmStart:
+    customer_id: int
+    subcentral_id: int
+    model: str # plan or execution
+    tstamp_record: pytz.datetime.datetime
+    solution: str # mpc.warm_start.WarmStart.to_json()
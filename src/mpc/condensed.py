@@ -0,0 +1,45 @@
+import numpy as np
+
+'''
+Condensed formulation of the MPC problems: the indoor temperature states are eliminated.
+
+The dynamic model (see PnPkModel_Plan.dynamics) is linear in temperature, power and the lagged indoor temperature
+differences, and the differences within the horizon are differences of the temperature states. Given the initial
+temperature and the known differences, every temperature is an affine function of the power:
+
+    temperature = free_temperature + temperature_response @ power
+
+free_temperature is the response with zero power, temperature_response the impulse response of each power step
+(lower triangular, row t depends on power[:t]). The problem then only keeps power and the error slacks as variables.
+'''
+
+def temperature_response(temperature_coef, power_coef, in_temp_diff_coef, in_temp_diff_lag, dynamics_offset,
+                         initial_temperature, in_temp_diff_known, max_lag, horizon):
+
+    # Row t: affine function [constant, power[0], ..., power[horizon - 1]] of temperature[t], t = 0 ... horizon
+    temperature = np.zeros((horizon + 1, horizon + 1))
+    temperature[0, 0] = initial_temperature
+
+    # Indoor temperature difference j: known up to max_lag, temperature[s] - temperature[s - 1] for j = max_lag + s
+    def in_temp_diff(j):
+
+        if j <= max_lag:
+            known = np.zeros(horizon + 1)
+            known[0] = in_temp_diff_known[j]
+            return known
+
+        step = j - max_lag
+
+        return temperature[step] - temperature[step - 1]
+
+    for t in range(1, horizon + 1):
+        row = temperature_coef * temperature[t - 1]
+        row[0] += dynamics_offset[t - 1]
+        row[t] += power_coef
+
+        for k, i in enumerate(in_temp_diff_lag):
+            row = row + in_temp_diff_coef[k] * in_temp_diff(max_lag + t - 1 - i)
+
+        temperature[t] = row
+
+    return temperature[:, 0], temperature[:, 1:]
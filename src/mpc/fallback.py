@@ -0,0 +1,48 @@
+import numpy as np
+
+'''
+Fallback schedule of the MPC models, used when the solver finds no solution within its time budget.
+
+The power follows a target (plan: the baseline minus max_power_offset in peak hours, execution: the baseline plus
+the dispatch), clipped to the power limits of the problem: rate limits, baseline +- max_power_offset and the rebound
+cap. Within a peak block the reduction is the smallest reduction of the block, as in the distribute constraints of
+the plan. Ramps are limited to max_ramp from the initial power on by a backward and a forward pass, at most
+MAX_PASSES times.
+The schedule meets the power constraints of the problem whenever the baseline does, the temperature is not
+optimized: it is simulated from the power with the dynamic model (mpc/condensed.py).
+'''
+
+MAX_PASSES = 10
+
+def fallback_power(target, baseline_power, initial_power, max_power_offset, max_ramp, rebound_cap,
+                   rate_limit_lower, rate_limit_upper, blocks = ()):
+
+    lower = np.maximum(np.maximum(baseline_power - max_power_offset, rate_limit_lower), 0)
+    upper = np.minimum(baseline_power + max_power_offset, rate_limit_upper)
+    upper[1:] = np.minimum(upper[1:], rebound_cap[1:])
+    upper = np.maximum(upper, lower)
+
+    power = np.clip(target, lower, upper)
+
+    # The ramp limits can change the reduction within a block, repeated until the schedule does not change
+    for _ in range(MAX_PASSES):
+        previous_power = power.copy()
+
+        for block in blocks:
+            power[block] = baseline_power[block] - np.min(baseline_power[block] - power[block])
+
+        for t in range(len(power) - 2, -1, -1):
+            power[t] = np.clip(power[t], power[t + 1] - max_ramp, power[t + 1] + max_ramp)
+
+        previous = initial_power
+
+        for t in range(len(power)):
+            power[t] = np.clip(power[t], previous - max_ramp, previous + max_ramp)
+            previous = power[t]
+
+        power = np.clip(power, lower, upper)
+
+        if np.allclose(power, previous_power):
+            break
+
+    return power
@@ -0,0 +1,129 @@
+import cvxpy as cp
+import logging
+from mpc.problem_cache import ProblemCache
+
+logger = logging.getLogger("__main__")
+
+'''
+Fleet solve: the plan problems of the subcentrals of a grid zone solved as block problems.
+
+The plan problems of different houses share no variables, so the problems of houses with the same structure
+(problem_key: horizon, lags, formulation, peak blocks) are stacked into one problem: the sum of their objectives
+subject to all of their constraints. Its constraint matrix is block diagonal and its solution is the solution of
+every house. A block is compiled once per structure and number of houses and solved with one solver call, instead
+of one canonicalization (first run) and one solver setup per house.
+Houses of a block also share timestep and solver settings. If a block has no optimal solution, e.g. one house is
+infeasible or the solver ran out of time, its houses are solved one by one like without fleet solve, so the other
+houses of the block still get their plans and a house without solution gets the fallback schedule (mpc/fallback.py).
+
+Only the solvers of BLOCK_SOLVERS solve a block faster than its houses one by one. The time of CVXOPT and ECOS
+grows much faster than the number of houses (CVXOPT: 3 s for 5 houses, 177 s for 20 houses of horizon 24), OSQP
+needs more iterations for a block than for a house. Houses of other solvers, among them the default CVXOPT, are
+solved one by one, blocks hold at most MAX_BLOCK_HOUSES houses.
+Every house of a block is seeded from its own previous solution and keeps its own solution (mpc/warm_start.py).
+'''
+
+BLOCK_SOLVERS = {"HIGHS", "CLARABEL"}
+
+MAX_BLOCK_HOUSES = 50
+
+# Compiled block problems in this process, keyed by (block key, number of houses)
+PROBLEMS = ProblemCache("fleet", max_problems = 8)
+
+# Houses of the same block key are solved in one block problem
+def block_key(model):
+
+    return model.problem_key(), model._timestep, tuple(sorted(model.solver.options().items()))
+
+def _build_block(model, houses):
+
+    entries = [model._build_problem() for _ in range(houses)]
+    problem = cp.Problem(cp.Minimize(cp.sum([house.objective.expr for house, _, _ in entries])),
+                         [constraint for house, _, _ in entries for constraint in house.constraints])
+
+    return problem, [(variables, parameters) for _, variables, parameters in entries]
+
+# Variables of the house, a block problem holds the variables of all of its houses
+def _house_variables(model):
+
+    return [variable for variable in model.variables.values() if isinstance(variable, cp.Variable)]
+
+def _solve_house(model, solve_args):
+
+    try:
+        return model.solve(*solve_args)
+
+    except ValueError as ve:
+        logger.error(ve)
+
+    except Exception as ex:
+        logger.error(ex)
+
+# Plans of the houses of one block key, see solve_fleet
+def _solve_block(key, models, solve_args):
+
+    logger.info(f"Solving {len(models)} houses in one block problem")
+
+    try:
+        # The block is compiled from the first house, all of its houses must have that structure
+        if any(model.problem_key() != models[0].problem_key() for model in models[1:]):
+            raise ValueError("Houses of different structure in one block problem")
+
+        problem, entries = PROBLEMS.get((key, len(models)), lambda: _build_block(models[0], len(models)))
+        seeded = False
+
+        for model, (variables, parameters), (forecast_data, initial_data, diff_data, _) in zip(models, entries, solve_args):
+            model.bind(problem, variables, parameters)
+            model.set_values(forecast_data, initial_data, diff_data)
+            seeded |= model.solver.seed(problem, model.warm_start, forecast_data.index[0], model._timestep, _house_variables(model))
+
+        status = models[0].solver.solve(problem, seeded)
+
+    except Exception as ex:
+        logger.error(ex)
+        status = None
+
+    if status != cp.OPTIMAL:
+        logger.warning(f"Block problem finished with status {status}, solving its {len(models)} houses one by one")
+
+        return [_solve_house(model, args) for model, args in zip(models, solve_args)]
+
+    for model, (forecast_data, _, _, _) in zip(models, solve_args):
+        model.warm_start = model.solver.capture(problem, forecast_data.index[0], model._timestep, _house_variables(model))
+
+    return [model.output(forecast_data, heatcurve) for model, (forecast_data, _, _, heatcurve) in zip(models, solve_args)]
+
+# Plans of the houses, model and solve arguments (forecast_data, initial_data, diff_data, heatcurve) per house
+# None for a house without a solution
+def solve_fleet(models, solve_args):
+
+    outputs = [None] * len(models)
+    blocks = {}
+
+    for i, (model, (forecast_data, _, _, _)) in enumerate(zip(models, solve_args)):
+        try:
+            model.prepare(forecast_data)
+            blocks.setdefault(block_key(model), []).append(i)
+
+        except Exception as ex:
+            logger.error(ex)
+
+    for key, block in blocks.items():
+
+        if len(block) == 1 or models[block[0]].solver.solver not in BLOCK_SOLVERS:
+            if len(block) > 1:
+                logger.warning(f"{models[block[0]].solver.solver} does not solve block problems ({', '.join(sorted(BLOCK_SOLVERS))} do), "
+                               f"solving {len(block)} houses one by one")
+
+            for i in block:
+                outputs[i] = _solve_house(models[i], solve_args[i])
+            continue
+
+        for start in range(0, len(block), MAX_BLOCK_HOUSES):
+            houses = block[start:start + MAX_BLOCK_HOUSES]
+            solved = _solve_block(key, [models[i] for i in houses], [solve_args[i] for i in houses])
+
+            for i, output in zip(houses, solved):
+                outputs[i] = output
+
+    return outputs
@@ -5,6 +5,11 @@ from mpc.params import *
 from attrdict import AttrDict
 import logging
 from utils import estimate_inflow_temp_offset
+from mpc.problem_cache import ProblemCache
+from mpc.solver import SolverStrategy
+from mpc.condensed import temperature_response
+from mpc.fallback import fallback_power
+from mpc.peaks import peak_blocks
 
 logger = logging.getLogger("__main__")
 
@@ -16,6 +21,9 @@ class Parameters(AttrDict):
 
 class PnPkModel_Plan(object):
 
+    # Compiled problems of the plan models in this process, keyed by structure (see problem_key)
+    PROBLEMS = ProblemCache("plan")
+
     def __init__(
             self,
             physical: PhysicalHouseParameters,
@@ -32,7 +40,11 @@ class PnPkModel_Plan(object):
             
         self._horizon = self._config.optimization_horizon
         self._problem = None
+        self.solver = SolverStrategy.from_config(self._config)
+        self.warm_start = None # Solution of the previous run before solve(), of this run after it, see mpc/warm_start.py
+        self.fallback = False # True if the plan of solve() is the fallback schedule, see mpc/fallback.py
         self._timestep = self._config.timestep
+        self._condensed = self._config.formulation == "condensed"
         
         # Add for auto dynamic model
         self._max_lag = max(max(self._dynamic.in_temp_diff_lag), max(self._dynamic.out_temp_diff_lag), max(self._dynamic.solar_diff_lag))        
@@ -49,11 +61,16 @@ class PnPkModel_Plan(object):
         Index for power: [0, 1, ..., horizon - 1], index for temperature: [0, 1, 2, ..., horizon]
         '''        
         self._variables.power = cp.Variable(shape = self._horizon, name='Power', nonneg=True)
-        self._variables.temperature = cp.Variable(shape = self._horizon + 1, name='Temperature')
+        
+        # Condensed formulation: temperature is an expression of power (see to_problem), in_temp_diff is not needed
+        if not self._condensed:
+            self._variables.temperature = cp.Variable(shape = self._horizon + 1, name='Temperature')
+            
         self._variables.below_error = cp.Variable(shape = self._horizon + 1, name='Temp below error', nonneg=True)
         
         # Add for auto dynamic model
-        self._variables.in_temp_diff = cp.Variable(shape = self._max_lag + self._horizon, name = '1st order differencing of indoor temperature')
+        if not self._condensed:
+            self._variables.in_temp_diff = cp.Variable(shape = self._max_lag + self._horizon, name = '1st order differencing of indoor temperature')
         
         # Add for flexibility service
         self._variables.above_error = cp.Variable(shape = self._horizon + 1, name = 'Temp above error', nonneg=True)
@@ -89,6 +106,22 @@ class PnPkModel_Plan(object):
         self._parameters.flexibility_price = cp.Parameter(name = 'Flexibility price')
         self._parameters.above_error_priority = cp.Parameter(name = 'Cost amplification of above error')
         self._parameters.rebound_limit = cp.Parameter(shape = self._horizon, name = 'Rebound limit')
+
+        # Products of the parameters above, computed in solve() so that the problem stays DPP-compliant
+        n_in_lags = len(self._dynamic.in_temp_diff_lag)
+        self._parameters.temperature_coef = cp.Parameter(name = 'Dynamic model coefficient of temperature')
+        self._parameters.power_coef = cp.Parameter(name = 'Dynamic model coefficient of power')
+        self._parameters.in_temp_diff_coef = cp.Parameter(shape = n_in_lags, name = 'Dynamic model coefficients of indoor temperature differences')
+        self._parameters.dynamics_offset = cp.Parameter(shape = self._horizon, name = 'Dynamic model terms without variables')
+        self._parameters.energy_weight = cp.Parameter(name = 'Energy cost per power and time step')
+        self._parameters.flexibility_weight = cp.Parameter(shape = self._horizon, name = 'Flexibility income per power reduction and time step')
+        self._parameters.flexibility_baseline = cp.Parameter(name = 'Flexibility income of the baseline power')
+        self._parameters.rebound_cap = cp.Parameter(shape = self._horizon, name = 'Baseline power with rebound limit')
+
+        # Condensed formulation, see mpc/condensed.py
+        if self._condensed:
+            self._parameters.free_temperature = cp.Parameter(shape = self._horizon + 1, name = 'Temperature without power')
+            self._parameters.temperature_response = cp.Parameter(shape = (self._horizon + 1, self._horizon), name = 'Temperature response to power')
         
     @property
     def parameters(self):
@@ -108,83 +141,60 @@ class PnPkModel_Plan(object):
         v = self._variables
         p = self._parameters
         dynamic = self._dynamic
-        model = self._model
-        house = self._physical
-#         model.variable_coef = [0.0, 0.9452124, 0.33690313, 5.348071E-4, -0.024608968, -0.16360809, 0.043476336, 0.017029949, -0.008980742, 0.1853629, -0.6580194]
-#         model.intercept = 1.048 
 
         # Define dynamic model
-        dynamic_model = []
+        # The coefficients are parameters (see dynamics_values), in the sequence of variable_coef:
+        # c1 * T[t-1] + c2 * solar[t-1] + c3 * P[t-1] + c4 * (T[t-1] - out[t-1]) + in_temp_diff lags + out_temp_diff lags + solar_diff lags
+        # with c1 + c4 in temperature_coef and the terms without variables in dynamics_offset
+        # One vector equation for t = 1 ... horizon, the lag i of in_temp_diff is the window [max_lag - i, max_lag - i + horizon)
+        dynamic_model = p.temperature_coef * v.temperature[:-1] + p.power_coef * v.power + p.dynamics_offset
         
-        for t in range(1, self._horizon + 1):
-            
-            # Define model variables
-            '''
-            Sequence matters!!!
-            Sequence keeps consistent with ../dynamic_model/model_trainer.py: DynamicModelGenerator.training_data()            
-            Alternative: Multiply indoor-outdoor temperature difference with house.heat_loss_coeff, reflecting physical relationships
-            '''                
-#             model_variables =[v.temperature[t - 1], 
-#                                       p.solar[t-1],
-#                                       v.power[t-1],
-#                                       (v.temperature[t-1] - p.outdoor_temp[t-1]) * house.heat_loss_coeff]
-            model_variables =[v.temperature[t - 1], 
-                                      p.solar[t-1],
-                                      v.power[t-1],
-                                      (v.temperature[t-1] - p.outdoor_temp[t-1])]            
-     
-            for i in dynamic.in_temp_diff_lag:
-                model_variables.append(v.in_temp_diff[self._max_lag + t - 1 - i])
-            
-            for i in dynamic.out_temp_diff_lag:
-                model_variables.append(p.out_temp_diff[self._max_lag + t - 1 - i])
-                                      
-            for i in dynamic.solar_diff_lag:
-                model_variables.append(p.solar_diff[self._max_lag + t - 1 - i])
-            
-            # Define dynamic model equation              
-            if len(model.variable_coef) != len(model_variables) + 1:
-                logger.error('Length of dynamic model variable_coef <> length of model variables.')
-                
-            eq = 1 * model.variable_coef[0]
-            
-            for i in range(len(model_variables)):
-                
-#                 '''
-#                 Multiply each model variables with self._timestep / house.capacitance, reflecting physical relationships
-#                 '''                
-#                eq += model_variables[i] * model.variable_coef[i+1] * self._timestep / house.capacitance
-                eq += model_variables[i] * model.variable_coef[i+1]
-                
-            eq += model.intercept
-            
-            dynamic_model.append(eq)
+        for k, i in enumerate(dynamic.in_temp_diff_lag):
+            dynamic_model += p.in_temp_diff_coef[k] * v.in_temp_diff[self._max_lag - i:self._max_lag - i + self._horizon]
         
         return [
-            v.temperature[t] == dynamic_model[t-1]  for t in range(1, self._horizon + 1)
+            v.temperature[1:] == dynamic_model
         ]  
+
+    # Values of the dynamic model parameters
+    def dynamics_values(self, outdoor_temp, solar, out_temp_diff, solar_diff):
+        
+        dynamic = self._dynamic
+        model = self._model
+#         model.variable_coef = [0.0, 0.9452124, 0.33690313, 5.348071E-4, -0.024608968, -0.16360809, 0.043476336, 0.017029949, -0.008980742, 0.1853629, -0.6580194]
+#         model.intercept = 1.048 
+        
+        '''
+        Sequence matters!!!
+        Sequence keeps consistent with ../dynamic_model/model_trainer.py: DynamicModelGenerator.training_data()            
+        Alternative: Multiply indoor-outdoor temperature difference with house.heat_loss_coeff, reflecting physical relationships
+        '''
+        n_in, n_out, n_solar = len(dynamic.in_temp_diff_lag), len(dynamic.out_temp_diff_lag), len(dynamic.solar_diff_lag)
+        
+        if len(model.variable_coef) != 4 + n_in + n_out + n_solar + 1:
+            logger.error('Length of dynamic model variable_coef <> length of model variables.')
+        
+        coef = np.asarray(model.variable_coef, dtype = float)
+        steps = self._max_lag + np.arange(self._horizon)
+        
+        offset = coef[0] + model.intercept + coef[2] * solar - coef[4] * outdoor_temp
+        
+        for k, i in enumerate(dynamic.out_temp_diff_lag):
+            offset = offset + coef[5 + n_in + k] * out_temp_diff[steps - i]
+        
+        for k, i in enumerate(dynamic.solar_diff_lag):
+            offset = offset + coef[5 + n_in + n_out + k] * solar_diff[steps - i]
+        
+        return coef[1] + coef[4], coef[3], coef[5:5 + n_in], offset
         
     # Find out consecutive peak hours
     # Assumption (according to feedback from Tekniska Verken): planned power reduction is expected equal during the consecutive peak hours
     # The flexibility distribution among peak hours can be adjusted if other requests are proposed by energy company
+    # Blocks as (start, end) with end exclusive, see mpc/peaks.py; the blocks are also part of problem_key
     def find_consecutive_peak(self):
         
-        result = []
-        p = self._parameters.peak_hour
-        a = 0
-        if p[0] == 1:
-          result[a].append(i)
-          
-        for i in range(1, len(p)):
-              if p[i] == 1 and p[i] - p[i-1] == 1:
-                  result.append([])
-                  result[a].append(i)
-              if p[i] == 1 and p[i] - p[i-1] == 0:
-                  result[a].append(i)
-              elif p[i] == 0 and p[i] - p[i-1] == -1:
-                  a+=1
-            
-        self._consecutive_peak = result
+        starts, ends = peak_blocks(self._peak_hour)
+        self._consecutive_peak = tuple(zip(starts.tolist(), ends.tolist()))
 
     # Other constraints of the optimization        
     def to_problem(self):
@@ -196,66 +206,67 @@ class PnPkModel_Plan(object):
 
         logger.info('Constructing optimization constraints')
 
-        initial = [
-            v.temperature[0] == p.initial_temperature
-        ]
-           
-        # Add for auto dynamic model: 1st order differencing of indoor temperature 
-        temperature_diff = [
-            v.in_temp_diff[i] == p.in_temp_diff_known[i] for i in range(0, self._max_lag + 1)
-        ] + [            
-            v.in_temp_diff[i] == v.temperature[i - self._max_lag] - v.temperature[i - self._max_lag -1] 
-            for i in range(self._max_lag + 1, self._max_lag + self._horizon)
-        ]
+        # Constraints over whole vectors, t = 0 ... horizon - 1 for power and t = 0 ... horizon for temperature
+        if self._condensed:
+            
+            # Temperature states are eliminated, see mpc/condensed.py
+            v.temperature = p.free_temperature + p.temperature_response @ v.power
+            states = []
+            
+        else:
+            
+            initial = [
+                v.temperature[0] == p.initial_temperature
+            ]
+               
+            # Add for auto dynamic model: 1st order differencing of indoor temperature 
+            temperature_diff = [
+                v.in_temp_diff[:self._max_lag + 1] == p.in_temp_diff_known[:self._max_lag + 1]
+            ] + ([
+                v.in_temp_diff[self._max_lag + 1:] == cp.diff(v.temperature[:-1])
+            ] if self._horizon > 1 else [])
+            
+            states = self.dynamics + initial + temperature_diff
         
         rate_limit = [
-            v.power[t] <= p.rate_limit_upper for t in range(self._horizon)
-        ] + [
-            v.power[t] >= p.rate_limit_lower for t in range(self._horizon)
+            v.power <= p.rate_limit_upper,
+            v.power >= p.rate_limit_lower
         ]
         
-#         errors = [
-#             v.below_error[t] >= p.setpoint - p.hysteresis_below - v.temperature[t] for t in range(self._horizon + 1)
-#         ]
         errors = [
-            v.below_error[t] >= p.setpoint - p.hysteresis_below - v.temperature[t] for t in range(self._horizon + 1)
-        ] + [
-            v.above_error[t] >= v.temperature[t] - p.setpoint - p.hysteresis_above for t in range(self._horizon + 1)
+            v.below_error >= p.setpoint - p.hysteresis_below - v.temperature,
+            v.above_error >= v.temperature - p.setpoint - p.hysteresis_above
         ]
                 
         reference = [
-            v.power[t] <= p.baseline_power[t] + self.parameters.max_power_offset for t in range(self._horizon)
-        ] + [
-            v.power[t] >= p.baseline_power[t] - self.parameters.max_power_offset for t in range(self._horizon)
+            v.power <= p.baseline_power + p.max_power_offset,
+            v.power >= p.baseline_power - p.max_power_offset
         ]
 
         smoothness = [
-            v.power[t] - v.power[t-1] <= self.parameters.max_ramp for t in range(1, self._horizon)
+            cp.diff(v.power) <= p.max_ramp,
+            -cp.diff(v.power) <= p.max_ramp
         ] + [
-            v.power[t-1] - v.power[t] <= self.parameters.max_ramp for t in range(1, self._horizon)
+            v.power[0] - p.initial_power <= p.max_ramp 
         ] + [
-            v.power[0] - p.initial_power <= self.parameters.max_ramp 
-        ] + [
-            p.initial_power - v.power[0] <= self.parameters.max_ramp 
+            p.initial_power - v.power[0] <= p.max_ramp 
         ]
 
         # Add for flexibility service
         # Power increase are assumed within a certain limit
         rebound = [
-            v.power[t] <= p.baseline_power[t] * (1 + p.rebound_limit) for t in range(1, self._horizon)
+            v.power[1:] <= p.rebound_cap[1:]
             ]    
         
         # Add for flexibility service
         # Assumption (according to feedback from Tekniska Verken): planned power reduction is expected equal during the consecutive peak hours
         # The flexibility distribution among peak hours can be adjusted if other requests are proposed by energy company        
-        distribute = []
-        if len(self._consecutive_peak) != 0:
-            for i in self._consecutive_peak:
-                if len(i) > 1:
-                    for j in range(0, len(i) - 1):
-                        distribute += [v.power[i[j]] - p.baseline_power[i[j]] == v.power[i[j+1]] - p.baseline_power[i[j+1]]] 
+        # One difference constraint per block: equal power - baseline_power over its steps
+        distribute = [
+            cp.diff(v.power[start:end] - p.baseline_power[start:end]) == 0 for start, end in self._consecutive_peak if end - start > 1
+        ]
         
-        constraints = self.dynamics + initial + temperature_diff + rate_limit + errors + reference + smoothness + rebound + distribute
+        constraints = states + rate_limit + errors + reference + smoothness + rebound + distribute
         
         return cp.Problem(
             objective=self.objective,
@@ -280,6 +291,9 @@ class PnPkModel_Plan(object):
             Revision would be needed if other business models are adopted.
 
         The priorities are used to adjust the significance of each component
+
+        The products of prices, priorities and peak hours are single parameters (energy_weight, flexibility_weight),
+        the flexibility income of the baseline is flexibility_weight @ baseline_power (flexibility_baseline)
         
         '''
 
@@ -287,15 +301,79 @@ class PnPkModel_Plan(object):
         p = self._parameters
         
         return cp.Minimize(
-                p.below_error_priority * sum(v.below_error)
-                + p.above_error_priority * sum(v.above_error)
-                + p.energy_price_priority * p.energy_price * sum(v.power) * self._timestep / 3600
-                - p.flexibility_price_priority * p.flexibility_price * sum((baseline - power) * peak \
-                   for baseline, power, peak in zip(p.baseline_power, v.power, p.peak_hour)) \
-                   * self._timestep / 3600
+                p.below_error_priority * cp.sum(v.below_error)
+                + p.above_error_priority * cp.sum(v.above_error)
+                + p.energy_weight * cp.sum(v.power)
+                - (p.flexibility_baseline - p.flexibility_weight @ v.power)
         )
+
+    # Values of the parameters that are products of other parameters
+    def set_derived_values(self):
+
+        p = self._parameters
+
+        p.temperature_coef.value, p.power_coef.value, p.in_temp_diff_coef.value, p.dynamics_offset.value = self.dynamics_values(
+            p.outdoor_temp.value, p.solar.value, p.out_temp_diff.value, p.solar_diff.value)
+        p.energy_weight.value = p.energy_price_priority.value * p.energy_price.value * self._timestep / 3600
+        p.flexibility_weight.value = p.flexibility_price_priority.value * p.flexibility_price.value * p.peak_hour.value * self._timestep / 3600
+        p.flexibility_baseline.value = p.flexibility_weight.value @ p.baseline_power.value
+        p.rebound_cap.value = p.baseline_power.value * (1 + p.rebound_limit.value)
+
+        if self._condensed:
+            p.free_temperature.value, p.temperature_response.value = temperature_response(
+                p.temperature_coef.value, p.power_coef.value, p.in_temp_diff_coef.value, self._dynamic.in_temp_diff_lag, p.dynamics_offset.value,
+                p.initial_temperature.value, p.in_temp_diff_known.value, self._max_lag, self._horizon)
+
+    # Fallback schedule (see mpc/fallback.py) in the variables of the problem: max_power_offset in the peak hours
+    def set_fallback(self):
+
+        p = self._parameters
+        power = fallback_power(p.baseline_power.value - p.max_power_offset.value * p.peak_hour.value, p.baseline_power.value,
+                               p.initial_power.value, p.max_power_offset.value, p.max_ramp.value, p.rebound_cap.value,
+                               p.rate_limit_lower.value, p.rate_limit_upper.value,
+                               [slice(start, end) for start, end in self._consecutive_peak])
+        free_temperature, response = temperature_response(
+            p.temperature_coef.value, p.power_coef.value, p.in_temp_diff_coef.value, self._dynamic.in_temp_diff_lag, p.dynamics_offset.value,
+            p.initial_temperature.value, p.in_temp_diff_known.value, self._max_lag, self._horizon)
+        temperature = free_temperature + response @ power
+
+        self._variables.power.value = power
+
+        if not self._condensed:
+            self._variables.temperature.value = temperature
+
+        self._variables.below_error.value = np.maximum(p.setpoint.value - p.hysteresis_below.value - temperature, 0)
+        self._variables.above_error.value = np.maximum(temperature - p.setpoint.value - p.hysteresis_above.value, 0)
+
+    # Everything that changes the structure of the problem, the values of the parameters do not
+    def problem_key(self):
+
+        return (self._horizon, tuple(self._dynamic.in_temp_diff_lag), tuple(self._dynamic.out_temp_diff_lag),
+                tuple(self._dynamic.solar_diff_lag), self._config.formulation, self._consecutive_peak)
+
+    def _build_problem(self):
+
+        self._init_variables()
+        self._init_parameters()
+        problem = self.to_problem()
+
+        if not problem.is_dpp():
+            logger.warning('Optimization problem is not DPP-compliant, it is canonicalized on every solve')
+
+        return problem, self._variables, self._parameters
         
-    def solve(self, forecast_data, initial_data, diff_data, heatcurve):
+    # Structure of the problem for a forecast: peak blocks, see problem_key
+    def prepare(self, forecast_data):
+
+        self._peak_hour = forecast_data.peak_hour.values
+        self.find_consecutive_peak()
+
+    # Solve with a compiled problem: (problem, variables, parameters) of this structure
+    def bind(self, problem, variables, parameters):
+
+        self._problem, self._variables, self._parameters = problem, variables, parameters
+
+    def set_values(self, forecast_data, initial_data, diff_data):
 
         logger.info("Setting values for optimization parameters")
         self._parameters.outdoor_temp.value = forecast_data.out_temp.values
@@ -309,63 +387,80 @@ class PnPkModel_Plan(object):
         self._parameters.setpoint.value = self._config.setpoint #23 for test
         self._parameters.below_error_priority.value = self._config.below_error_priority
         self._parameters.energy_price_priority.value = self._config.energy_price_priority
-        self._parameters.rate_limit_lower = self._config.rate_limit_lower
-        self._parameters.rate_limit_upper = self._config.rate_limit_upper
+        self._parameters.rate_limit_lower.value = self._config.rate_limit_lower
+        self._parameters.rate_limit_upper.value = self._config.rate_limit_upper
         
         # Add for dynamic model
-        self._parameters.out_temp_diff = diff_data.out_temp_diff.values
-        self._parameters.solar_diff = diff_data.solar_diff.values
-        self._parameters.in_temp_diff_known = diff_data.in_temp_diff.values
+        lags = self._max_lag + self._horizon
+        self._parameters.out_temp_diff.value = diff_data.out_temp_diff.values[:lags]
+        self._parameters.solar_diff.value = diff_data.solar_diff.values[:lags]
+        self._parameters.in_temp_diff_known.value = diff_data.in_temp_diff.values[:lags]
 
         # Add for flexibility service
-        self._parameters.hysteresis_above = self._config.hysteresis_above
-        self._parameters.hysteresis_below = self._config.hysteresis_below
-        self._parameters.peak_hour = forecast_data.peak_hour.values
-        self._parameters.flexibility_price_priority = self._config.flexibility_price_priority
-        self._parameters.flexibility_price = self._config.flexibility_price_priority
-        self._parameters.above_error_priority = self._config.above_error_priority
-        self._parameters.rebound_limit = self._config.rebound_limit
-        
-        self.find_consecutive_peak()
+        self._parameters.hysteresis_above.value = self._config.hysteresis_above
+        self._parameters.hysteresis_below.value = self._config.hysteresis_below
+        self._parameters.peak_hour.value = self._peak_hour
+        self._parameters.flexibility_price_priority.value = self._config.flexibility_price_priority
+        self._parameters.flexibility_price.value = self._config.flexibility_price_priority
+        self._parameters.above_error_priority.value = self._config.above_error_priority
+        self._parameters.rebound_limit.value = np.full(self._horizon, self._config.rebound_limit)
         
-        problem = self.to_problem()
+        self.set_derived_values()
 
-        logger.info('Call CVXOPT for solution...')
+    def solve(self, forecast_data, initial_data, diff_data, heatcurve):
 
-        problem.solve(solver=cp.CVXOPT)
+        self.prepare(forecast_data)
         
-        output = pd.DataFrame(index=forecast_data.index)
+        # The problem of this structure compiled by an earlier solve, or a new one
+        self.bind(*self.PROBLEMS.get(self.problem_key(), self._build_problem))
+        self.set_values(forecast_data, initial_data, diff_data)
         
-        if problem.status != cp.OPTIMAL:
+        problem = self._problem
+        start = forecast_data.index[0]
+        seeded = self.solver.seed(problem, self.warm_start, start, self._timestep)
+        status = self.solver.solve(problem, seeded)
+        self.fallback = status != cp.OPTIMAL
+        
+        if self.fallback and not self._config.fallback:
             raise ValueError("Solver did not find solutions!")
-                
-        else:
+        
+        if self.fallback:
+            logger.warning(f'Solver did not find solutions ({status}), using the fallback schedule')
+            self.set_fallback()
+            self.solver.STATS.add_fallback()
             
+        else:
             logger.info('Solution found!')
+            self.warm_start = self.solver.capture(problem, start, self._timestep)
+        
+        return self.output(forecast_data, heatcurve)
     
-            output['out_temp_forecast'] = forecast_data.forecast_outside_temp.values
-            output['out_temp_with_deviation'] = forecast_data.out_temp.values
-            output['power'] = self.variables.power.value
-            output['indoor_temperature'] = self.variables.temperature[1:].value
-            output['baseline_power'] = forecast_data.baseline_power.values
-            output['power_offset'] = output['power'] - output['baseline_power']
-            output['below_error'] = self.variables.below_error[1:].value
-            output['solar'] = forecast_data.predict_solar.values
+    # Plan of the house from the solution
+    def output(self, forecast_data, heatcurve):
+        
+        output = pd.DataFrame(index=forecast_data.index)
+        
+        output['out_temp_forecast'] = forecast_data.forecast_outside_temp.values
+        output['out_temp_with_deviation'] = forecast_data.out_temp.values
+        output['power'] = self.variables.power.value
+        output['indoor_temperature'] = self.variables.temperature[1:].value
+        output['baseline_power'] = forecast_data.baseline_power.values
+        output['power_offset'] = output['power'] - output['baseline_power']
+        output['below_error'] = self.variables.below_error[1:].value
+        output['solar'] = forecast_data.predict_solar.values
+        output['fallback'] = self.fallback
+        
+        output['inflow_temp_offset'], output['new_inflow_temp'] = estimate_inflow_temp_offset(
+            heatcurve, output['out_temp_with_deviation'].values, output['power_offset'].values)
             
-            for index, row in output.iterrows():
-                
-                inflow_temp_offset, new_inflow_temp = estimate_inflow_temp_offset(heatcurve, row['out_temp_with_deviation'], row['power_offset'])
-                output.at[index, 'inflow_temp_offset'] = inflow_temp_offset
-                output.at[index, 'new_inflow_temp'] = new_inflow_temp
-                
-#             print(output['indoor_temperature'])
-#             print(output['power'])
-#             print(output['baseline_power'])
-#             print(output['power_offset'])
-#             print(output['out_temp_forecast'])
-#             print(output['out_temp_with_deviation'])
-#             print(output['inflow_temp_offset'])
-#             print(output['new_inflow_temp'])
-#             print(output['below_error'])
-               
-            return output
\ No newline at end of file
+#         print(output['indoor_temperature'])
+#         print(output['power'])
+#         print(output['baseline_power'])
+#         print(output['power_offset'])
+#         print(output['out_temp_forecast'])
+#         print(output['out_temp_with_deviation'])
+#         print(output['inflow_temp_offset'])
+#         print(output['new_inflow_temp'])
+#         print(output['below_error'])
+           
+        return output
\ No newline at end of file
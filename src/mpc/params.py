@@ -68,6 +68,17 @@ class MPCConfiguration:
     flexibility_price: float = 1.000
     flexibility_price_priority: float = 1
     rebound_limit: float = 0.5
+    # Solver strategy, see mpc/solver.py; None means the default of the solver
+    solver: str = "CVXOPT"
+    solver_warm_start: bool = False
+    solver_tolerance: float = None
+    solver_max_iter: int = None
+    solver_time_limit: float = 30 # unit: second, a solve that takes longer ends without solution
+    # full: temperature states are variables, condensed: they are eliminated, see mpc/condensed.py
+    formulation: str = "full"
+    # Schedule of mpc/fallback.py if the solver finds no solution within solver_time_limit, so every house gets a plan
+    # and schedule; mpc_fallback = false opts a customer out, its houses without solution then fail as before
+    fallback: bool = True
     
     def __init__(self, parameters):
         if not (parameters["mpc_optimization_horizon"] is None):
@@ -113,6 +124,22 @@ class MPCConfiguration:
             self.flexibility_price = parameters["flex_flexibility_price_priority"]
         if not (parameters["flex_rebound_limit"] is None):
             self.rebound_limit = parameters["flex_rebound_limit"]            
+
+        # Solver strategy, the columns are optional in model_parameters
+        if not (parameters.get("mpc_solver") is None):
+            self.solver = parameters["mpc_solver"]
+        if not (parameters.get("mpc_solver_warm_start") is None):
+            self.solver_warm_start = parameters["mpc_solver_warm_start"]
+        if not (parameters.get("mpc_solver_tolerance") is None):
+            self.solver_tolerance = parameters["mpc_solver_tolerance"]
+        if not (parameters.get("mpc_solver_max_iter") is None):
+            self.solver_max_iter = parameters["mpc_solver_max_iter"]
+        if not (parameters.get("mpc_solver_time_limit") is None):
+            self.solver_time_limit = parameters["mpc_solver_time_limit"]
+        if not (parameters.get("mpc_formulation") is None):
+            self.formulation = parameters["mpc_formulation"]
+        if not (parameters.get("mpc_fallback") is None):
+            self.fallback = parameters["mpc_fallback"]
      
 @dataclass
 class DynamicConfiguration:
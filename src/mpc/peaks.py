@@ -0,0 +1,15 @@
+import numpy as np
+
+'''
+Peak blocks of a planning horizon: runs of consecutive peak hours (peak_hour == 1).
+
+A block is (start, end) with end exclusive, so the steps of a block are peak_hour[start:end]. The blocks are found by
+run-length encoding: the edges of the 0/1 sequence padded with 0 on both sides are the starts (+1) and ends (-1).
+'''
+
+# Start and end (exclusive) arrays of the peak blocks
+def peak_blocks(peak_hour):
+
+    edges = np.diff(np.concatenate(([0], np.asarray(peak_hour) == 1, [0])).astype(int))
+
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
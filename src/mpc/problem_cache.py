@@ -0,0 +1,55 @@
+from collections import OrderedDict
+import logging
+
+logger = logging.getLogger("__main__")
+
+class ProblemCache:
+
+    '''
+    Optimization problems of the models, built once per structure and re-solved with new parameter values.
+
+    The problems are DPP-compliant (disciplined parametrized programming), so CVXPY canonicalizes a problem on its
+    first solve only, every following solve just maps the parameter values into the solver data.
+    A key holds everything that changes the structure of a problem, e.g. (horizon, lags, peak blocks).
+    The least recently used problem is dropped beyond max_problems. A cached problem is solved by one caller
+    at a time: the cache is meant for one process, or one thread of it.
+    '''
+
+    MAX_PROBLEMS = 32
+
+    def __init__(self, name, max_problems = MAX_PROBLEMS):
+
+        self.name = name
+        self.max_problems = max_problems
+        self.hits = 0
+        self.misses = 0
+        self._problems = OrderedDict()
+
+    # build() returns the entry of a key, e.g. (problem, variables, parameters)
+    def get(self, key, build):
+
+        entry = self._problems.get(key)
+
+        if entry is not None:
+            self.hits += 1
+            self._problems.move_to_end(key)
+            return entry
+
+        self.misses += 1
+        entry = build()
+        self._problems[key] = entry
+
+        if len(self._problems) > self.max_problems:
+            self._problems.popitem(last = False)
+
+        logger.debug(f"Built {self.name} problem for {key}, {len(self._problems)} cached")
+
+        return entry
+
+    def clear(self):
+
+        self._problems.clear()
+
+    def log_summary(self):
+
+        logger.info(f"Problem cache summary for {self.name}: hits {self.hits}, misses {self.misses}, cached {len(self._problems)}")
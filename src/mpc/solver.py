@@ -0,0 +1,213 @@
+import cvxpy as cp
+import contextlib
+import functools
+import signal
+import threading
+import time
+import logging
+from mpc import warm_start as warm_starts
+
+logger = logging.getLogger("__main__")
+
+# Names of the solve options in CVXPY per solver: (absolute tolerance, relative tolerance, max iterations, time limit [s])
+# None: the solver has no such option, the setting is ignored
+SOLVER_OPTIONS = {
+    "CVXOPT": ("abstol", "reltol", "max_iters", None),
+    "ECOS": ("abstol", "reltol", "max_iters", None),
+    "CLARABEL": ("tol_gap_abs", "tol_gap_rel", "max_iter", "time_limit"),
+    "OSQP": ("eps_abs", "eps_rel", "max_iter", "time_limit"),
+    "SCS": ("eps_abs", "eps_rel", "max_iters", "time_limit_secs"),
+    "HIGHS": ("primal_feasibility_tolerance", "dual_feasibility_tolerance", "simplex_iteration_limit", "time_limit"),
+    "GLPK": (None, None, None, None),
+    "GUROBI": ("FeasibilityTol", "OptimalityTol", "IterationLimit", "TimeLimit"),
+}
+
+# Solvers that can start from the previous solution of the same problem
+WARM_START_SOLVERS = {"OSQP", "SCS", "CLARABEL", "HIGHS", "GUROBI"}
+
+DEFAULT_SOLVER = "CVXOPT"
+
+class SolveSummary:
+
+    '''Solves, iterations and solve time of the solvers in this process, split by seeded (see mpc/warm_start.py) and cold solves'''
+
+    def __init__(self):
+
+        self.clear()
+
+    def add(self, problem: cp.Problem, seeded):
+
+        stats = problem.solver_stats
+        kind = "seeded" if seeded else "cold"
+        self.solves[kind] += 1
+        self.iterations[kind] += stats.num_iters or 0
+        self.solve_time[kind] += stats.solve_time or 0
+
+    # A schedule of mpc/fallback.py instead of a solution
+    def add_fallback(self):
+
+        self.fallbacks += 1
+
+    # Seeded and cold solves, their iterations and solve time, and the fallback schedules
+    def merge(self, other):
+
+        for kind in ("seeded", "cold"):
+            self.solves[kind] += other.solves[kind]
+            self.iterations[kind] += other.iterations[kind]
+            self.solve_time[kind] += other.solve_time[kind]
+
+        self.fallbacks += other.fallbacks
+
+    def clear(self):
+
+        self.solves = {"seeded": 0, "cold": 0}
+        self.iterations = {"seeded": 0, "cold": 0}
+        self.solve_time = {"seeded": 0.0, "cold": 0.0}
+        self.fallbacks = 0
+
+    def log_summary(self):
+
+        for kind in ("seeded", "cold"):
+            solves = max(self.solves[kind], 1)
+            logger.info(f"Solver summary for {kind} solves: {self.solves[kind]} solves, "
+                        f"{self.iterations[kind] / solves:.1f} iterations and {self.solve_time[kind] / solves * 1e3:.1f} ms per solve")
+
+        logger.info(f"Solver summary: {self.fallbacks} fallback schedules")
+
+class SolveTimeout(Exception):
+    pass
+
+# Raise SolveTimeout in the block after seconds, for solvers without a time limit option
+# Only in the main thread (signals), a timer that runs already is kept
+@contextlib.contextmanager
+def deadline(seconds):
+
+    if seconds is None or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    outer_delay, _ = signal.getitimer(signal.ITIMER_REAL)
+
+    if outer_delay and outer_delay <= seconds:
+        yield
+        return
+
+    def expire(signum, frame):
+        raise SolveTimeout(f"Solver did not finish within {seconds} seconds")
+
+    outer_handler = signal.signal(signal.SIGALRM, expire)
+    start = time.monotonic()
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+
+    try:
+        yield
+
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, outer_handler)
+
+        if outer_delay:
+            signal.setitimer(signal.ITIMER_REAL, max(outer_delay - (time.monotonic() - start), 1e-3))
+
+# Checking the installed solvers imports all of them, once per process
+@functools.lru_cache(maxsize = None)
+def installed_solvers():
+
+    return frozenset(cp.installed_solvers())
+
+class SolverStrategy:
+
+    '''
+    Solver of the MPC problems of one customer, see the mpc_solver* settings of MPCConfiguration.
+
+    The plan and execution problems are LPs, any of the open-source LP/QP solvers of SOLVER_OPTIONS solves them.
+    A solver that is not installed falls back to DEFAULT_SOLVER. With warm start, a solver of WARM_START_SOLVERS
+    starts from the previous solution of the problem: the problems are cached per structure (see ProblemCache),
+    so a solve starts from the last house solved with the same structure in this process.
+    Tolerances, iterations and time limit are passed only if set, otherwise the defaults of the solver apply.
+    The time limit is the budget of a solve: solvers without a time limit option are stopped by deadline().
+    Solvers that CVXPY starts from Variable.value can also start from the solution of the previous run (seed, capture).
+    '''
+
+    # Solves of all strategies in this process
+    STATS = SolveSummary()
+
+    def __init__(self, solver = DEFAULT_SOLVER, warm_start = False, tolerance = None, max_iter = None, time_limit = None):
+
+        solver = solver.upper()
+
+        if solver not in SOLVER_OPTIONS or solver not in installed_solvers():
+            logger.warning(f"Solver {solver} is not available, {DEFAULT_SOLVER} is used")
+            solver = DEFAULT_SOLVER
+
+        self.solver = solver
+        self.warm_start = warm_start and solver in WARM_START_SOLVERS
+        self.tolerance = tolerance
+        self.max_iter = max_iter
+        self.time_limit = time_limit
+
+    @classmethod
+    def from_config(cls, mpc_config):
+
+        return cls(mpc_config.solver, mpc_config.solver_warm_start, mpc_config.solver_tolerance,
+                   mpc_config.solver_max_iter, mpc_config.solver_time_limit)
+
+    # Keyword arguments of cp.Problem.solve
+    def options(self):
+
+        abs_tol, rel_tol, max_iter, time_limit = SOLVER_OPTIONS[self.solver]
+        options = {"solver": self.solver, "warm_start": self.warm_start}
+
+        for name, value in ((abs_tol, self.tolerance), (rel_tol, self.tolerance), (max_iter, self.max_iter), (time_limit, self.time_limit)):
+            if name is not None and value is not None:
+                options[name] = value
+
+        return options
+
+    # The solution of each run is kept per subcentral and seeds the next run, see mpc/warm_start.py
+    @property
+    def seeds_from_previous_run(self):
+
+        return self.warm_start and self.solver in warm_starts.SEEDED_SOLVERS
+
+    # Start the next solve of the problem from warm_start, the solution of the previous run, True if seeded
+    def seed(self, problem: cp.Problem, warm_start, start, timestep, variables = None):
+
+        if not self.warm_start:
+            return False
+
+        return warm_starts.seed(problem, self.solver, warm_start, start, timestep, variables)
+
+    # Solution of the last solve, for the warm start of the next run
+    def capture(self, problem: cp.Problem, start, timestep, variables = None):
+
+        if not self.warm_start:
+            return None
+
+        return warm_starts.capture(problem, self.solver, start, timestep, variables)
+
+    # Status of the solve, None if the solver failed or ran out of time (problem.status is then the one of the last solve)
+    def solve(self, problem: cp.Problem, seeded = False):
+
+        logger.info(f'Call {self.solver} for solution...')
+
+        budget = self.time_limit if SOLVER_OPTIONS[self.solver][3] is None else None
+
+        try:
+            with deadline(budget):
+                problem.solve(**self.options())
+
+        except (cp.error.SolverError, SolveTimeout) as ex:
+            logger.warning(f'{self.solver} failed: {ex}')
+            return None
+
+        stats = problem.solver_stats
+        self.STATS.add(problem, seeded)
+        logger.info(f'{self.solver} finished with status {problem.status}, solve time {stats.solve_time}, iterations {stats.num_iters}'
+                    f'{", seeded from the previous run" if seeded else ""}')
+
+        return problem.status
+
+    def __repr__(self):
+
+        return f"SolverStrategy({self.options()})"
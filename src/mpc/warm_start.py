@@ -0,0 +1,99 @@
+from datetime import datetime
+import json
+import numpy as np
+import cvxpy as cp
+import logging
+
+logger = logging.getLogger("__main__")
+
+'''
+Warm start of an MPC problem from the solution of the previous run of the same subcentral.
+
+The plan and execution run every hour over a horizon that moved by one or two time steps, so the previous
+solution shifted by the elapsed steps is close to the new one. A solution is kept as the values of the variables
+of the problem, per variable name. The values of the new problem are looked up at time step + elapsed steps, steps
+beyond the previous horizon repeat the last value.
+
+Seeding uses the public interface of CVXPY only: the shifted values are set as Variable.value and the problem is
+solved with warm_start=True. CVXPY passes Variable.value as the starting point to the solvers of SEEDED_SOLVERS.
+The others (e.g. HiGHS, OSQP) start from their own last solve of the compiled problem in this process, see
+WARM_START_SOLVERS of mpc/solver.py.
+'''
+
+SEEDED_SOLVERS = {"GUROBI"}
+
+class WarmStart:
+
+    def __init__(self, start: datetime, timestep, solver, primal):
+
+        self.start = start # time of the first step of the solved horizon
+        self.timestep = timestep
+        self.solver = solver
+        self.primal = primal # variable name: values
+
+    # Time steps from start to a new planning start, None if the solution can not be shifted there
+    def elapsed_steps(self, start: datetime, timestep):
+
+        if timestep != self.timestep:
+            return None
+
+        steps, rest = divmod((start - self.start).total_seconds(), timestep)
+
+        if rest != 0 or steps < 0:
+            return None
+
+        return int(steps)
+
+    def to_json(self):
+
+        return json.dumps({"start": self.start.isoformat(), "timestep": self.timestep, "solver": self.solver,
+                           "primal": {name: values.tolist() for name, values in self.primal.items()}})
+
+    # Solutions written before the duals were dropped still load, their duals are ignored
+    @classmethod
+    def from_json(cls, text):
+
+        state = json.loads(text)
+
+        return cls(datetime.fromisoformat(state["start"]), state["timestep"], state["solver"],
+                   {name: np.asarray(values, dtype = float) for name, values in state["primal"].items()})
+
+# Solution of the last solve, None if the solver is not seeded or the problem was not solved
+# variables: the ones of one house if the problem holds several (a block problem of mpc/fleet.py), all by default
+def capture(problem: cp.Problem, solver, start: datetime, timestep, variables = None):
+
+    if solver not in SEEDED_SOLVERS or problem.status != cp.OPTIMAL:
+        return None
+
+    variables = problem.variables() if variables is None else variables
+    primal = {variable.name(): np.ravel(variable.value, order = "F") for variable in variables if variable.value is not None}
+
+    return WarmStart(start, timestep, solver, primal)
+
+# Set the variables of the problem to a previous solution, True if the next solve (warm_start=True) starts from it
+def seed(problem: cp.Problem, solver, warm_start: WarmStart, start: datetime, timestep, variables = None):
+
+    if warm_start is None or solver not in SEEDED_SOLVERS:
+        return False
+
+    steps_elapsed = warm_start.elapsed_steps(start, timestep)
+
+    if steps_elapsed is None:
+        return False
+
+    seeded = False
+
+    for variable in problem.variables() if variables is None else variables:
+        previous = warm_start.primal.get(variable.name())
+
+        if previous is None or len(previous) == 0:
+            continue
+
+        values = previous[np.minimum(np.arange(variable.size) + steps_elapsed, len(previous) - 1)]
+        variable.value = variable.project(np.reshape(values, variable.shape, order = "F"))
+        seeded = True
+
+    if seeded:
+        logger.debug(f"Seeded {solver} from the solution at {warm_start.start}, {steps_elapsed} steps before")
+
+    return seeded
@@ -13,10 +13,19 @@ class MPCController_Execution:
     def control(self) -> pd.DataFrame:
         logger.info(f"Fetching planning data for {self._forecaster._house.customer_id, self._forecaster._house.subcentral_id}")
                 
-        output = self._forecaster.optimization_model_execution().solve(self._forecaster.forecast_data, 
-                                                             self._forecaster.initial_data,
-                                                             self._forecaster.diff_data,                                                                                                    
-                                                             self._forecaster.heatcurve)
+        model = self._forecaster.optimization_model_execution()
+        
+        # Start from the solution of the previous run, see mpc/warm_start.py
+        if model.solver.seeds_from_previous_run:
+            model.warm_start = self._forecaster.warm_start("execution")
+                
+        output = model.solve(self._forecaster.forecast_data, 
+                             self._forecaster.initial_data,
+                             self._forecaster.diff_data,                                                                                                    
+                             self._forecaster.heatcurve)
+        
+        if model.solver.seeds_from_previous_run:
+            self._forecaster.write_warm_start("execution", model.warm_start)
 
         return output
     
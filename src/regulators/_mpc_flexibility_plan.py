@@ -1,4 +1,5 @@
 from forecasters._forecast_flexibility import HouseDataForecaster
+from mpc.fleet import solve_fleet
 import pandas as pd
 import pytz
 import logging
@@ -13,12 +14,63 @@ class MPCController_Plan:
     def control(self) -> pd.DataFrame:
         logger.info(f"Fetching planning data for {self._forecaster._house.customer_id, self._forecaster._house.subcentral_id}")
                 
-        output = self._forecaster.optimization_model_plan().solve(self._forecaster.forecast_data, 
-                                                             self._forecaster.initial_data,
-                                                             self._forecaster.diff_data,                                                                                                    
-                                                             self._forecaster.heatcurve)
+        model = self._forecaster.optimization_model_plan()
+        
+        # Start from the solution of the previous run, see mpc/warm_start.py
+        if model.solver.seeds_from_previous_run:
+            model.warm_start = self._forecaster.warm_start("plan")
+                
+        output = model.solve(self._forecaster.forecast_data, 
+                             self._forecaster.initial_data,
+                             self._forecaster.diff_data,                                                                                                    
+                             self._forecaster.heatcurve)
+        
+        if model.solver.seeds_from_previous_run:
+            self._forecaster.write_warm_start("plan", model.warm_start)
 
         return output
     
 
 
+
+class MPCController_FleetPlan:
+    def __init__(self, forecasters: list):
+        
+        self._forecasters = forecasters
+
+    # Plans of the houses, solved as block problems (see mpc/fleet.py), None for a house without a solution
+    def control(self) -> list:
+        logger.info(f"Fetching planning data for {len(self._forecasters)} subcentrals")
+        
+        models = []
+        
+        for forecaster in self._forecasters:
+            try:
+                models.append(forecaster.optimization_model_plan())
+            
+            except Exception as ex:
+                logger.error(ex)
+                models.append(None)
+                
+        houses = [i for i, model in enumerate(models) if model is not None]
+        
+        # Start from the solutions of the previous run, see mpc/warm_start.py
+        for i in houses:
+            if models[i].solver.seeds_from_previous_run:
+                models[i].warm_start = self._forecasters[i].warm_start("plan")
+        
+        solved = solve_fleet([models[i] for i in houses], 
+                             [(self._forecasters[i].forecast_data, 
+                               self._forecasters[i].initial_data,
+                               self._forecasters[i].diff_data,
+                               self._forecasters[i].heatcurve) for i in houses])
+        
+        outputs = [None] * len(self._forecasters)
+        
+        for i, output in zip(houses, solved):
+            outputs[i] = output
+            
+            if models[i].solver.seeds_from_previous_run:
+                self._forecasters[i].write_warm_start("plan", models[i].warm_start)
+            
+        return outputs
@@ -142,6 +142,7 @@ def lambda_handler():
                     continue
                 
                 logger.info(f"Active subcentrals are: {subcentrals}")
+                preloadParameters(house_repo, subcentrals)
       
                 for subcentral in subcentrals:
                     
@@ -161,6 +162,10 @@ def lambda_handler():
                     
                 runGridForecaster(utility, grid, aggregate_repo, planning_start, subcentral_plans, flexibility_repo)
             
+        dbConnection.writer.log_summary()
+        house_repo.parameter_cache.log_summary()
+        house_repo.heatcurves.log_summary()
+        cassandra_repo.weather_cache.log_summary()
         dbConnection.db_shutdown()
     
         return json.dumps({})
@@ -0,0 +1,118 @@
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import pytest
+import models
+from db import CassandraHouseRepository, LocalDBConnection
+
+TIMESTEP = 3600
+
+class Parameters:
+
+    '''House model repository returning the timestep of the plan, all write_plan_for_house needs'''
+
+    def get_parameters_by_house(self, house):
+
+        return None, None, SimpleNamespace(timestep = TIMESTEP), None, None
+
+@pytest.fixture
+def repository():
+
+    connection = LocalDBConnection("local::memory:")
+
+    yield CassandraHouseRepository(connection.session)
+
+    connection.db_shutdown()
+
+def house(grid_zone = 1):
+
+    return models.House(location = "Linkoping", customer_id = 1, subcentral_id = 7, longitude = 15.6, latitude = 58.4, grid_zone = grid_zone)
+
+def plan(steps = 6, start = "2020-10-01 00:00"):
+
+    index = pd.date_range(start, periods = steps, freq = f"{TIMESTEP}s", tz = "UTC")
+    power = np.linspace(200.0, 250.0, steps)
+
+    return pd.DataFrame({"out_temp_with_deviation": np.linspace(2.0, 4.5, steps),
+                         "baseline_power": power + 20.0,
+                         "power": power,
+                         "power_offset": -20.0,
+                         "indoor_temperature": 21.0,
+                         "fallback": False}, index = index)
+
+def changed(repository, output, grid_zone = 1):
+
+    return repository._changed_rows(repository._LAST_PLAN_QUERY_TEMPLATE, house(grid_zone), output, TIMESTEP, repository._PLAN_VALUES)
+
+def test_rows_without_a_written_row_are_changed(repository):
+
+    assert changed(repository, plan()).all()
+
+def test_written_rows_are_unchanged(repository):
+
+    output = plan()
+    repository.write_plan_for_house(house(), output, Parameters())
+
+    assert not changed(repository, output).any()
+
+def test_values_are_compared_with_write_tolerance(repository):
+
+    output = plan()
+    repository.write_plan_for_house(house(), output, Parameters())
+
+    output.iloc[1, output.columns.get_loc("power")] += 10 * repository.write_tolerance
+    output.iloc[3, output.columns.get_loc("power")] += repository.write_tolerance / 10
+
+    assert changed(repository, output).tolist() == [False, True, False, False, False, False]
+
+def test_nan_values(repository):
+
+    output = plan()
+    output.iloc[2, output.columns.get_loc("indoor_temperature")] = np.nan
+    repository.write_plan_for_house(house(), output, Parameters())
+
+    # NaN is unchanged against a written NaN, a value replacing it is changed
+    assert not changed(repository, output).any()
+
+    output.iloc[2, output.columns.get_loc("indoor_temperature")] = 21.0
+
+    assert changed(repository, output).tolist() == [False, False, True, False, False, False]
+
+def test_new_rows_of_a_moved_horizon_are_changed(repository):
+
+    repository.write_plan_for_house(house(), plan(), Parameters())
+
+    output = plan().iloc[2:].reindex(plan(start = "2020-10-01 02:00").index).fillna(0.0)
+
+    assert changed(repository, output).tolist() == [False, False, False, False, True, True]
+
+def test_another_grid_zone_is_changed(repository):
+
+    output = plan()
+    repository.write_plan_for_house(house(), output, Parameters())
+
+    assert changed(repository, output, grid_zone = 2).all()
+
+def test_without_write_tolerance_every_row_is_changed(repository):
+
+    output = plan()
+    repository.write_plan_for_house(house(), output, Parameters())
+    repository.write_tolerance = None
+
+    assert changed(repository, output).all()
+
+# The flag of the fallback plans (mpc/fallback.py) is written, a plan that stops or starts being one is changed
+def test_fallback_plans_are_flagged(repository):
+
+    output = plan()
+    output["fallback"] = True
+    repository.write_plan_for_house(house(), output, Parameters())
+
+    rows = repository.session.execute("SELECT ts_start, fallback FROM flexheat.subcentral_flexibility_plan WHERE customer_id = 1 AND subcentral_id = 7")
+
+    assert [row.fallback for row in rows] == [True] * len(output)
+    assert not changed(repository, output).any()
+
+    output["fallback"] = False
+
+    assert changed(repository, output).all()
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from mpc.fallback import fallback_power
+
+STEPS = 24
+MAX_POWER_OFFSET = 60.0
+MAX_RAMP = 40.0
+RATE_LIMIT_LOWER = 70.0
+RATE_LIMIT_UPPER = 600.0
+TOLERANCE = 1e-9
+
+# Baseline within the rate limits and the ramp limit, as the schedule meets the limits whenever the baseline does
+def baseline(seed):
+
+    rng = np.random.default_rng(seed)
+
+    return np.clip(300 + np.cumsum(rng.uniform(-MAX_RAMP / 2, MAX_RAMP / 2, STEPS)), RATE_LIMIT_LOWER + 50, RATE_LIMIT_UPPER - 50)
+
+def schedule(target, baseline_power, rebound_cap = None, blocks = ()):
+
+    rebound_cap = np.full(STEPS, np.inf) if rebound_cap is None else rebound_cap
+
+    return fallback_power(target, baseline_power, baseline_power[0], MAX_POWER_OFFSET, MAX_RAMP, rebound_cap,
+                          RATE_LIMIT_LOWER, RATE_LIMIT_UPPER, blocks)
+
+def assert_within_limits(power, baseline_power, rebound_cap = None):
+
+    assert np.all(power >= np.maximum(baseline_power - MAX_POWER_OFFSET, RATE_LIMIT_LOWER) - TOLERANCE)
+    assert np.all(power <= np.minimum(baseline_power + MAX_POWER_OFFSET, RATE_LIMIT_UPPER) + TOLERANCE)
+    assert np.all(np.abs(np.diff(np.concatenate(([baseline_power[0]], power)))) <= MAX_RAMP + TOLERANCE)
+
+    if rebound_cap is not None:
+        assert np.all(power[1:] <= rebound_cap[1:] + TOLERANCE)
+
+def test_target_within_limits_is_kept():
+
+    baseline_power = baseline(0)
+
+    assert np.allclose(schedule(baseline_power, baseline_power), baseline_power)
+
+@pytest.mark.parametrize("seed", range(10))
+def test_target_far_off_is_clipped_to_the_limits(seed):
+
+    baseline_power = baseline(seed)
+    target = baseline_power + np.random.default_rng(seed).choice([-1000.0, 1000.0], STEPS)
+    power = schedule(target, baseline_power)
+
+    assert_within_limits(power, baseline_power)
+
+# The step into the block is limited by the ramp, the block keeps one reduction
+def test_reduction_in_peak_hours():
+
+    baseline_power = np.full(STEPS, 300.0)
+    peak_hour = np.zeros(STEPS)
+    peak_hour[10:14] = 1
+    power = schedule(baseline_power - MAX_POWER_OFFSET * peak_hour, baseline_power, blocks = [slice(10, 14)])
+
+    assert np.allclose(power[10:14], 300.0 - min(MAX_POWER_OFFSET, MAX_RAMP))
+    assert np.allclose(power[:9], 300.0)
+    assert_within_limits(power, baseline_power)
+
+@pytest.mark.parametrize("seed", range(10))
+def test_rebound_cap(seed):
+
+    baseline_power = baseline(seed)
+    rebound_cap = baseline_power + 5.0
+    power = schedule(baseline_power + MAX_POWER_OFFSET, baseline_power, rebound_cap)
+
+    assert_within_limits(power, baseline_power, rebound_cap)
+
+@pytest.mark.parametrize("seed", range(10))
+def test_equal_reduction_within_a_block(seed):
+
+    baseline_power = baseline(seed)
+    target = baseline_power - np.random.default_rng(seed).uniform(0, MAX_POWER_OFFSET, STEPS)
+    power = schedule(target, baseline_power, blocks = [slice(6, 10), slice(16, 20)])
+    reduction = baseline_power - power
+
+    assert np.allclose(reduction[6:10], reduction[6])
+    assert np.allclose(reduction[16:20], reduction[16])
+    assert_within_limits(power, baseline_power)
+
+def test_ramp_from_the_initial_power():
+
+    baseline_power = np.full(STEPS, 300.0)
+    power = fallback_power(baseline_power, baseline_power, 200.0, MAX_POWER_OFFSET, MAX_RAMP, np.full(STEPS, np.inf),
+                           RATE_LIMIT_LOWER, RATE_LIMIT_UPPER)
+
+    assert power[0] == pytest.approx(300.0 - MAX_POWER_OFFSET)
+    assert np.all(np.abs(np.diff(np.concatenate(([200.0], power)))) <= MAX_RAMP + TOLERANCE)
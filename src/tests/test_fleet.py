@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from mpc import fleet
+from mpc.greybox_plan import PnPkModel_Plan
+from mpc.solver import SolverStrategy
+from benchmarks._mpc_instances import mpcInstance
+
+HORIZON = 24
+
+def houses(count, solver = "HIGHS", horizon = HORIZON):
+
+    models, solve_args = [], []
+
+    for seed in range(count):
+        model_args, args = mpcInstance(horizon, 3600, seed = seed)
+        model = PnPkModel_Plan(*model_args)
+        model.solver = SolverStrategy(solver)
+        models.append(model)
+        solve_args.append(args)
+
+    return models, solve_args
+
+@pytest.fixture(autouse = True)
+def compiled_problems():
+
+    fleet.PROBLEMS.clear()
+    PnPkModel_Plan.PROBLEMS.clear()
+    yield
+    fleet.PROBLEMS.clear()
+    PnPkModel_Plan.PROBLEMS.clear()
+
+def test_block_solve_matches_the_house_solves():
+
+    models, solve_args = houses(3)
+    misses = fleet.PROBLEMS.misses
+    outputs = fleet.solve_fleet(models, solve_args)
+
+    assert fleet.PROBLEMS.misses == misses + 1
+
+    for (model_args, args), output in zip([mpcInstance(HORIZON, 3600, seed = seed) for seed in range(3)], outputs):
+        model = PnPkModel_Plan(*model_args)
+        model.solver = SolverStrategy("HIGHS")
+        np.testing.assert_allclose(output["power"], model.solve(*args)["power"], atol = 1e-3)
+
+def test_houses_of_other_solvers_are_solved_one_by_one():
+
+    models, solve_args = houses(2, solver = "CVXOPT")
+    misses = fleet.PROBLEMS.misses
+    outputs = fleet.solve_fleet(models, solve_args)
+
+    assert fleet.PROBLEMS.misses == misses
+    assert all(output is not None for output in outputs)
+
+# A block is compiled from its first house, houses of another structure are solved one by one
+def test_block_of_different_structures_is_not_solved_together():
+
+    models, solve_args = houses(1)
+    other_models, other_args = houses(1, horizon = HORIZON + 1)
+    models, solve_args = models + other_models, solve_args + other_args
+
+    for model, (forecast_data, _, _, _) in zip(models, solve_args):
+        model.prepare(forecast_data)
+
+    misses = fleet.PROBLEMS.misses
+    outputs = fleet._solve_block(fleet.block_key(models[0]), models, solve_args)
+
+    assert fleet.PROBLEMS.misses == misses
+    assert [len(output) for output in outputs] == [HORIZON, HORIZON + 1]
+
+# Without a solution of the block or of the house, a house gets the fallback schedule
+def test_failed_block_gives_the_fallback_schedules(monkeypatch):
+
+    models, solve_args = houses(3)
+
+    for model in models:
+        model._config.fallback = True
+
+    monkeypatch.setattr(SolverStrategy, "solve", lambda self, problem, seeded = False: None)
+    outputs = fleet.solve_fleet(models, solve_args)
+
+    assert all(output is not None and output["fallback"].all() for output in outputs)
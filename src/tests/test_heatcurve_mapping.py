@@ -0,0 +1,74 @@
+import itertools
+import numpy as np
+import pytest
+import models
+from utils import estimate_inflow_temp_offset, estimate_baseline_power, estimate_reference_inflow_temp
+
+OUT_TEMP = [-20.0, -10.0, 0.0, 10.0, 20.0]
+INFLOW_TEMP = [65.0, 55.0, 45.0, 35.0, 25.0]
+POWER = [400.0, 300.0, 200.0, 100.0, 50.0]
+
+def heatcurve(break_point = len(OUT_TEMP), out_temp = OUT_TEMP, inflow_temp = INFLOW_TEMP, power = POWER):
+
+    return models.HeatCurve(break_point = break_point, out_temp = out_temp, inflow_temp = inflow_temp, power = power)
+
+# The mapping of one step as the models computed it before it was vectorized, new power outside of the curve is clipped
+def offset_by_loop(heatcurve, out_temp, power_offset):
+
+    reference_inflow_temp = estimate_reference_inflow_temp(heatcurve, out_temp)
+    new_power = estimate_baseline_power(heatcurve, out_temp) + power_offset
+
+    if new_power > max(heatcurve.power):
+        new_inflow_temp = max(heatcurve.inflow_temp)
+
+    elif new_power <= min(heatcurve.power):
+        new_inflow_temp = min(heatcurve.inflow_temp)
+
+    else:
+        for i in range(heatcurve.break_point - 1):
+            if new_power <= heatcurve.power[i] and new_power > heatcurve.power[i + 1]:
+                new_inflow_temp = heatcurve.inflow_temp[i] + (new_power - heatcurve.power[i]) * \
+                    (heatcurve.inflow_temp[i + 1] - heatcurve.inflow_temp[i]) / (heatcurve.power[i + 1] - heatcurve.power[i])
+                break
+
+    return new_inflow_temp - reference_inflow_temp, new_inflow_temp
+
+def assert_matches_loop(curve, out_temp, power_offset, reference = None):
+
+    offset, new_inflow_temp = estimate_inflow_temp_offset(curve, np.array(out_temp), np.array(power_offset))
+    expected = np.array([offset_by_loop(reference or curve, t, p) for t, p in zip(out_temp, power_offset)])
+
+    assert np.allclose(offset, expected[:, 0])
+    assert np.allclose(new_inflow_temp, expected[:, 1])
+
+def test_within_the_curve():
+
+    steps = list(itertools.product(np.linspace(-19.5, 19.5, 40), np.linspace(-40, 40, 9)))
+
+    assert_matches_loop(heatcurve(), [t for t, _ in steps], [p for _, p in steps])
+
+# Out temperatures and new powers beyond the curve take its end values
+def test_clipped_beyond_the_curve():
+
+    out_temp = [-35.0, -20.0, 20.0, 25.0, 0.0, 0.0, 5.0, 5.0]
+    power_offset = [0.0, 10.0, 0.0, 30.0, 500.0, -500.0, 250.0, -150.0]
+
+    assert_matches_loop(heatcurve(), out_temp, power_offset)
+
+# Points after break_point are not part of the curve: the mapping clips at the break point, like the loop on the curve up to it
+@pytest.mark.parametrize("break_point", [2, 3, 4])
+def test_points_after_break_point_are_ignored(break_point):
+
+    curve = heatcurve(break_point, OUT_TEMP + [30.0], INFLOW_TEMP + [15.0], POWER + [10.0])
+    reference = heatcurve(break_point, OUT_TEMP[:break_point], INFLOW_TEMP[:break_point], POWER[:break_point])
+    steps = list(itertools.product(np.linspace(-25, 35, 25), [-300.0, -40.0, 0.0, 40.0, 300.0]))
+
+    assert_matches_loop(curve, [t for t, _ in steps], [p for _, p in steps], reference)
+
+def test_single_step():
+
+    offset, new_inflow_temp = estimate_inflow_temp_offset(heatcurve(), np.array([0.0]), np.array([-50.0]))
+
+    assert offset.shape == new_inflow_temp.shape == (1,)
+    assert new_inflow_temp[0] == pytest.approx(40.0)
+    assert offset[0] == pytest.approx(-5.0)
@@ -0,0 +1,114 @@
+from datetime import datetime, timezone
+import time
+import numpy as np
+import pytest
+import models
+import deploy_utils
+from db import CassandraRepository, RESTHouseModelRepository
+from mpc.warm_start import WarmStart
+
+'''
+The worker processes of deploy_utils.runHouses on the local backend (db/_local.py). The run functions are defined
+here so that the spawned workers can import them.
+'''
+
+WORKERS = 2
+
+def sleeping(house, cassandra_repo, house_repo, seconds):
+
+    time.sleep(seconds)
+
+    return house.subcentral_id
+
+def failing(house, cassandra_repo, house_repo):
+
+    raise RuntimeError(f"{house.subcentral_id} failed")
+
+# One write and one read of the warm start of the house
+def writing(house, cassandra_repo, house_repo):
+
+    solution = WarmStart(datetime(2020, 10, 1, tzinfo = timezone.utc), 3600, "GUROBI", {"Power": np.arange(3.0)})
+    cassandra_repo.write_warm_start_for_house(house, "plan", solution)
+
+    return cassandra_repo.get_warm_start_by_house(house, "plan").primal["Power"].tolist()
+
+def house(subcentral_id):
+
+    return models.House(location = "Linkoping", customer_id = 1, subcentral_id = subcentral_id, longitude = 15.6, latitude = 58.4, grid_zone = 1)
+
+@pytest.fixture(scope = "module")
+def run(tmp_path_factory):
+
+    DB_URL = "local:" + str(tmp_path_factory.mktemp("workers") / "fleet.sqlite")
+    dbConnection = deploy_utils.connectDB(DB_URL)
+    cassandra_repo = deploy_utils.cassandraRepository(dbConnection, CassandraRepository)
+    house_repo = RESTHouseModelRepository(dbConnection.session)
+
+    def runHouses(function, tasks, timeout = deploy_utils.HOUSE_TIMEOUT):
+
+        return dict((house.subcentral_id, output) for house, output in
+                    deploy_utils.runHouses(function, tasks, DB_URL, cassandra_repo, house_repo, WORKERS, timeout))
+
+    # Workers take seconds to start, they are started before the timeouts are tested
+    runHouses(sleeping, [(house(i), (0,)) for i in range(WORKERS)])
+    runHouses.repositories = dbConnection, cassandra_repo, house_repo
+    runHouses.pool = lambda: deploy_utils._workers[(WORKERS, DB_URL)]
+
+    yield runHouses
+
+    deploy_utils.closeConnections()
+
+def test_outputs_of_all_houses(run):
+
+    assert run(sleeping, [(house(i), (0.01,)) for i in range(5)]) == {i: i for i in range(5)}
+
+def test_failing_house_has_no_output(run):
+
+    outputs = run(failing, [(house(1), ())])
+    outputs.update(run(sleeping, [(house(2), (0,))]))
+
+    assert outputs == {1: None, 2: 2}
+
+# The worker of a house over the timeout is killed and replaced, the other houses and the next runs go on
+def test_hung_house_is_killed(run):
+
+    processes = {worker.process.pid for worker in run.pool()}
+    start = time.monotonic()
+    outputs = run(sleeping, [(house(1), (60,)), (house(2), (0,)), (house(3), (0,))], timeout = 2)
+
+    assert time.monotonic() - start < 30
+    assert outputs == {1: None, 2: 2, 3: 3}
+    assert len(run.pool()) == WORKERS
+    assert {worker.process.pid for worker in run.pool()} != processes
+
+    assert run(sleeping, [(house(i), (0,)) for i in range(4)]) == {i: i for i in range(4)}
+
+# The statistics of the workers add up to the ones of the same houses run in the lambda process
+def test_worker_statistics_are_merged(run):
+
+    dbConnection, cassandra_repo, house_repo = run.repositories
+    tasks = [(house(i), ()) for i in range(4)]
+    metrics, writer = dbConnection.statements.metrics, dbConnection.writer
+
+    metrics.reset()
+    writer.reset()
+
+    for task_house, _ in tasks:
+        writing(task_house, cassandra_repo, house_repo)
+
+    serial = metrics.summary(), writer.summary()
+
+    assert serial[0] and serial[1]
+
+    metrics.reset()
+    writer.reset()
+
+    assert run(writing, tasks) == {i: [0.0, 1.0, 2.0] for i in range(4)}
+
+    queries, writes = metrics.summary(), writer.summary()
+
+    for label, stats in serial[0].items():
+        assert (queries[label]["count"], queries[label]["rows"]) == (stats["count"], stats["rows"])
+
+    for table, stats in serial[1].items():
+        assert (writes[table]["rows"], writes[table]["statements"]) == (stats["rows"], stats["statements"])
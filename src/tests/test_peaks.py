@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from mpc.peaks import peak_blocks
+
+def blocks(peak_hour):
+
+    starts, ends = peak_blocks(peak_hour)
+
+    return list(zip(starts.tolist(), ends.tolist()))
+
+# Blocks by walking the horizon step by step
+def blocks_by_loop(peak_hour):
+
+    result, start = [], None
+
+    for t, peak in enumerate(peak_hour):
+        if peak == 1 and start is None:
+            start = t
+        elif peak != 1 and start is not None:
+            result.append((start, t))
+            start = None
+
+    if start is not None:
+        result.append((start, len(peak_hour)))
+
+    return result
+
+def test_no_peak():
+
+    assert blocks([0, 0, 0, 0]) == []
+
+def test_all_peak():
+
+    assert blocks([1, 1, 1, 1]) == [(0, 4)]
+
+def test_peaks_at_the_edges_of_the_horizon():
+
+    assert blocks([1, 1, 0, 0, 1]) == [(0, 2), (4, 5)]
+
+def test_single_steps():
+
+    assert blocks([1, 0, 1, 0, 1]) == [(0, 1), (2, 3), (4, 5)]
+
+def test_empty_horizon():
+
+    assert blocks([]) == []
+
+# peak_hour columns of the forecast are floats
+def test_float_peak_hours():
+
+    assert blocks(np.array([0.0, 1.0, 1.0, 0.0])) == [(1, 3)]
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_horizons_match_the_loop(seed):
+
+    peak_hour = np.random.default_rng(seed).integers(0, 2, size = 48)
+
+    assert blocks(peak_hour) == blocks_by_loop(peak_hour)
@@ -0,0 +1,38 @@
+import gc
+import weakref
+from db import LocalDBConnection
+from db._prepared import PreparedStatementRegistry
+from db._bulk import BulkWriter
+from db._cache import WindowCache
+from db._heatcurve import HeatCurveStore
+
+'''
+The per-session objects are kept in WeakKeyDictionaries keyed by the session. A replaced connection (see
+_reuseConnection of deploy_utils.py) must free its session, so none of them may keep the session alive.
+'''
+
+def test_closed_session_is_collected():
+
+    connection = LocalDBConnection("local::memory:")
+    session = weakref.ref(connection.session)
+
+    BulkWriter.for_session(connection.session)
+    WindowCache.for_session(connection.session, "weather_forecast")
+    HeatCurveStore.for_session(connection.session)
+
+    connection.db_shutdown()
+    del connection
+    gc.collect()
+
+    assert session() is None
+
+def test_objects_are_shared_per_session():
+
+    connection = LocalDBConnection("local::memory:")
+
+    assert PreparedStatementRegistry.for_session(connection.session) is connection.statements
+    assert BulkWriter.for_session(connection.session) is connection.writer
+    assert HeatCurveStore.for_session(connection.session) is HeatCurveStore.for_session(connection.session)
+    assert connection.statements.session is connection.session
+
+    connection.db_shutdown()
@@ -0,0 +1,115 @@
+from datetime import timedelta
+import cvxpy as cp
+import numpy as np
+import pytest
+from mpc import warm_start
+from mpc.greybox_plan import PnPkModel_Plan
+from mpc.solver import SolverStrategy, installed_solvers
+from benchmarks._mpc_instances import mpcInstance
+
+'''
+The warm start sets Variable.value and solves with warm_start=True (see mpc/warm_start.py), it must not depend on
+the private solver cache of CVXPY.
+'''
+
+TIMESTEP = 3600
+
+def solved(solver, instance, warm = None):
+
+    model_args, solve_args = instance
+    model = PnPkModel_Plan(*model_args)
+    model.solver = SolverStrategy(solver, warm_start = True)
+    model.warm_start = warm
+    model.solve(*solve_args)
+
+    return model
+
+def start_of(instance):
+
+    return instance[1][0].index[0]
+
+@pytest.fixture(autouse = True)
+def compiled_problems():
+
+    PnPkModel_Plan.PROBLEMS.clear()
+    yield
+    PnPkModel_Plan.PROBLEMS.clear()
+
+@pytest.fixture
+def solution():
+
+    instance = mpcInstance(24, TIMESTEP, seed = 1)
+    model = solved("HIGHS", instance)
+
+    return model._problem, warm_start.capture(model._problem, "GUROBI", start_of(instance), TIMESTEP)
+
+def test_capture_keeps_the_variable_values(solution):
+
+    problem, captured = solution
+
+    for variable in problem.variables():
+        np.testing.assert_allclose(captured.primal[variable.name()], np.ravel(variable.value))
+
+def test_json_round_trip(solution):
+
+    _, captured = solution
+    loaded = warm_start.WarmStart.from_json(captured.to_json())
+
+    assert loaded.start == captured.start and loaded.timestep == captured.timestep
+    assert loaded.primal.keys() == captured.primal.keys()
+
+    for name, values in captured.primal.items():
+        np.testing.assert_allclose(loaded.primal[name], values)
+
+def test_seed_sets_the_shifted_values(solution):
+
+    problem, captured = solution
+    shifted = warm_start.WarmStart(captured.start, TIMESTEP, "GUROBI",
+                                   {name: np.arange(len(values), dtype = float) for name, values in captured.primal.items()})
+
+    assert warm_start.seed(problem, "GUROBI", shifted, captured.start + timedelta(seconds = 2 * TIMESTEP), TIMESTEP)
+
+    for variable in problem.variables():
+        expected = np.minimum(np.arange(variable.size) + 2, variable.size - 1)
+        np.testing.assert_allclose(variable.value, expected)
+
+# The solver cache belongs to CVXPY, seeding leaves it as the last solve left it
+def test_seed_does_not_touch_the_solver_cache(solution):
+
+    problem, captured = solution
+    cache = dict(problem._solver_cache)
+
+    warm_start.seed(problem, "GUROBI", captured, captured.start, TIMESTEP)
+
+    assert problem._solver_cache.keys() == cache.keys()
+    assert all(problem._solver_cache[key] is entry for key, entry in cache.items())
+
+def test_no_seed(solution):
+
+    problem, captured = solution
+
+    assert not warm_start.seed(problem, "HIGHS", captured, captured.start, TIMESTEP)
+    assert not warm_start.seed(problem, "GUROBI", None, captured.start, TIMESTEP)
+    assert not warm_start.seed(problem, "GUROBI", captured, captured.start + timedelta(seconds = TIMESTEP / 2), TIMESTEP)
+    assert not warm_start.seed(problem, "GUROBI", captured, captured.start - timedelta(seconds = TIMESTEP), TIMESTEP)
+    assert not warm_start.seed(problem, "GUROBI", captured, captured.start, TIMESTEP / 2)
+
+def test_solutions_with_duals_still_load(solution):
+
+    _, captured = solution
+    text = captured.to_json()[:-1] + ', "dual": [["Power@0", 0, 0, 1.0]]}'
+
+    assert warm_start.WarmStart.from_json(text).primal.keys() == captured.primal.keys()
+
+@pytest.mark.skipif("GUROBI" not in installed_solvers(), reason = "GUROBI is not installed")
+def test_seeded_solve_finds_the_same_optimum():
+
+    instance = mpcInstance(24, TIMESTEP, seed = 1)
+    first = solved("GUROBI", instance)
+    previous = warm_start.WarmStart.from_json(first.warm_start.to_json())
+
+    PnPkModel_Plan.PROBLEMS.clear()
+    model = solved("GUROBI", instance, previous)
+
+    assert model._problem.status == cp.OPTIMAL
+    assert model._problem.value == pytest.approx(first._problem.value, rel = 1e-4)
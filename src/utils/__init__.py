@@ -1,6 +1,7 @@
 import models
 from pvlib.location import Location as PVLocation
 from pvlib.forecast import ForecastModel
+import numpy as np
 import logging
 
 logger = logging.getLogger(__name__)
@@ -96,45 +97,37 @@ def estimate_reference_inflow_temp(heatcurve: models.HeatCurve, out_temp):
                 else:
                     continue
         
+# Value of the heat curve fp over xp (ascending) at x, below at or under the curve and above over it
+def _heatcurve_interp(x, xp, fp, below, above):
+
+    return np.where(x > xp[-1], above, np.where(x <= xp[0], below, np.interp(x, xp, fp)))
+
+# Inflow temperature offset and new inflow temperature of a power offset, per step of the out_temp and power_offset arrays
+# Vectorized estimate_baseline_power and estimate_reference_inflow_temp, new power outside of the heat curve is clipped to it
 def estimate_inflow_temp_offset(heatcurve: models.HeatCurve, out_temp, power_offset):
-    
-    baseline_power = estimate_baseline_power(heatcurve, out_temp)
-    reference_inflow_temp = estimate_reference_inflow_temp(heatcurve, out_temp)
+
+    curve_out_temp = np.asarray(heatcurve.out_temp[:heatcurve.break_point], dtype = float)
+    curve_inflow_temp = np.asarray(heatcurve.inflow_temp[:heatcurve.break_point], dtype = float)
+    curve_power = np.asarray(heatcurve.power[:heatcurve.break_point], dtype = float)
+    out_temp = np.asarray(out_temp, dtype = float)
+
+    baseline_power = _heatcurve_interp(out_temp, curve_out_temp, curve_power, curve_power.max(), 0) # Heating is assumed turned off above the curve
+    reference_inflow_temp = _heatcurve_interp(out_temp, curve_out_temp, curve_inflow_temp, curve_inflow_temp.max(), curve_inflow_temp.min())
     new_power = baseline_power + power_offset
 
-    if new_power > max(heatcurve.power):
-         
-        logger.warning("new power is higher than the upper limit on heat curve")   
-                   
-        inflow_temp_offset = max(heatcurve.inflow_temp) - reference_inflow_temp
-        
-        return inflow_temp_offset  
-         
-    elif new_power <= min(heatcurve.power):  
-         
-        logger.warning("new power is lower than the lower limit on heat curve")   
-         
-        inflow_temp_offset = min(heatcurve.inflow_temp) - reference_inflow_temp
-             
-        return inflow_temp_offset
-    
-    else:
-            for i in range(heatcurve.break_point - 1):
-        
-                if new_power <= heatcurve.power[i] and new_power > heatcurve.power[i+1]:
-                                     
-                    # Simplification: linear relation is used according to Stallmastaregatan case
-                    new_inflow_temp = heatcurve.inflow_temp[i] + (new_power - heatcurve.power[i]) * \
-                    (heatcurve.inflow_temp[i+1] - heatcurve.inflow_temp[i]) / (heatcurve.power[i+1] - heatcurve.power[i]) 
-                    
-                    inflow_temp_offset = new_inflow_temp - reference_inflow_temp
-                    
-                    return inflow_temp_offset, new_inflow_temp
-                                    
-                    break       
-                
-                else:
-                    continue   
+    # Simplification: linear relation is used according to Stallmastaregatan case
+    new_inflow_temp = _heatcurve_interp(new_power, curve_power[::-1], curve_inflow_temp[::-1], curve_inflow_temp.min(), curve_inflow_temp.max())
+
+    if np.any(out_temp > curve_out_temp[-1]):
+        logger.warning("Outside temperature is higher than the upper limit on heat curve")
+    if np.any(out_temp <= curve_out_temp[0]):
+        logger.warning("Outside temperature is lower than the lower limit on heat curve")
+    if np.any(new_power > curve_power[0]):
+        logger.warning("new power is higher than the upper limit on heat curve")
+    if np.any(new_power <= curve_power[-1]):
+        logger.warning("new power is lower than the lower limit on heat curve")
+
+    return new_inflow_temp - reference_inflow_temp, new_inflow_temp
 
 
 def estimate_initial_power(heatcurve: models.HeatCurve, inflow_temp):